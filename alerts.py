@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger("kyc.alerts")
+
+# ==== CONFIGURATION ====
+# ⚠️ Mets l’URL ngrok du moment ici (ou via la variable d'environnement)
+N8N_WEBHOOK_URL = os.environ.get("N8N_WEBHOOK_URL", "https://b6a10d83a527.ngrok-free.app/webhook/fraud_alert")
+ALERT_QUEUE_SIZE = int(os.environ.get("ALERT_QUEUE_SIZE", "1000"))
+ALERT_SPILL_PATH = os.environ.get("ALERT_SPILL_PATH", "alerts_spill.jsonl")
+ALERT_TIMEOUT_S = 5
+ALERT_MAX_RETRIES = 4
+ALERT_BACKOFF_S = 0.5
+ALERT_BACKOFF_MAX_S = 30
+
+
+class AlertDispatcher:
+    # File bornée + thread d'envoi : le handler Flask ne fait qu'un enqueue
+
+    def __init__(self, url=N8N_WEBHOOK_URL, maxsize=ALERT_QUEUE_SIZE, spill_path=ALERT_SPILL_PATH,
+                 timeout=ALERT_TIMEOUT_S, max_retries=ALERT_MAX_RETRIES,
+                 backoff=ALERT_BACKOFF_S, backoff_max=ALERT_BACKOFF_MAX_S):
+        self.url = url
+        self.spill_path = spill_path
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.session = None  # requests.Session keep-alive, créée par le worker
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.spilled = 0
+        self.last_latency_ms = None
+        self.total_latency_ms = 0.0
+
+    # ==== CÔTÉ REQUÊTE ====
+    def submit(self, payload):
+        item = (time.monotonic(), payload)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # File pleine : on écrit sur disque plutôt que de bloquer la requête
+            self._spill(payload, reason="queue_full")
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    # ==== CÔTÉ WORKER ====
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        # Laisse le worker vider la file (dans la limite du timeout) puis l'arrête
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(max(0, deadline - time.monotonic()))
+        # Ce qui reste en file n'est pas perdu
+        while True:
+            try:
+                _, payload = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._spill(payload, reason="shutdown")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                enqueued_at, payload = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self._deliver(enqueued_at, payload)
+            except Exception:
+                # Disque plein au débordement, payload non sérialisable... : le worker continue
+                logger.exception("❌ Alerte perdue (erreur inattendue du dispatcher)")
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, enqueued_at, payload):
+        # requests importé à la première alerte : hors du démarrage et du chemin de requête
+        import requests
+        if self.session is None:
+            self.session = requests.Session()
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.ok:
+                    latency_ms = (time.monotonic() - enqueued_at) * 1000
+                    with self._stats_lock:
+                        self.delivered += 1
+                        self.last_latency_ms = latency_ms
+                        self.total_latency_ms += latency_ms
+                    logger.info("📤 Alerte envoyée à n8n : %s (%.0f ms)", response.status_code, latency_ms)
+                    return True
+                error = f"HTTP {response.status_code}"
+                # 4xx (hors 429) : inutile de réessayer
+                retryable = response.status_code >= 500 or response.status_code == 429
+            except requests.RequestException as e:
+                error = str(e)
+                retryable = True
+
+            if not retryable or attempt == self.max_retries or self._stop.wait(delay):
+                break
+            with self._stats_lock:
+                self.retries += 1
+            delay = min(delay * 2, self.backoff_max)
+
+        with self._stats_lock:
+            self.failed += 1
+        logger.warning("⚠️ Erreur envoi n8n : %s", error)
+        self._spill(payload, reason="delivery_failed")
+        return False
+
+    # ==== DÉBORDEMENT DISQUE ====
+    def _spill(self, payload, reason):
+        record = {"spilled_at": time.time(), "reason": reason, "payload": payload}
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with self._stats_lock:
+            self.spilled += 1
+
+    def replay_spill(self):
+        # Ré-injecte les alertes écrites sur disque (au démarrage, ou via un appel admin).
+        # Le fichier est d'abord renommé (atomique) : un seul processus le rejoue, et les lignes
+        # ajoutées ensuite par les autres vont dans un nouveau fichier de débordement
+        replaying = f"{self.spill_path}.replaying.{os.getpid()}"
+        with self._spill_lock:
+            try:
+                os.replace(self.spill_path, replaying)
+            except FileNotFoundError:
+                return 0
+        with open(replaying, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        os.remove(replaying)
+        replayed = 0
+        for record in records:
+            if self.submit(record["payload"]):
+                replayed += 1
+        return replayed
+
+    # ==== OBSERVABILITÉ ====
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "enqueued": self.enqueued,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "retries": self.retries,
+                "spilled": self.spilled,
+                "last_delivery_latency_ms": self.last_latency_ms,
+                "avg_delivery_latency_ms": self.total_latency_ms / self.delivered if self.delivered else None,
+            }
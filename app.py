@@ -1,116 +1,329 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
-from database import create_tables, insert_session_data, insert_field_data
-from feature_extractor import extract_features
-import joblib
-import sqlite3
-import csv
+from database import (
+    create_tables, insert_session_with_fields, load_session_payload, release_connection, session_revision
+)
+from feature_extractor import (
+    FEATURE_ORDER, compute_feature_matrix, extract_features_matrix, pack_payload, stack_packed
+)
+from model_registry import ModelRegistry
+from batching import MICROBATCH_ENABLED, MicroBatcher
+from alerts import AlertDispatcher
+from prediction_log import PredictionLogSink
+from session_events import EVENT_STREAMING, MAX_DELTAS_PER_REQUEST, EventError, SessionEventStore
+from feature_cache import CachedSession, FeatureCache
+from exports import ExportError, iter_csv, open_export, parse_label, parse_time_ms
+from request_codec import PayloadError, install as install_codecs
 import numpy as np
 from datetime import datetime
 import os
-import requests
-import json
+import atexit
+import hashlib
+import hmac
+import logging
+from log_config import setup_logging, start_request, bind_session, stage, add_stage_hook
+import metrics
+import time
 
 # Initialisation
+setup_logging()
+logger = logging.getLogger("kyc.api")
+
 app = Flask(__name__)
 CORS(app)
+# Corps gzip / deflate / MessagePack acceptés, JSON via orjson s'il est installé
+install_codecs(app)
 
-if os.path.exists("tracking.db"):
-    os.remove("tracking.db")
+# Histogrammes par étape (parse, db, features, model, prediction_log, alert) sur /metrics
+add_stage_hook(metrics.observe_stage)
 
+# tracking.db conservé entre deux démarrages : seules les migrations manquantes sont appliquées
 create_tables()
-model = joblib.load("kyc_xgb_model.pkl")
-
-# Ordre des features attendu par le modèle
-FEATURE_ORDER = [
-    "duration_ms",
-    "mouseClickCount",
-    "scrollCount",
-    "scrollDensity",
-    "viewportChanges",
-    "tabCount",
-    "enterPressed",
-    "deviceType_encoded",
-    "fieldCount",
-    "totalTimeSpent",
-    "avgTimePerField",
-    "totalFocusCount",
-    "avgChangesPerField",
-    "avgPastePerField",
-    "avgDeletePerField",
-    "fieldOrderDeviation",
-    "stdTimePerField",
-    "maxPasteCount",
-    "pasteRatio",
-    "deleteRatio"
-]
+
+# Modèle versionné, rechargé à chaud depuis KYC_MODEL_DIR (surveillance ou /api/admin/model/reload)
+model_registry = ModelRegistry()
+model_registry.load_initial()
+model_registry.start()
+atexit.register(model_registry.stop)
+
+# Regroupement optionnel des requêtes concurrentes en un seul appel modèle (KYC_MICROBATCH=1)
+micro_batcher = None
+if MICROBATCH_ENABLED:
+    micro_batcher = MicroBatcher(model_registry.current())
+    micro_batcher.start()
+    atexit.register(micro_batcher.stop)
+
+
+def predict_scores(active, features_matrix):
+    # active : version lue une fois par la requête, utilisée pour le score, le label et le log
+    if micro_batcher is not None:
+        return micro_batcher.predict_scores(features_matrix, model=active)
+    return active.predict_scores(features_matrix)
+
+
+def preload():
+    # Hook de préchargement (ex. gunicorn --preload / post_fork) : charge et chauffe le modèle
+    model_registry.current().predict_scores(np.zeros((1, len(FEATURE_ORDER))))
+
+# Alertes n8n envoyées par un thread dédié (file bornée + débordement disque)
+alert_dispatcher = AlertDispatcher()
+alert_dispatcher.start()
+alert_dispatcher.replay_spill()
+atexit.register(alert_dispatcher.stop)
+
+# Log des prédictions tamponné (CSV tournant et/ou table SQLite indexée)
+prediction_sink = PredictionLogSink()
+prediction_sink.start()
+atexit.register(prediction_sink.stop)
+
+# Agrégats par session alimentés par les lots de tracking.js (/api/events), bornés et expirés
+event_store = SessionEventStore()
+
+# Features (et dernier score) par session : calculées au save / submit, réutilisées par /api/predict
+feature_cache = FeatureCache()
+
+MAX_BATCH_SIZE = 5000
+
+# Si défini, /api/admin/* exige l'en-tête X-Admin-Token
+ADMIN_TOKEN = os.environ.get("KYC_ADMIN_TOKEN")
+
+REQUIRED_FIELDS = ["session_id", "start_time", "end_time", "submit_delay_ms", "field_order", "fields"]
+
+
+# Contexte de log (session_id + timings par étape) réinitialisé à chaque requête
+@app.before_request
+def init_log_context():
+    start_request()
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is not None and request.endpoint != "metrics_endpoint":
+        endpoint = request.endpoint or "unknown"
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, endpoint)
+        metrics.REQUESTS.inc(endpoint, str(response.status_code))
+    return response
+
+
+# Connexion SQLite empruntée pendant la requête rendue au pool
+@app.teardown_appcontext
+def release_db_connection(exc):
+    release_connection()
+
+
+def record_error(error_type):
+    metrics.ERRORS.inc(request.endpoint or "unknown", error_type)
+
+
+# Construction de la ligne "sessions" à partir du payload
+def build_session_data(data):
+    return {
+        "session_id": data.get("session_id", "unknown"),
+        "start_time": data.get("start_time", 0),
+        "end_time": data.get("end_time", 0),
+        "submit_delay_ms": data.get("submit_delay_ms", 0),
+        "fast_fill": int(bool(data.get("fast_fill", False))),
+        "mouseMoved": int(bool(data.get("mouseMoved", False))),
+        "mouseClickCount": data.get("mouseClickCount", 0),
+        "scrollCount": data.get("scrollCount", 0),
+        "viewportChanges": data.get("viewportChanges", 0),
+        "tabCount": data.get("tabKeyCount", 0),
+        "enterPressed": int(bool(data.get("enterPressed", False))),
+        "deviceType": data.get("deviceType", "unknown"),
+        "fieldFocusOrder": ",".join(data.get("field_order", []))
+    }
+
+
+# Construction des lignes "fields" à partir du payload
+def build_field_rows(session_id, fields):
+    return [{
+        "session_id": session_id,
+        "field_name": field_name,
+        "value": infos.get("value", ""),
+        "timeSpentMs": infos.get("timeSpentMs", 0),
+        "hoverDurationMs": infos.get("hoverDurationMs", 0),
+        "copy": infos.get("copy", 0),
+        "paste": infos.get("paste", 0),
+        "delete_count": infos.get("delete", 0),
+        "changes": infos.get("changes", 0),
+        "focusCount": infos.get("focusCount", 0)
+    } for field_name, infos in fields.items()]
+
+
+# Validation commune à /api/save et /api/submit : renvoie un message d'erreur ou None
+def validate_payload(data):
+    if not data:
+        return "Aucune donnée reçue"
+    missing = [field for field in REQUIRED_FIELDS if field not in data]
+    if missing:
+        return f"Champs manquants : {', '.join(missing)}"
+    if not isinstance(data.get("fields"), dict):
+        return "Format invalide pour 'fields'"
+    return None
+
+
+def body_fingerprint():
+    # Empreinte du corps décodé : même payload renvoyé (retry, save puis predict) = mêmes features
+    return hashlib.blake2b(request.get_data(), digest_size=16).digest()
+
+
+def session_features(data, fingerprint=None, stored=False, revision=None):
+    # Vecteur (1, 20) dans l’ordre attendu, via le moteur colonnaire, puis mis en cache
+    # (stored=True : session enregistrée à cette révision, l'entrée précédente et son score sont invalidés)
+    with stage("features"):
+        features_array = extract_features_matrix([data])
+    session_id = data.get("session_id")
+    if not session_id:
+        return CachedSession("unknown", features_array)
+    return feature_cache.put(session_id, features_array, fingerprint, stored, revision)
+
+
+def cached_stored_session(session_id, fingerprint=None):
+    # Entrée du cache d'une session enregistrée, si la base n'a pas changé depuis (re-save par un
+    # autre worker : révision différente, entrée écartée) ; renvoie (entrée ou None, révision en base)
+    with stage("db"):
+        revision = session_revision(session_id)
+    return feature_cache.get_stored(session_id, revision, fingerprint), revision
+
+
+def cached_response(entry):
+    # Même session, même modèle : le score déjà calculé est renvoyé (ni log, ni alerte en double)
+    feature_cache.count_score_hit()
+    logger.info("♻️ Score en cache : %s | Label: %s | Modèle: %s", entry.score, entry.label, entry.model_version)
+    return jsonify({
+        "message": "Votre session a été transmise pour vérification.",
+        "score": entry.score,
+        "label": entry.label,
+        "model_version": entry.model_version
+    }), 200
+
+
+# Score + log CSV + alerte n8n pour une session déjà parsée (features : entrée du cache)
+def score_session(data, remote_addr=None, entry=None):
+    session_id = data.get("session_id", "unknown")
+    bind_session(session_id)
+
+    if entry is None:
+        entry = session_features(data)
+    features_array = entry.features
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📊 Features extraites : %s", dict(zip(FEATURE_ORDER, features_array[0].tolist())))
+
+    # Un seul passage dans l'ensemble d'arbres ; le label dérive du score et du seuil
+    active = model_registry.current()
+    with stage("model"):
+        probability = float(predict_scores(active, features_array)[0])
+    score = round(probability, 4)
+    label = active.label(probability)
+    metrics.PREDICTIONS.inc(label)
+    feature_cache.set_score(entry, score, label, active.version)
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Log dans le fichier CSV
+    with stage("prediction_log"):
+        log_predictions([[timestamp, session_id, label, score, active.version]])
+
+    # Envoi webhook si suspicion
+    if label == "Suspicious":
+        with stage("alert"):
+            if "fields" not in data:
+                # Re-score servi par le cache : valeurs du formulaire relues pour l'alerte
+                data = load_session_payload(session_id) or data
+            send_fraud_alert(data, session_id, score, label, timestamp, remote_addr, active.version)
+
+    logger.info("🔍 Score: %s | Label: %s | Modèle: %s", score, label, active.version)
+    return score, label, active.version
+
+
+def finalize_streamed_session(data):
+    # Submit en mode streaming : dernier lot éventuel appliqué, puis payload complet reconstruit
+    # depuis l'agrégat (None si la session est inconnue ou expirée)
+    session_id = data["session_id"]
+    events = data.get("events") or []
+    if not isinstance(events, list):
+        raise EventError("Format invalide pour 'events'")
+    for delta in events:
+        if isinstance(delta, dict) and delta.setdefault("s", session_id) != session_id:
+            raise EventError("Lot d'une autre session")
+        event_store.apply(delta)
+    return event_store.finalize(session_id, data.get("end_time"), data.get("submit_delay_ms"))
+
+
+def log_predictions(rows):
+    # Mise en tampon : l'écriture disque se fait par lot dans le thread du sink
+    prediction_sink.write_rows(rows)
+
+
+def send_fraud_alert(data, session_id, score, label, timestamp, remote_addr, model_version=None):
+    # ➜ VRAIES valeurs depuis le formulaire (data["fields"])
+    form_fields = data.get("fields", {})
+    payload = {
+        "session_id": session_id,
+        "client": f'{form_fields.get("nom", {}).get("value", "")} {form_fields.get("prenom", {}).get("value", "")}'.strip(),
+        "montant": form_fields.get("montant", {}).get("value", ""),
+        "revenu": form_fields.get("revenu", {}).get("value", ""),
+        "cin": form_fields.get("cin", {}).get("value", ""),
+        "adresse": form_fields.get("adresse", {}).get("value", ""),
+        "profession": form_fields.get("profession", {}).get("value", ""),
+        "duree": form_fields.get("duree", {}).get("value", ""),
+        # techniques/pratiques
+        "ip": remote_addr,
+        "score": float(score),
+        "label": label,
+        "model_version": model_version,
+        "timestamp": timestamp,
+        "lien_dossier": f"https://ton-system.local/sessions/{session_id}"
+    }
+
+    logger.debug("📤 Alerte mise en file pour n8n : %s", payload)
+
+    # Envoi en arrière-plan : la requête n'attend jamais le webhook
+    alert_dispatcher.submit(payload)
+
 
 # Enregistrement des données
 @app.route('/api/save', methods=['POST'])
 def save_data():
     try:
-        data = request.get_json(force=True)
-        print("📥 Données reçues :", data)
-
-        if not data:
-            print("⚠️ Aucune donnée reçue")
-            return jsonify({"error": "Aucune donnée reçue"}), 400
-
-        required_fields = ["session_id", "start_time", "end_time", "submit_delay_ms", "field_order", "fields"]
-        missing = [field for field in required_fields if field not in data]
-        if missing:
-            print("⚠️ Champs manquants :", missing)
-            return jsonify({"error": f"Champs manquants : {', '.join(missing)}"}), 400
-
-        duration_ms = data.get("end_time", 0) - data.get("start_time", 0)
-        data["duration_ms"] = duration_ms  # 👈 Ajout obligatoire
-
-        session_data = {
-            "session_id": data.get("session_id", "unknown"),
-            "start_time": data.get("start_time", 0),
-            "end_time": data.get("end_time", 0),
-            "submit_delay_ms": data.get("submit_delay_ms", 0),
-            "fast_fill": int(bool(data.get("fast_fill", False))),
-            "mouseMoved": int(bool(data.get("mouseMoved", False))),
-            "mouseClickCount": data.get("mouseClickCount", 0),
-            "scrollCount": data.get("scrollCount", 0),
-            "viewportChanges": data.get("viewportChanges", 0),
-            "tabKeyCount": data.get("tabKeyCount", 0),
-            "enterPressed": int(bool(data.get("enterPressed", False))),
-            "deviceType": data.get("deviceType", "unknown"),
-            "fieldFocusOrder": ",".join(data.get("field_order", []))
-        }
-
-        print("🔍 Clés dans data avant insert:", list(data.keys()))
-        print("🔍 duration_ms dans data:", data.get("duration_ms", "❌ absent"))
-
-        insert_session_data(session_data)
-        print("✅ Session enregistrée :", session_data["session_id"])
-
-        fields = data.get("fields", {})
-        if not isinstance(fields, dict):
-            print("⚠️ Format invalide pour 'fields'")
-            return jsonify({"error": "Format invalide pour 'fields'"}), 400
-
-        for field_name, infos in fields.items():
-            insert_field_data({
-                "session_id": session_data["session_id"],
-                "field_name": field_name,
-                "value": infos.get("value", ""),
-                "timeSpentMs": infos.get("timeSpentMs", 0),
-                "hoverDurationMs": infos.get("hoverDurationMs", 0),
-                "copy": infos.get("copy", 0),
-                "paste": infos.get("paste", 0),
-                "delete_count": infos.get("delete", 0),
-                "changes": infos.get("changes", 0),
-                "focusCount": infos.get("focusCount", 0)
-            })
-
-        print("✅ Champs enregistrés pour session :", session_data["session_id"])
+        with stage("parse"):
+            data = request.get_json(force=True)
+        logger.debug("📥 Données reçues : %s", data)
+
+        error = validate_payload(data)
+        if error:
+            logger.warning("⚠️ %s", error)
+            record_error("validation")
+            return jsonify({"error": error}), 400
+
+        bind_session(data["session_id"])
+        fingerprint = body_fingerprint()
+        if cached_stored_session(data["session_id"], fingerprint)[0] is not None:
+            # Même corps déjà enregistré (retry du navigateur) et base inchangée : rien à réécrire
+            logger.info("♻️ Session déjà enregistrée à l'identique")
+            return jsonify({"status": "success"}), 200
+        data["duration_ms"] = data.get("end_time", 0) - data.get("start_time", 0)  # 👈 Ajout obligatoire
+
+        session_data = build_session_data(data)
+        field_rows = build_field_rows(session_data["session_id"], data["fields"])
+        with stage("db"):
+            revision = insert_session_with_fields(session_data, field_rows)
+        # Features calculées une fois ici, reprises par /api/predict
+        session_features(data, fingerprint, stored=True, revision=revision)
+
+        logger.info("✅ Session et champs enregistrés (%d champs)", len(field_rows))
         return jsonify({"status": "success"}), 200
 
+    except PayloadError as e:
+        logger.warning("⚠️ Corps illisible : %s", e.description)
+        record_error("payload")
+        return jsonify({"error": e.description}), e.code
+
     except Exception as e:
-        print("❌ Erreur dans /api/save :", str(e))
+        logger.exception("❌ Erreur dans /api/save")
+        record_error(type(e).__name__)
         return jsonify({"error": f"Erreur interne du serveur : {str(e)}"}), 500
 
 
@@ -118,138 +331,400 @@ def save_data():
 @app.route('/api/predict', methods=['POST'])
 def predict():
     try:
-        data = request.get_json(force=True)
-        print("📤 Données reçues pour prédiction :", data)
+        with stage("parse"):
+            data = request.get_json(force=True)
+        logger.debug("📤 Données reçues pour prédiction : %s", data)
 
         if not data:
             return jsonify({"error": "Données manquantes"}), 400
 
-        session_id = data.get("session_id", "unknown")
-        features = extract_features(data)
-        print("📊 Features extraites :", features)
-
-        # Construction du vecteur dans l’ordre attendu
         try:
-            features_array = np.array([[features[f] for f in FEATURE_ORDER]])
+            session_id = data.get("session_id") if isinstance(data, dict) else None
+            if session_id and "fields" not in data:
+                # Re-score d'une session enregistrée : features du cache, sinon session relue en base
+                bind_session(session_id)
+                entry, revision = cached_stored_session(session_id)
+                if entry is None:
+                    with stage("db"):
+                        stored = load_session_payload(session_id) if revision is not None else None
+                    if stored is None:
+                        record_error("unknown_session")
+                        return jsonify({"error": "Session inconnue"}), 404
+                    data = stored
+                    entry = session_features(data, stored=True, revision=revision)
+            else:
+                # Payload complet : features reprises si ce même corps a déjà été reçu (save, retry)
+                fingerprint = body_fingerprint()
+                entry = feature_cache.get(session_id, fingerprint) if session_id else None
+                if entry is None:
+                    entry = session_features(data, fingerprint)
+            if entry.scored_with(model_registry.current().version):
+                return cached_response(entry)
+            score, label, version = score_session(data, request.remote_addr, entry)
         except KeyError as e:
-            print("❌ Feature manquante :", str(e))
+            logger.warning("❌ Feature manquante : %s", e)
+            record_error("missing_feature")
             return jsonify({"error": f"Feature manquante : {str(e)}"}), 400
 
-        print("📐 Shape du vecteur :", features_array.shape)
-        print("✅ Vecteur final :", features_array)
-
-        expected_features = model.n_features_in_
-        actual_features = features_array.shape[1]
-        if actual_features != expected_features:
-            raise ValueError(f"Feature shape mismatch, expected: {expected_features}, got: {actual_features}")
-
-        prediction = model.predict(features_array)[0]
-        probability = model.predict_proba(features_array)[0].tolist()
-        score = round(probability[1], 4)
-        label = "Suspicious" if prediction == 1 else "Clean"
-
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"🔍 Session: {session_id} | Score: {score} | Label: {label} | Timestamp: {timestamp}")
-
-        # Log dans le fichier CSV
-        with open("prediction_log.csv", "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if f.tell() == 0:
-                writer.writerow(["timestamp", "session_id", "label", "score"])
-            writer.writerow([timestamp, session_id, label, score])
-
-        # Envoi webhook si suspicion
-        if label == "Suspicious":
-            # ➜ VRAIES valeurs depuis le formulaire (data["fields"])
-            form_fields = data.get("fields", {})
-            payload = {
-                "session_id": session_id,
-                "client": f'{form_fields.get("nom", {}).get("value", "")} {form_fields.get("prenom", {}).get("value", "")}'.strip(),
-                "montant": form_fields.get("montant", {}).get("value", ""),
-                "revenu": form_fields.get("revenu", {}).get("value", ""),
-                "cin": form_fields.get("cin", {}).get("value", ""),
-                "adresse": form_fields.get("adresse", {}).get("value", ""),
-                "profession": form_fields.get("profession", {}).get("value", ""),
-                "duree": form_fields.get("duree", {}).get("value", ""),
-                # techniques/pratiques
-                "ip": request.remote_addr,
-                "score": float(score),
-                "label": label,
-                "timestamp": timestamp,
-                "lien_dossier": f"https://ton-system.local/sessions/{session_id}"
-            }
-
-            # Debug clair
-            print("\n📤 Payload envoyé à n8n :")
-            print(json.dumps(payload, indent=2, ensure_ascii=False))
+        return jsonify({
+            "message": "Votre session a été transmise pour vérification.",
+            "score": score,
+            "label": label,
+            "model_version": version
+        }), 200
+
+    except PayloadError as e:
+        logger.warning("⚠️ Corps illisible : %s", e.description)
+        record_error("payload")
+        return jsonify({"error": e.description}), e.code
+
+    except Exception as e:
+        logger.exception("❌ Erreur dans /api/predict")
+        record_error(type(e).__name__)
+        return jsonify({"error": "Erreur interne du serveur"}), 500
 
+
+# Enregistrement + prédiction en un seul aller-retour
+@app.route('/api/submit', methods=['POST'])
+def submit():
+    try:
+        with stage("parse"):
+            data = request.get_json(force=True)
+        logger.debug("📥 Données reçues (submit) : %s", data)
+
+        # Mode streaming : seul le session_id (et le dernier lot) est envoyé, le reste est déjà agrégé
+        streamed = None
+        if isinstance(data, dict) and data.get("session_id") and "fields" not in data:
+            bind_session(data["session_id"])
             try:
-                # ⚠️ Mets l’URL ngrok du moment ici
-                n8n_url = "https://b6a10d83a527.ngrok-free.app/webhook/fraud_alert"
-                response = requests.post(n8n_url, json=payload, timeout=5)
-                print("📤 Alerte envoyée à n8n :", response.status_code, response.text)
-            except Exception as e:
-                print("⚠️ Erreur envoi n8n :", e)
+                with stage("events"):
+                    streamed = finalize_streamed_session(data)
+            except EventError as e:
+                record_error("validation")
+                return jsonify({"error": str(e)}), 400
+            if streamed is None:
+                logger.warning("⚠️ Session inconnue ou expirée côté serveur")
+                record_error("unknown_session")
+                return jsonify({"error": "Session inconnue ou expirée"}), 404
+            data = streamed
+
+        error = validate_payload(data)
+        if error:
+            logger.warning("⚠️ %s", error)
+            record_error("validation")
+            return jsonify({"error": error}), 400
+
+        bind_session(data["session_id"])
+        # Corps complet identique à un submit déjà traité (retry) : session déjà en base
+        fingerprint = body_fingerprint() if streamed is None else None
+        entry = cached_stored_session(data["session_id"], fingerprint)[0] if fingerprint else None
+        if entry is not None and entry.scored_with(model_registry.current().version):
+            return cached_response(entry)
+
+        try:
+            if entry is None:
+                data["duration_ms"] = data.get("end_time", 0) - data.get("start_time", 0)
+                session_data = build_session_data(data)
+                field_rows = build_field_rows(session_data["session_id"], data["fields"])
+                with stage("db"):
+                    revision = insert_session_with_fields(session_data, field_rows)
+                entry = session_features(data, fingerprint, stored=True, revision=revision)
+            score, label, version = score_session(data, request.remote_addr, entry)
+        except KeyError as e:
+            logger.warning("❌ Feature manquante : %s", e)
+            record_error("missing_feature")
+            return jsonify({"error": f"Feature manquante : {str(e)}"}), 400
 
         return jsonify({
             "message": "Votre session a été transmise pour vérification.",
             "score": score,
-            "label": label
+            "label": label,
+            "model_version": version
+        }), 200
+
+    except PayloadError as e:
+        logger.warning("⚠️ Corps illisible : %s", e.description)
+        record_error("payload")
+        return jsonify({"error": e.description}), e.code
+
+    except Exception as e:
+        logger.exception("❌ Erreur dans /api/submit")
+        record_error(type(e).__name__)
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
+
+# Lots d'événements envoyés par tracking.js pendant la saisie (navigator.sendBeacon)
+@app.route('/api/events', methods=['POST'])
+def receive_events():
+    with stage("parse"):
+        data = request.get_json(force=True, silent=True)
+    deltas = data if isinstance(data, list) else [data]
+    if not data or len(deltas) > MAX_DELTAS_PER_REQUEST:
+        record_error("validation")
+        return jsonify({"error": f"1 à {MAX_DELTAS_PER_REQUEST} lots attendus"}), 400
+    try:
+        with stage("events"):
+            for delta in deltas:
+                event_store.apply(delta)
+    except EventError as e:
+        logger.warning("⚠️ Lot d'événements rejeté : %s", e)
+        record_error("validation")
+        return jsonify({"error": str(e)}), 400
+    return "", 204
+
+
+# Score anticipé en cours de saisie, depuis l'agrégat courant (ni base, ni log, ni alerte)
+@app.route('/api/events/<session_id>/score')
+def early_score(session_id):
+    bind_session(session_id)
+    data = event_store.payload(session_id)
+    if data is None:
+        return jsonify({"error": "Session inconnue ou expirée"}), 404
+    with stage("features"):
+        features_array = extract_features_matrix([data])
+    active = model_registry.current()
+    with stage("model"):
+        probability = float(predict_scores(active, features_array)[0])
+    return jsonify({
+        "session_id": session_id,
+        "partial": True,
+        "duration_ms": data["duration_ms"],
+        "fields_focused": len(data["field_order"]),
+        "score": round(probability, 4),
+        "label": active.label(probability),
+        "model_version": active.version
+    }), 200
+
+
+# Cache de features par session : hits / misses / invalidations / évictions
+@app.route('/api/cache/stats')
+def feature_cache_stats():
+    return jsonify(feature_cache.stats()), 200
+
+
+# Observabilité des agrégats de sessions en cours
+@app.route('/api/events/stats')
+def events_stats():
+    return jsonify(event_store.stats()), 200
+
+
+# Scoring par lot : une seule matrice N x 20, un seul appel au modèle
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        with stage("parse"):
+            data = request.get_json(force=True)
+        sessions = data.get("sessions") if isinstance(data, dict) else data
+        if not isinstance(sessions, list) or not sessions:
+            return jsonify({"error": "Liste 'sessions' manquante ou vide"}), 400
+        if len(sessions) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Lot trop grand : {len(sessions)} > {MAX_BATCH_SIZE}"}), 400
+
+        # Erreurs par session : la session est exclue de la matrice, le lot continue
+        results = [None] * len(sessions)
+        field_matrices = []
+        session_rows = []
+        row_index = []
+        for i, item in enumerate(sessions):
+            if not isinstance(item, dict) or not item:
+                results[i] = {"index": i, "error": "Session invalide"}
+                continue
+            try:
+                field_matrix, session_row = pack_payload(item)
+            except Exception as e:
+                results[i] = {"index": i, "session_id": item.get("session_id", "unknown"),
+                              "error": f"Extraction impossible : {str(e)}"}
+                continue
+            field_matrices.append(field_matrix)
+            session_rows.append(session_row)
+            row_index.append(i)
+
+        if row_index:
+            # Les 20 features de tout le lot en une passe colonnaire
+            with stage("features"):
+                features_matrix = compute_feature_matrix(*stack_packed(field_matrices, session_rows))
+            active = model_registry.current()
+            with stage("model"):
+                scores = active.predict_scores(features_matrix)
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            log_rows = []
+            for i, proba in zip(row_index, scores):
+                session_id = sessions[i].get("session_id", "unknown")
+                score = round(float(proba), 4)
+                label = active.label(proba)
+                metrics.PREDICTIONS.inc(label)
+                results[i] = {"index": i, "session_id": session_id, "score": score, "label": label}
+                log_rows.append([timestamp, session_id, label, score, active.version])
+            with stage("prediction_log"):
+                log_predictions(log_rows)
+
+        logger.info("📦 Lot scoré : %d/%d sessions", len(row_index), len(sessions))
+        return jsonify({
+            "model_version": active.version if row_index else None,
+            "count": len(sessions),
+            "scored": len(row_index),
+            "errors": len(sessions) - len(row_index),
+            "results": results
         }), 200
 
+    except PayloadError as e:
+        logger.warning("⚠️ Corps illisible : %s", e.description)
+        record_error("payload")
+        return jsonify({"error": e.description}), e.code
+
     except Exception as e:
-        print("❌ Erreur dans /api/predict :", str(e))
+        logger.exception("❌ Erreur dans /api/predict/batch")
+        record_error(type(e).__name__)
         return jsonify({"error": "Erreur interne du serveur"}), 500
 
 
+# Métriques Prometheus (compteurs, histogrammes par étape, files d'attente)
+def runtime_gauges():
+    # Niveaux instantanés : profondeur de file, taille, moyennes
+    alert_stats = alert_dispatcher.stats()
+    gauges = [
+        ("kyc_alert_queue_depth", "Alertes n8n en attente d'envoi", alert_stats["queue_depth"]),
+        ("kyc_alert_delivery_latency_ms_avg", "Latence moyenne de livraison des alertes", alert_stats["avg_delivery_latency_ms"]),
+        ("kyc_prediction_log_pending_rows", "Lignes du log de prédictions en tampon", prediction_sink.pending()),
+        ("kyc_event_sessions", "Sessions agrégées en mémoire (mode streaming)", len(event_store)),
+        ("kyc_feature_cache_entries", "Sessions dans le cache de features", len(feature_cache)),
+    ]
+    if micro_batcher is not None:
+        batch_stats = micro_batcher.stats()
+        gauges += [
+            ("kyc_microbatch_avg_rows", "Taille moyenne des lots", batch_stats["avg_batch_rows"]),
+            ("kyc_microbatch_avg_wait_ms", "Attente moyenne ajoutée par le regroupement", batch_stats["avg_wait_ms"]),
+        ]
+    return gauges
+
+
+def runtime_counters():
+    # Totaux monotones depuis le démarrage du processus
+    alert_stats = alert_dispatcher.stats()
+    counters = [
+        ("kyc_alerts_delivered_total", "Alertes n8n livrées", alert_stats["delivered"]),
+        ("kyc_alerts_failed_total", "Alertes n8n abandonnées après retries", alert_stats["failed"]),
+        ("kyc_alerts_spilled_total", "Alertes n8n écrites sur disque", alert_stats["spilled"]),
+        ("kyc_model_reloads_total", "Rechargements de modèle réussis", model_registry.reloads),
+        ("kyc_model_failed_reloads_total", "Modèles rejetés (validation ou chauffe)", model_registry.failed_reloads),
+        ("kyc_event_batches_total", "Lots d'événements appliqués", event_store.batches),
+        ("kyc_event_evicted_total", "Agrégats supprimés (TTL ou capacité)", event_store.evicted_ttl + event_store.evicted_capacity),
+        ("kyc_feature_cache_hits_total", "Features servies par le cache", feature_cache.hits),
+        ("kyc_feature_cache_score_hits_total", "Scores servis par le cache (retry)", feature_cache.score_hits),
+        ("kyc_feature_cache_misses_total", "Features recalculées (absentes du cache)", feature_cache.misses),
+        ("kyc_feature_cache_stale_total", "Entrées écartées : session ré-enregistrée par un autre worker", feature_cache.stale),
+        ("kyc_feature_cache_evicted_total", "Entrées supprimées (TTL ou capacité)", feature_cache.evicted_ttl + feature_cache.evicted_capacity),
+        ("kyc_prediction_log_dropped_rows_total", "Lignes du log de prédictions abandonnées (écriture impossible)", prediction_sink.rows_dropped),
+    ]
+    if micro_batcher is not None:
+        counters.append(("kyc_microbatch_batches_total", "Lots envoyés au modèle", micro_batcher.stats()["batches"]))
+    return counters
+
+
+metrics.register_gauges(runtime_gauges)
+metrics.register_counters(runtime_counters)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+# Distribution des tailles de lot et attente ajoutée par le micro-batching
+@app.route('/api/batching/stats')
+def batching_stats():
+    if micro_batcher is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **micro_batcher.stats()}), 200
+
+
+# Disponibilité : version du modèle actif et état du dernier rechargement
+@app.route('/ready')
+def ready():
+    status = model_registry.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+# Rechargement à chaud : {"file": "<nom dans KYC_MODEL_DIR>"} (défaut : le plus récent), "wait": true pour attendre
+@app.route('/api/admin/model/reload', methods=['POST'])
+def reload_model():
+    if ADMIN_TOKEN and not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Non autorisé"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        path = model_registry.model_file(data["file"]) if data.get("file") else None
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+
+    if data.get("wait"):
+        try:
+            model_registry.reload(path)
+        except Exception:
+            return jsonify({"status": "rejected", **model_registry.status()}), 422
+        return jsonify({"status": "active", **model_registry.status()}), 200
+
+    if not model_registry.reload_async(path):
+        return jsonify({"status": "busy", **model_registry.status()}), 409
+    return jsonify({"status": "loading", **model_registry.status()}), 202
+
+
+# Observabilité de la file d'alertes
+@app.route('/api/alerts/stats')
+def alerts_stats():
+    return jsonify(alert_dispatcher.stats()), 200
+
+
+# Export CSV en flux (curseur serveur + générateur), filtrable et paginé par clé
+# ?from=&to= (ms epoch ou date ISO sur start_time) &label=0|1 &after=<clé> &limit=N &gzip=1
+def stream_export(table):
+    try:
+        limit = request.args.get("limit", type=int)
+        if limit is not None and limit <= 0:
+            raise ExportError("limit doit être > 0")
+        compress = request.args.get("gzip", "0") in ("1", "true")
+        conn, columns, batches, cursor = open_export(
+            table,
+            start=parse_time_ms(request.args.get("from")),
+            end=parse_time_ms(request.args.get("to")),
+            label=parse_label(request.args.get("label")),
+            after=request.args.get("after"),
+            limit=limit
+        )
+    except ExportError as e:
+        record_error("validation")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("❌ Erreur export %s", table)
+        record_error(type(e).__name__)
+        return jsonify({"error": f"Erreur export {table}"}), 500
+
+    filename = f"export_{table}.csv" + (".gz" if compress else "")
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if cursor is not None:
+        headers["X-Next-Cursor"] = str(cursor)
+    return Response(
+        stream_with_context(iter_csv(conn, columns, batches, compress)),
+        mimetype="application/gzip" if compress else "text/csv",
+        headers=headers
+    )
+
+
 # Export CSV - Sessions
 @app.route('/export/sessions')
 def export_sessions_csv():
-    try:
-        conn = sqlite3.connect("tracking.db")
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM sessions")
-        rows = cur.fetchall()
-        headers = [d[0] for d in cur.description]
-        conn.close()
-
-        with open("export_sessions.csv", "w", newline='', encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
-            writer.writerows(rows)
-
-        return jsonify({"status": "sessions exported"}), 200
-    except Exception as e:
-        print("❌ Erreur export sessions :", str(e))
-        return jsonify({"error": "Erreur export sessions"}), 500
+    return stream_export("sessions")
 
 
 # Export CSV - Fields
 @app.route('/export/fields')
 def export_fields_csv():
-    try:
-        conn = sqlite3.connect("tracking.db")
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM fields")
-        rows = cur.fetchall()
-        headers = [d[0] for d in cur.description]
-        conn.close()
-
-        with open("export_fields.csv", "w", newline='', encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
-            writer.writerows(rows)
-
-        return jsonify({"status": "fields exported"}), 200
-    except Exception as e:
-        print("❌ Erreur export fields :", str(e))
-        return jsonify({"error": "Erreur export fields"}), 500
+    return stream_export("fields")
 
 
 # Page principale
 @app.route("/")
 def index():
-    return render_template("formulaire.html")
+    return render_template("formulaire.html", event_streaming=EVENT_STREAMING)
 
 
 if __name__ == '__main__':
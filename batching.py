@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger("kyc.batching")
+
+# ==== CONFIGURATION ====
+MICROBATCH_ENABLED = os.environ.get("KYC_MICROBATCH", "0") == "1"
+MICROBATCH_MAX_ROWS = int(os.environ.get("KYC_MICROBATCH_MAX_ROWS", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("KYC_MICROBATCH_MAX_WAIT_MS", "2"))
+
+# Bornes (ms) de l'histogramme du temps d'attente ajouté par le regroupement
+WAIT_BUCKETS_MS = [0.1, 0.5, 1, 2, 5, 10, 25, 50]
+
+
+class MicroBatcher:
+    # Regroupe les vecteurs de requêtes concurrentes en une seule matrice pour le modèle
+
+    def __init__(self, model, max_rows=MICROBATCH_MAX_ROWS, max_wait_ms=MICROBATCH_MAX_WAIT_MS):
+        self.model = model
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.SimpleQueue()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.batches = 0
+        self.rows = 0
+        self.batch_sizes = {}
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    # ==== CÔTÉ REQUÊTE ====
+    def submit(self, features_matrix, model=None):
+        # Renvoie un Future résolu avec les scores (n,) des lignes soumises ; model : version
+        # figée par la requête (registre rechargeable), self.model par défaut
+        future = Future()
+        self.queue.put((time.perf_counter(), np.asarray(features_matrix, dtype=np.float32), future, model or self.model))
+        return future
+
+    def predict_scores(self, features_matrix, timeout=None, model=None):
+        return self.submit(features_matrix, model).result(timeout)
+
+    # ==== WORKER ====
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _collect(self, first):
+        # Accumule jusqu'à max_rows lignes ou max_wait après la première requête ;
+        # les requêtes déjà en file sont toujours reprises, même délai écoulé
+        items = [first]
+        n_rows = len(first[1])
+        deadline = first[0] + self.max_wait
+        while n_rows < self.max_rows:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            n_rows += len(item[1])
+        return items
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            items = self._collect(first)
+            started = time.perf_counter()
+            # Un appel par version de modèle : plusieurs versions ne coexistent qu'au moment d'un échange
+            groups = {}
+            for item in items:
+                groups.setdefault(id(item[3]), []).append(item)
+            for group in groups.values():
+                self._predict(group)
+            self._record(items, sum(len(item[1]) for item in items), started)
+
+    def _predict(self, items):
+        try:
+            matrix = items[0][1] if len(items) == 1 else np.vstack([item[1] for item in items])
+            scores = items[0][3].predict_scores(matrix)
+        except Exception as e:
+            for item in items:
+                item[2].set_exception(e)
+            return
+        offset = 0
+        for _, rows, future, _ in items:
+            future.set_result(scores[offset:offset + len(rows)])
+            offset += len(rows)
+
+    # ==== MÉTRIQUES ====
+    def _record(self, items, n_rows, started):
+        with self._stats_lock:
+            self.batches += 1
+            self.rows += n_rows
+            self.batch_sizes[n_rows] = self.batch_sizes.get(n_rows, 0) + 1
+            for enqueued_at, _, _, _ in items:
+                wait_ms = (started - enqueued_at) * 1000
+                self.wait_total_ms += wait_ms
+                self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+                self.wait_buckets[np.searchsorted(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            requests = sum(self.wait_buckets)
+            return {
+                "max_rows": self.max_rows,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "rows": self.rows,
+                "avg_batch_rows": self.rows / self.batches if self.batches else None,
+                "batch_size_distribution": dict(sorted(self.batch_sizes.items())),
+                "wait_ms_buckets": dict(zip([f"le_{b}" for b in WAIT_BUCKETS_MS] + ["le_inf"], self.wait_buckets)),
+                "avg_wait_ms": self.wait_total_ms / requests if requests else None,
+                "max_wait_ms_observed": self.wait_max_ms,
+            }
@@ -0,0 +1,135 @@
+"""Coût de décodage et taille sur le fil des payloads KYC (8 champs + 3 uploads) :
+JSON stdlib vs orjson, corps gzip / deflate, MessagePack ; puis sérialisation de la réponse
+(jsonify standard vs orjson) et aller-retour complet dans /api/predict (client de test Flask).
+
+    python benchmarks/bench_codec.py --sessions 500 --repeat 20
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_cases import SAMPLES_PER_CASE, build_case, case_to_payload
+from request_codec import decompress, msgpack, orjson
+
+UPLOAD_FIELDS = ["id_upload", "rev_upload", "selfie_upload"]
+
+
+def build_payloads(n, seed):
+    # Mêmes proportions que le test de charge ; champs d'upload vides comme dans le vrai formulaire
+    random.seed(seed)
+    cases = list(SAMPLES_PER_CASE)
+    weights = [SAMPLES_PER_CASE[c] for c in cases]
+    payloads = [case_to_payload(*build_case(case)) for case in random.choices(cases, weights=weights, k=n)]
+    for payload in payloads:
+        for name in UPLOAD_FIELDS:
+            payload["fields"][name] = {"value": "", "timeSpentMs": 0, "hoverDurationMs": 0, "copy": 0, "paste": 0,
+                                       "delete": 0, "changes": 0, "focusCount": 0}
+    return payloads
+
+
+def per_payload_us(fn, bodies, repeat):
+    for body in bodies[:10]:
+        fn(body)  # échauffement
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            fn(body)
+    return (time.perf_counter() - t0) / (repeat * len(bodies)) * 1e6
+
+
+def deflate(data):
+    return zlib.compress(data, 6)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.sessions, args.seed)
+    json_bodies = [json.dumps(p).encode() for p in payloads]
+
+    # (nom, corps encodés, décodeur)
+    formats = [
+        ("json (stdlib)", json_bodies, json.loads),
+        ("json compact", [json.dumps(p, separators=(",", ":")).encode() for p in payloads], json.loads),
+        ("gzip + json", [gzip.compress(b, 6) for b in json_bodies], lambda b: json.loads(decompress(b, "gzip"))),
+        ("deflate + json", [deflate(b) for b in json_bodies], lambda b: json.loads(decompress(b, "deflate"))),
+    ]
+    if orjson is not None:
+        formats[1:1] = [("orjson", json_bodies, orjson.loads)]
+        formats += [
+            ("gzip + orjson", formats[-2][1], lambda b: orjson.loads(decompress(b, "gzip"))),
+            ("deflate + orjson", formats[-1][1], lambda b: orjson.loads(decompress(b, "deflate"))),
+        ]
+    if msgpack is not None:
+        packed = [msgpack.packb(p) for p in payloads]
+        formats += [
+            ("msgpack", packed, lambda b: msgpack.unpackb(b, raw=False)),
+            ("gzip + msgpack", [gzip.compress(b, 6) for b in packed],
+             lambda b: msgpack.unpackb(decompress(b, "gzip"), raw=False)),
+        ]
+    else:
+        print("ℹ️ msgpack non installé : formats MessagePack ignorés")
+    if orjson is None:
+        print("ℹ️ orjson non installé : formats orjson ignorés")
+
+    baseline_bytes = sum(map(len, json_bodies)) / len(json_bodies)
+    print(f"\n📦 Décodage ({args.sessions} payloads x {args.repeat}) :")
+    print(f"{'format':<18} {'octets moy.':>11} {'vs json':>8} {'décodage µs':>12}")
+    for name, bodies, decode in formats:
+        assert decode(bodies[0]) == payloads[0]
+        size = sum(map(len, bodies)) / len(bodies)
+        us = per_payload_us(decode, bodies, args.repeat)
+        print(f"{name:<18} {size:>11.0f} {size / baseline_bytes:>7.0%} {us:>12.1f}")
+
+    # ==== RÉPONSE + ALLER-RETOUR FLASK ====
+    # app.py crée / migre tracking.db dans le répertoire courant : import depuis un répertoire jetable
+    os.environ.setdefault("KYC_MODEL_PATH", os.path.join(ROOT, "kyc_xgb_model.pkl"))
+    os.environ.setdefault("KYC_LOG_LEVEL", "WARNING")
+    os.environ.setdefault("KYC_MODEL_WATCH_INTERVAL_S", "0")
+    os.environ.setdefault("N8N_WEBHOOK_URL", "http://127.0.0.1:9/webhook")
+    os.chdir(tempfile.mkdtemp(prefix="bench_codec_"))
+    import app as kyc_app
+    from flask.json.provider import DefaultJSONProvider
+    from request_codec import OrjsonProvider
+
+    response = {"message": "Votre session a été transmise pour vérification.", "score": 0.1234,
+                "label": "Clean", "model_version": "kyc_xgb_model-0123abcd"}
+    providers = [("jsonify stdlib", DefaultJSONProvider(kyc_app.app))]
+    if orjson is not None:
+        providers.append(("jsonify orjson", OrjsonProvider(kyc_app.app)))
+    print("\n📤 Sérialisation de la réponse :")
+    with kyc_app.app.app_context():
+        for name, provider in providers:
+            us = per_payload_us(lambda _: provider.response(response), [None] * 100, args.repeat * 10)
+            print(f"{name:<18} {us:>8.1f} µs")
+
+    client = kyc_app.app.test_client()
+    variants = [("json", json_bodies, {})]
+    variants.append(("gzip + json", [gzip.compress(b, 6) for b in json_bodies], {"Content-Encoding": "gzip"}))
+    if msgpack is not None:
+        variants.append(("msgpack", [msgpack.packb(p) for p in payloads], {}))
+    print("\n🔁 Aller-retour /api/predict (client de test, modèle inclus) :")
+    for name, bodies, headers in variants:
+        content_type = "application/msgpack" if name == "msgpack" else "application/json"
+
+        def post(body):
+            r = client.post("/api/predict", data=body, content_type=content_type, headers=headers)
+            assert r.status_code == 200, r.get_data(as_text=True)
+
+        for provider_name, provider in providers:
+            kyc_app.app.json = provider
+            us = per_payload_us(post, bodies, 1)
+            print(f"{name:<14} + {provider_name:<16} {us:>8.1f} µs")
@@ -0,0 +1,100 @@
+"""Débit d'écriture SQLite : une connexion par ligne vs connexion poolée + executemany.
+
+    python benchmarks/bench_database.py --sessions 500
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+FIELD_NAMES = ["nom", "prenom", "cin", "adresse", "profession", "revenu", "montant", "duree"]
+
+
+def make_session(i):
+    session = {
+        "session_id": f"sess_bench_{i}",
+        "start_time": 0,
+        "end_time": 60000,
+        "submit_delay_ms": 500,
+        "fast_fill": 0,
+        "mouseMoved": 1,
+        "mouseClickCount": 5,
+        "scrollCount": 10,
+        "viewportChanges": 0,
+        "tabCount": 0,
+        "enterPressed": 0,
+        "deviceType": "desktop",
+        "fieldFocusOrder": ",".join(FIELD_NAMES),
+    }
+    fields = [{
+        "session_id": session["session_id"],
+        "field_name": name,
+        "value": "x",
+        "timeSpentMs": 2000,
+        "hoverDurationMs": 0,
+        "copy": 0,
+        "paste": 0,
+        "delete_count": 1,
+        "changes": 2,
+        "focusCount": 1,
+    } for name in FIELD_NAMES]
+    return session, fields
+
+
+# Ancien chemin : sqlite3.connect + INSERT + commit + close pour chaque ligne
+def legacy_insert(db_file, sql, row):
+    conn = sqlite3.connect(db_file)
+    conn.execute(sql, row)
+    conn.commit()
+    conn.close()
+
+
+def run_legacy(n):
+    for i in range(n):
+        session, fields = make_session(i)
+        legacy_insert(database.DB_FILE, database.INSERT_SESSION_SQL, database._session_row(session))
+        for f in fields:
+            legacy_insert(database.DB_FILE, database.INSERT_FIELD_SQL, database._field_row(f))
+
+
+def run_pooled(n):
+    for i in range(n):
+        session, fields = make_session(i)
+        conn = database.get_connection()
+        with conn:
+            conn.execute(database.INSERT_SESSION_SQL, database._session_row(session))
+            conn.executemany(database.INSERT_FIELD_SQL, [database._field_row(f) for f in fields])
+
+
+def bench(label, runner, n, tmpdir, wal):
+    database.close_all_connections()
+    database.DB_FILE = os.path.join(tmpdir, f"{label}.db")
+    if not wal:
+        # Ancien comportement : journal par défaut (DELETE, synchronous FULL)
+        database.PRAGMAS = []
+    database.create_tables()
+    t0 = time.perf_counter()
+    runner(n)
+    elapsed = time.perf_counter() - t0
+    database.close_all_connections()
+    print(f"{label:<10} {n} sessions en {elapsed:.3f}s -> {n / elapsed:,.0f} sessions/s")
+    return n / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    args = parser.parse_args()
+
+    pragmas = list(database.PRAGMAS)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        before = bench("avant", run_legacy, args.sessions, tmpdir, wal=False)
+        database.PRAGMAS = pragmas
+        after = bench("après", run_pooled, args.sessions, tmpdir, wal=True)
+    print(f"Gain : x{after / before:.1f}")
@@ -0,0 +1,51 @@
+"""Latence d'inférence : XGBClassifier.predict + predict_proba vs Booster.inplace_predict.
+
+    python benchmarks/bench_inference.py --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+import numpy as np
+
+from model_runtime import MODEL_PATH, BoosterModel
+
+
+def per_call_us(fn, repeat):
+    fn()  # échauffement
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    clf = joblib.load(args.model)
+    model = BoosterModel(clf.get_booster())
+    rng = np.random.default_rng(42)
+
+    for rows in (1, 1000):
+        X = rng.random((rows, model.n_features_in_)) * 1000
+
+        def sklearn_path():
+            clf.predict(X)
+            clf.predict_proba(X)
+
+        def booster_path():
+            model.labels(model.predict_scores(X))
+
+        before = per_call_us(sklearn_path, args.repeat)
+        after = per_call_us(booster_path, args.repeat)
+        assert np.allclose(clf.predict_proba(X)[:, 1], model.predict_scores(X))
+        print(f"{rows:>5} ligne(s) : predict+predict_proba {before:10.1f} µs | inplace_predict {after:10.1f} µs | x{before / after:.1f}")
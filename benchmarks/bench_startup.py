@@ -0,0 +1,62 @@
+"""Démarrage à froid : temps d'import de app.py et délai jusqu'à la première prédiction.
+
+Chaque mesure tourne dans un processus neuf (import réellement à froid), depuis un
+répertoire temporaire pour ne pas toucher tracking.db.
+
+    python benchmarks/bench_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter() - t0
+heavy = sorted(m for m in ("xgboost", "sklearn", "pandas", "scipy", "requests", "joblib") if m in sys.modules)
+from generate_cases import build_case, case_to_payload
+payload = case_to_payload(*build_case("normal"))
+t1 = time.perf_counter()
+response = app.app.test_client().post("/api/predict", json=payload)
+t_first = time.perf_counter() - t1
+assert response.status_code == 200, response.data
+print(json.dumps({"import_s": t_import, "first_predict_s": t_first,
+                  "time_to_first_prediction_s": t_import + t_first, "heavy_modules_at_import": heavy}))
+"""
+
+
+def run_probe(lazy):
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "KYC_LAZY_MODEL": "1" if lazy else "0",
+        "KYC_MODEL_PATH": os.path.join(ROOT, "kyc_xgb_model.pkl"),
+        "KYC_LOG_LEVEL": "WARNING",
+        "N8N_WEBHOOK_URL": "http://127.0.0.1:9/webhook",
+        "PYTHONWARNINGS": "ignore",
+    })
+    with tempfile.TemporaryDirectory() as workdir:
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=workdir, env=env,
+                             capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for lazy in (False, True):
+        runs = [run_probe(lazy) for _ in range(args.runs)]
+        best = min(runs, key=lambda r: r["time_to_first_prediction_s"])
+        mode = "paresseux (KYC_LAZY_MODEL=1)" if lazy else "chargement à l'import"
+        print(f"{mode:<30} import {best['import_s'] * 1000:7.0f} ms | "
+              f"1re prédiction {best['first_predict_s'] * 1000:7.0f} ms | "
+              f"total {best['time_to_first_prediction_s'] * 1000:7.0f} ms | "
+              f"modules lourds à l'import : {', '.join(best['heavy_modules_at_import']) or 'aucun'}")
@@ -0,0 +1,176 @@
+"""Test de charge local de app.py avec des sessions simulées (profils de generate_cases.py).
+
+Le serveur Flask tourne en local dans un répertoire temporaire (tracking.db jetable),
+le webhook n8n est remplacé par un serveur HTTP bouchon. Les résultats (débit,
+p50/p95/p99 par endpoint) sont écrits en JSON pour comparer les runs.
+
+    python benchmarks/load_test.py --sessions 500 --concurrency 16 --rate 200 \\
+        --endpoints save,predict --out bench_results/run.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import requests
+
+from generate_cases import SAMPLES_PER_CASE, build_case, case_to_payload
+
+
+# ==== WEBHOOK BOUCHON ====
+class StubWebhook(BaseHTTPRequestHandler):
+    received = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubWebhook.received += 1
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_webhook():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ==== SERVEUR FLASK LOCAL ====
+def start_app(workdir):
+    # app.py crée / migre tracking.db dans le répertoire courant : on l'importe depuis un répertoire jetable
+    from werkzeug.serving import make_server
+
+    os.environ.setdefault("KYC_MODEL_PATH", os.path.join(ROOT, "kyc_xgb_model.pkl"))
+    os.environ.setdefault("KYC_LOG_LEVEL", "WARNING")
+    os.chdir(workdir)
+    import app
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app, server
+
+
+# ==== CHARGE ====
+def build_payloads(n, seed):
+    # Sessions tirées selon les proportions de SAMPLES_PER_CASE
+    random.seed(seed)
+    cases = list(SAMPLES_PER_CASE)
+    weights = [SAMPLES_PER_CASE[c] for c in cases]
+    return [case_to_payload(*build_case(case)) for case in random.choices(cases, weights=weights, k=n)]
+
+
+def percentiles(latencies_ms):
+    if not latencies_ms:
+        return {}
+    values = np.asarray(latencies_ms)
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def run_load(base_url, payloads, endpoints, concurrency, rate):
+    latencies = {ep: [] for ep in endpoints}
+    errors = {ep: 0 for ep in endpoints}
+    lock = threading.Lock()
+    local = threading.local()
+    t0 = time.perf_counter()
+
+    def one_session(i):
+        # Cadence fixe : la session i part à t0 + i / rate (rate <= 0 : au plus vite)
+        if rate > 0:
+            delay = t0 + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if not hasattr(local, "http"):
+            local.http = requests.Session()
+        for ep in endpoints:
+            start = time.perf_counter()
+            try:
+                ok = local.http.post(f"{base_url}/api/{ep}", json=payloads[i], timeout=30).ok
+            except requests.RequestException:
+                ok = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies[ep].append(elapsed_ms)
+                if not ok:
+                    errors[ep] += 1
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one_session, range(len(payloads))))
+    wall_s = time.perf_counter() - t0
+
+    return {
+        "wall_s": wall_s,
+        "sessions_per_s": len(payloads) / wall_s,
+        "endpoints": {
+            ep: {**percentiles(latencies[ep]), "errors": errors[ep], "requests_per_s": len(latencies[ep]) / wall_s}
+            for ep in endpoints
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0, help="sessions/s visées (0 = au plus vite)")
+    parser.add_argument("--endpoints", default="save,predict", help="ex. save,predict ou submit")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="fichier JSON de résultats")
+    args = parser.parse_args()
+
+    endpoints = [ep.strip() for ep in args.endpoints.split(",") if ep.strip()]
+    out_path = os.path.abspath(args.out) if args.out else None
+
+    webhook = start_stub_webhook()
+    os.environ["N8N_WEBHOOK_URL"] = f"http://127.0.0.1:{webhook.server_port}/webhook/fraud_alert"
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module, server = start_app(workdir)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        payloads = build_payloads(args.sessions + args.warmup, args.seed)
+        run_load(base_url, payloads[:args.warmup], endpoints, args.concurrency, 0)
+        result = run_load(base_url, payloads[args.warmup:], endpoints, args.concurrency, args.rate)
+        server.shutdown()
+        app_module.alert_dispatcher.stop()
+        app_module.prediction_sink.stop()
+
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "endpoints": endpoints,
+            "seed": args.seed,
+            "microbatch": os.environ.get("KYC_MICROBATCH", "0"),
+        },
+        "webhook_alerts_received_incl_warmup": StubWebhook.received,
+        **result,
+    }
+    print(json.dumps(report, indent=2))
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print("💾 Résultats :", out_path)
@@ -1,30 +1,28 @@
-import pandas as pd
+import argparse
+import logging
 import sqlite3
-from sklearn.preprocessing import LabelEncoder
 
-# 1. Charger les features depuis le CSV
-df_features = pd.read_csv("kyc_dataset_tn.csv")
-
-# 2. Connexion à la base de données SQLite
-conn = sqlite3.connect("tracking.db")
-
-# 3. Lire les labels depuis la table sessions
-df_labels = pd.read_sql_query("SELECT session_id, label AS label_target FROM sessions", conn)
-conn.close()
-
-# 4. Fusionner sur session_id
-df = df_features.merge(df_labels, on="session_id", how="left")
-
-# 5. Supprimer les lignes sans label
-df = df.dropna(subset=["label_target"])
-
-# 6. Encoder deviceType
-le_device = LabelEncoder()
-df["deviceType_encoded"] = le_device.fit_transform(df["deviceType"])
-
-# 7. Supprimer les colonnes inutiles (optionnel)
-df = df.drop(columns=["fieldFocusOrder", "created_at"], errors="ignore")
-
-# 8. Exporter
-df.to_csv("kyc_dataset_ready.csv", index=False)
-print("✅ Fichier exporté : kyc_dataset_ready.csv")
+from feature_store import FEATURE_STORE_DIR, build_feature_store, read_state
+from generate_cases import DB_PATH, EXPORT_CHUNK_SESSIONS
+from migrations import migrate
+
+# Feature store Parquet (session_date=YYYY-MM-DD/) alimenté depuis tracking.db :
+# seules les sessions ajoutées ou ré-enregistrées depuis le dernier passage sont calculées.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Met à jour le feature store d'entraînement")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--store", default=FEATURE_STORE_DIR)
+    parser.add_argument("--chunk-sessions", type=int, default=EXPORT_CHUNK_SESSIONS)
+    parser.add_argument("--full", action="store_true", help="ignore le high-water mark et reconstruit tout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = sqlite3.connect(args.db)
+    # Colonne revision (migration 4) : détection des sessions ré-enregistrées
+    migrate(conn)
+    added = build_feature_store(conn, args.store, args.chunk_sessions, args.full)
+    conn.close()
+
+    state = read_state(args.store) or {}
+    print(f"✅ Feature store {args.store} : +{added} sessions, {state.get('sessions', 0)} au total "
+          f"(high-water mark rowid {state.get('last_rowid')})")
@@ -0,0 +1,109 @@
+# ==== PROFILS SIMULÉS ====
+# Paramètres partagés par build_case (session par session, module random) et par le
+# générateur vectorisé (blocs NumPy). Plages (min, max) inclusives, comme random.randint.
+
+SAMPLES_PER_CASE = {
+    "normal": 200,
+    "fast": 100,
+    "paste_abuse": 100,
+    "hesitant": 100,
+    "no_mouse": 100,
+    "strategic_fraud": 100,
+    "copy_safe": 100,
+    "mouse_but_fast": 100,
+    "hesitant_legit": 100,
+    "hybrid_confusing": 50
+}
+
+DEVICE_TYPES = ["desktop", "mobile"]
+# Ancienneté de start_time en jours
+START_DAYS_AGO = (1, 30)
+
+# Comportement par champ : plages de base, paste / copy tirés avec une probabilité
+# (sinon 0), puis groupes de champs (liste fixe ou k champs tirés au hasard) qui
+# remplacent certaines plages.
+DEFAULT_FIELD = {
+    "time": (1500, 4000),
+    "deletes": (1, 5),
+    "changes": (1, 5),
+    "paste": (0, 0), "paste_prob": 1.0,
+    "copy": (0, 0), "copy_prob": 1.0,
+    "groups": [],
+}
+
+DEFAULT_PROFILE = {
+    "label": 0,
+    "duration": (30000, 90000),
+    "mouse": 1,
+    "tabs": 0,
+    "enter": 0,
+    "scroll": (0, 0),
+    "viewport": (0, 0),
+    "clicks": (3, 12),
+    # Ordre de focus : k permutations de deux champs avec une probabilité, ou mélange complet
+    "order_swaps": (0, 0), "order_swap_prob": 0.0, "order_shuffle": False,
+}
+
+
+def _profile(field=None, **overrides):
+    return {**DEFAULT_PROFILE, **overrides, "field": {**DEFAULT_FIELD, **(field or {})}}
+
+
+PROFILES = {
+    "normal": _profile(
+        scroll=(5, 20), viewport=(0, 2),
+        field={"paste": (0, 1), "copy": (1, 1), "copy_prob": 0.05},
+    ),
+    "fast": _profile(
+        label=1, duration=(3000, 7000), scroll=(0, 5), viewport=(0, 1), clicks=(1, 4),
+        order_swaps=(1, 1), order_swap_prob=0.4,
+        field={"time": (200, 900), "deletes": (0, 1)},
+    ),
+    "paste_abuse": _profile(
+        label=1, duration=(10000, 20000), scroll=(5, 25), viewport=(0, 1), clicks=(3, 10),
+        order_swaps=(1, 1), order_swap_prob=0.4,
+        field={"time": (800, 2500), "groups": [{"k": (3, 6), "paste": (6, 10), "copy": (0, 2)}]},
+    ),
+    "hesitant": _profile(
+        label=1, duration=(60000, 120000), scroll=(15, 60), viewport=(0, 2), clicks=(5, 15),
+        order_swaps=(1, 3), order_swap_prob=1.0,
+        field={"time": (2000, 6000), "deletes": (10, 25), "changes": (3, 10)},
+    ),
+    "no_mouse": _profile(
+        label=1, duration=(8000, 15000), mouse=0, tabs=3, enter=1, scroll=(0, 2), viewport=(0, 1), clicks=(0, 1),
+        field={"time": (800, 2000), "paste": (3, 5), "paste_prob": 0.4},
+    ),
+    "strategic_fraud": _profile(
+        label=1, duration=(40000, 70000),
+        field={"groups": [{"k": (3, 5), "paste": (6, 10), "copy": (0, 2)}]},
+    ),
+    "copy_safe": _profile(
+        duration=(40000, 80000),
+        # Collage modéré sur certains champs seulement, temps de saisie réaliste pour montrer prudence
+        field={"time": (3000, 6000), "deletes": (0, 2), "changes": (1, 3), "copy": (0, 1),
+               "groups": [{"fields": ["cin", "adresse", "profession"], "paste": (2, 4), "copy": (1, 3)}]},
+    ),
+    "mouse_but_fast": _profile(
+        label=1, duration=(3000, 6000),
+        field={"paste": (0, 1), "copy": (0, 1)},
+    ),
+    "hesitant_legit": _profile(
+        duration=(60000, 120000),
+    ),
+    "hybrid_confusing": _profile(
+        label=1, duration=(45000, 90000), tabs=1, order_shuffle=True,
+        field={"groups": [
+            {"k": (3, 3), "paste": (5, 8), "copy": (0, 2)},
+            {"k": (2, 2), "time": (3000, 6000), "deletes": (3, 8), "changes": (3, 6)},
+        ]},
+    ),
+}
+
+# Plages des valeurs de formulaire factices
+VALUE_RANGES = {
+    "cin": (10000000, 99999999),
+    "revenu": (1200, 5000),
+    "montant": (1000, 15000),
+    "duree": (6, 60),
+    "rue": (1, 200),
+}
@@ -1,105 +1,179 @@
+import logging
+import os
+import queue
 import sqlite3
+import threading
+
+from migrations import SCHEMA_VERSION, migrate
 
 DB_FILE = "tracking.db"
 
+logger = logging.getLogger("kyc.db")
+
+# Réglages appliqués à chaque nouvelle connexion (mêmes que generate_cases.init_db + tuning)
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA busy_timeout = 5000",
+]
+
+SESSION_COLUMNS = [
+    "session_id", "start_time", "end_time", "submit_delay_ms", "fast_fill",
+    "mouseMoved", "mouseClickCount", "scrollCount", "viewportChanges",
+    "tabCount", "enterPressed", "deviceType", "fieldFocusOrder"
+]
+
+FIELD_COLUMNS = [
+    "session_id", "field_name", "value", "timeSpentMs", "hoverDurationMs",
+    "copy", "paste", "delete_count", "changes", "focusCount"
+]
+
+# Upsert : une session ré-enregistrée garde son rowid (high-water mark du feature store)
+INSERT_SESSION_SQL = f"""
+INSERT INTO sessions ({", ".join(SESSION_COLUMNS)})
+VALUES ({", ".join("?" for _ in SESSION_COLUMNS)})
+ON CONFLICT(session_id) DO UPDATE SET
+{", ".join(f"{col} = excluded.{col}" for col in SESSION_COLUMNS[1:])}, revision = revision + 1
+"""
+
+SELECT_REVISION_SQL = "SELECT revision FROM sessions WHERE session_id = ?"
+
+INSERT_FIELD_SQL = f"""
+INSERT INTO fields ({", ".join(FIELD_COLUMNS)})
+VALUES ({", ".join("?" for _ in FIELD_COLUMNS)})
+"""
+
+# Session ré-enregistrée : ses anciens champs sont remplacés, pas dupliqués
+DELETE_FIELDS_SQL = "DELETE FROM fields WHERE session_id = ?"
+
+SELECT_SESSION_SQL = f"""
+SELECT {", ".join(SESSION_COLUMNS)} FROM sessions WHERE session_id = ?
+"""
+
+SELECT_FIELDS_SQL = f"""
+SELECT {", ".join(FIELD_COLUMNS[1:])} FROM fields WHERE session_id = ? ORDER BY id
+"""
+
+# ==== GESTION DES CONNEXIONS ====
+# Pool borné : un thread emprunte une connexion (get_connection) et la rend en fin de requête
+# (release_connection, hook teardown de Flask). Au-delà de POOL_SIZE connexions inactives, les
+# rendues sont fermées ; aucune connexion n'est retenue pour un thread terminé.
+POOL_SIZE = int(os.environ.get("KYC_DB_POOL_SIZE", "8"))
+_local = threading.local()
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+def open_connection(db_file=None):
+    # check_same_thread=False : une connexion rendue au pool sert ensuite un autre thread
+    conn = sqlite3.connect(db_file or DB_FILE, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _acquire():
+    # (fichier, connexion) inactive du pool, sinon nouvelle ; celles d'un ancien DB_FILE sont fermées
+    while True:
+        try:
+            db_file, conn = _pool.get_nowait()
+        except queue.Empty:
+            return DB_FILE, open_connection()
+        if db_file == DB_FILE:
+            return db_file, conn
+        conn.close()
+
+def get_connection():
+    held = getattr(_local, "held", None)
+    if held is not None and held[0] != DB_FILE:
+        close_connection()
+        held = None
+    if held is None:
+        held = _local.held = _acquire()
+    return held[1]
+
+def release_connection():
+    # Connexion du thread rendue au pool (fermée si le pool est plein)
+    held = getattr(_local, "held", None)
+    if held is None:
+        return
+    _local.held = None
+    conn = held[1]
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(held)
+    except queue.Full:
+        conn.close()
+
+def close_connection():
+    held = getattr(_local, "held", None)
+    if held is None:
+        return
+    _local.held = None
+    held[1].close()
+
+def close_all_connections():
+    close_connection()
+    while True:
+        try:
+            _, conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
+
+def _session_row(session_data):
+    return tuple(session_data.get(col) for col in SESSION_COLUMNS)
+
+def _field_row(field_data):
+    return tuple(field_data.get(col) for col in FIELD_COLUMNS)
+
+# ==== SCHÉMA ====
 def create_tables():
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    # Table sessions
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS sessions (
-        session_id TEXT PRIMARY KEY,
-        start_time INTEGER,
-        end_time INTEGER,
-        submit_delay_ms INTEGER,
-        fast_fill INTEGER,
-        mouseMoved INTEGER,
-        mouseClickCount INTEGER,
-        scrollCount INTEGER,
-        scrollDensity REAL,
-        viewportChanges INTEGER,
-        tabKeyCount INTEGER,
-        enterPressed INTEGER,
-        deviceType TEXT,
-        fieldFocusOrder TEXT
-    )
-    """)
-
-    # Table fields
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS fields (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_id TEXT,
-        field_name TEXT,
-        value TEXT,
-        timeSpentMs INTEGER,
-        hoverDurationMs INTEGER,
-        copy INTEGER,
-        paste INTEGER,
-        delete_count INTEGER,
-        changes INTEGER,
-        focusCount INTEGER,
-        FOREIGN KEY(session_id) REFERENCES sessions(session_id)
-    )
-    """)
-
-    conn.commit()
-    conn.close()
-    print("✅ Tables créées avec succès.")
-
-def insert_session_data(session_data):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    cur.execute("""
-    INSERT OR REPLACE INTO sessions (
-        session_id, start_time, end_time, submit_delay_ms, fast_fill,
-        mouseMoved, mouseClickCount, scrollCount, viewportChanges,
-        tabKeyCount, enterPressed, deviceType, fieldFocusOrder
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        session_data.get("session_id"),
-        session_data.get("start_time"),
-        session_data.get("end_time"),
-        session_data.get("submit_delay_ms"),
-        session_data.get("fast_fill"),
-        session_data.get("mouseMoved"),
-        session_data.get("mouseClickCount"),
-        session_data.get("scrollCount"),
-        session_data.get("viewportChanges"),
-        session_data.get("tabKeyCount"),
-        session_data.get("enterPressed"),
-        session_data.get("deviceType"),
-        session_data.get("fieldFocusOrder")
-    ))
-
-    conn.commit()
-    conn.close()
-    print(f"✅ Session {session_data.get('session_id')} insérée.")
-
-def insert_field_data(field_data):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    cur.execute("""
-    INSERT INTO fields (
-        session_id, field_name, value, timeSpentMs, hoverDurationMs,
-        copy, paste, delete_count, changes, focusCount
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        field_data.get("session_id"),
-        field_data.get("field_name"),
-        field_data.get("value"),
-        field_data.get("timeSpentMs"),
-        field_data.get("hoverDurationMs"),
-        field_data.get("copy"),
-        field_data.get("paste"),
-        field_data.get("delete_count"),
-        field_data.get("changes"),
-        field_data.get("focusCount")
-    ))
-
-    conn.commit()
-    conn.close()
-    print(f"✅ Champ {field_data.get('field_name')} inséré pour la session {field_data.get('session_id')}.")
+    # Schéma versionné (migrations.py) : la base et ses données sont conservées d'un démarrage
+    # à l'autre, seules les migrations manquantes sont appliquées
+    applied = migrate(get_connection())
+    release_connection()
+    logger.info("✅ Schéma à jour (version %d, %d migration(s) appliquée(s)).", SCHEMA_VERSION, len(applied))
+
+# ==== INSERTIONS ====
+def insert_session_with_fields(session_data, fields_data):
+    # Session + champs dans une seule transaction (un seul fsync) ; renvoie la révision écrite
+    conn = get_connection()
+    session_id = session_data.get("session_id")
+    with conn:
+        conn.execute(INSERT_SESSION_SQL, _session_row(session_data))
+        conn.execute(DELETE_FIELDS_SQL, (session_id,))
+        conn.executemany(INSERT_FIELD_SQL, [_field_row(f) for f in fields_data])
+        revision = conn.execute(SELECT_REVISION_SQL, (session_id,)).fetchone()[0]
+    logger.debug("✅ Session %s insérée avec %d champs (révision %d).", session_id, len(fields_data), revision)
+    return revision
+
+def session_revision(session_id):
+    # Révision courante de la session en base, None si elle n'existe pas
+    row = get_connection().execute(SELECT_REVISION_SQL, (session_id,)).fetchone()
+    return row[0] if row else None
+
+# ==== LECTURE ====
+def load_session_payload(session_id):
+    # Session enregistrée -> payload au format tracking.js (re-score sans renvoyer les données) ;
+    # None si la session n'existe pas
+    conn = get_connection()
+    row = conn.execute(SELECT_SESSION_SQL, (session_id,)).fetchone()
+    if row is None:
+        return None
+    session = dict(zip(SESSION_COLUMNS, row))
+    fields = conn.execute(SELECT_FIELDS_SQL, (session_id,)).fetchall()
+    order = session.pop("fieldFocusOrder") or ""
+    session["tabKeyCount"] = session.pop("tabCount")
+    payload = {
+        **session,
+        "duration_ms": (session["end_time"] or 0) - (session["start_time"] or 0),
+        "field_order": order.split(",") if order else [],
+        "fields": {},
+    }
+    for field in fields:
+        infos = dict(zip(FIELD_COLUMNS[1:], field))
+        name = infos.pop("field_name")
+        infos["delete"] = infos.pop("delete_count")
+        payload["fields"][name] = infos
+    return payload
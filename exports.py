@@ -0,0 +1,159 @@
+import csv
+import io
+import logging
+import os
+import sqlite3
+import zlib
+from datetime import datetime
+
+import database
+
+logger = logging.getLogger("kyc.exports")
+
+# Lignes lues par fetchmany : la mémoire reste constante quelle que soit la taille de la table
+EXPORT_BATCH_ROWS = 1000
+# Page paginée (limit=) lue en entier avant l'envoi pour placer le curseur en en-tête : bornée
+EXPORT_MAX_PAGE_ROWS = int(os.environ.get("KYC_EXPORT_MAX_PAGE_ROWS", "100000"))
+
+LABEL_VALUES = {"0": 0, "1": 1, "clean": 0, "suspicious": 1}
+
+# Clé de pagination (keyset) par table
+EXPORT_KEYS = {"sessions": "s.session_id", "fields": "f.id"}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_time_ms(value):
+    # Timestamp epoch en ms ou date ISO (2025-09-23 / 2025-09-23T10:00:00)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        raise ExportError(f"Date invalide : {value}")
+
+
+def parse_label(value):
+    if value is None or value == "":
+        return None
+    try:
+        return LABEL_VALUES[value.lower()]
+    except KeyError:
+        raise ExportError(f"Label invalide : {value} (0, 1, Clean ou Suspicious)")
+
+
+def has_column(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def build_export_query(conn, table, start=None, end=None, label=None, after=None):
+    # Requête filtrée + triée sur la clé keyset ; renvoie (sql sans LIMIT, paramètres)
+    if table not in EXPORT_KEYS:
+        raise ExportError(f"Table inconnue : {table}")
+    key = EXPORT_KEYS[table]
+    where = []
+    params = []
+    if start is not None:
+        where.append("s.start_time >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("s.start_time < ?")
+        params.append(end)
+    if label is not None:
+        if not has_column(conn, "sessions", "label"):
+            raise ExportError("Filtre label indisponible : la table sessions n'a pas de colonne label")
+        where.append("s.label = ?")
+        params.append(label)
+    if after is not None:
+        where.append(f"{key} > ?")
+        if table == "fields":
+            try:
+                after = int(after)
+            except ValueError:
+                raise ExportError(f"Curseur invalide : {after}")
+        params.append(after)
+
+    if table == "sessions":
+        sql = "SELECT s.* FROM sessions s"
+    elif start is not None or end is not None or label is not None:
+        # CROSS JOIN : SQLite garde sessions en table externe, les sessions filtrées (index période /
+        # label) mènent aux champs par idx_fields_session au lieu d'un parcours complet de fields
+        sql = "SELECT f.* FROM sessions s CROSS JOIN fields f ON f.session_id = s.session_id"
+    else:
+        sql = "SELECT f.* FROM fields f"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key}"
+    return sql, params
+
+
+def read_page(cur, table, limit):
+    # Une seule exécution (LIMIT limit + 1) : la ligne en trop signale une page suivante, le
+    # curseur (en-tête X-Next-Cursor) est alors la clé de la dernière ligne de la page
+    key_column = EXPORT_KEYS[table].split(".")[1]
+    key_index = [d[0] for d in cur.description].index(key_column)
+    rows = cur.fetchmany(limit + 1)
+    if len(rows) <= limit:
+        return rows, None
+    rows.pop()
+    return rows, rows[-1][key_index]
+
+
+def open_export(table, start=None, end=None, label=None, after=None, limit=None):
+    # Ouvre une connexion dédiée en lecture seule, valide les filtres et exécute la requête.
+    # Renvoie (connexion, colonnes, lots de lignes, curseur suivant) : sans limit les lots sont
+    # lus au fil de l'envoi, avec limit la page est lue d'avance pour connaître le curseur.
+    if limit and limit > EXPORT_MAX_PAGE_ROWS:
+        raise ExportError(f"limit doit être <= {EXPORT_MAX_PAGE_ROWS}")
+    conn = sqlite3.connect(f"file:{database.DB_FILE}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        sql, params = build_export_query(conn, table, start, end, label, after)
+        if limit:
+            cur = conn.execute(sql + " LIMIT ?", params + [limit + 1])
+            rows, cursor = read_page(cur, table, limit)
+            batches = [rows[i:i + EXPORT_BATCH_ROWS] for i in range(0, len(rows), EXPORT_BATCH_ROWS)]
+        else:
+            cur = conn.execute(sql, params)
+            batches = iter(lambda: cur.fetchmany(EXPORT_BATCH_ROWS), [])
+            cursor = None
+        return conn, [d[0] for d in cur.description], batches, cursor
+    except Exception:
+        conn.close()
+        raise
+
+
+def iter_csv(conn, columns, batches, compress=False):
+    # Générateur : en-tête puis lots de EXPORT_BATCH_ROWS lignes, gzip en flux si demandé
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows_sent = 0
+
+    def drain():
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(chunk) if compressor else chunk
+
+    try:
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            rows_sent += len(rows)
+            chunk = drain()
+            if chunk:
+                yield chunk
+        chunk = drain()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+        logger.info("📤 Export terminé : %d lignes", rows_sent)
+    finally:
+        conn.close()
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ==== CONFIGURATION ====
+FEATURE_CACHE_SIZE = int(os.environ.get("KYC_FEATURE_CACHE_SIZE", "10000"))
+FEATURE_CACHE_TTL_S = float(os.environ.get("KYC_FEATURE_CACHE_TTL_S", "900"))
+
+
+class CachedSession:
+    # Vecteur de features d'une session + dernier score (valable pour une version de modèle)
+
+    def __init__(self, session_id, features, fingerprint=None, stored=False, revision=None):
+        self.session_id = session_id
+        self.features = features
+        self.fingerprint = fingerprint
+        self.stored = stored
+        # sessions.revision de la ligne enregistrée (entrées stored) : détecte un re-save par un autre worker
+        self.revision = revision
+        self.score = None
+        self.label = None
+        self.model_version = None
+        self.touched = time.monotonic()
+
+    def scored_with(self, model_version):
+        return self.score is not None and self.model_version == model_version
+
+
+class FeatureCache:
+    # LRU borné + TTL, clé session_id, propre à un processus. fingerprint : empreinte du corps reçu
+    # (même payload = mêmes features) ; stored : entrée issue d'une session enregistrée (save /
+    # submit), seule réutilisable par get_stored, qui la confronte à la révision en base.
+
+    def __init__(self, max_size=FEATURE_CACHE_SIZE, ttl=FEATURE_CACHE_TTL_S):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.score_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = 0
+        self.evicted_ttl = 0
+        self.evicted_capacity = 0
+
+    def _evict(self, now):
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if now - entry.touched < self.ttl:
+                break
+            del self._entries[session_id]
+            self.evicted_ttl += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evicted_capacity += 1
+
+    def _lookup(self, session_id, usable):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(session_id)
+            if entry is None or not usable(entry):
+                self.misses += 1
+                return None
+            entry.touched = now
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry
+
+    def get(self, session_id, fingerprint):
+        # Même corps déjà reçu : features valables quel que soit l'état de la base
+        return self._lookup(session_id, lambda entry: entry.fingerprint == fingerprint)
+
+    def get_stored(self, session_id, revision, fingerprint=None):
+        # Session enregistrée, encore à la révision lue en base (sinon ré-enregistrée ailleurs :
+        # entrée supprimée) ; fingerprint : en plus, même corps que celui enregistré
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.stored and entry.revision != revision:
+                del self._entries[session_id]
+                self.stale += 1
+        return self._lookup(session_id, lambda entry: entry.stored and (
+            fingerprint is None or entry.fingerprint == fingerprint))
+
+    def put(self, session_id, features, fingerprint=None, stored=False, revision=None):
+        # stored=True (session ré-enregistrée) remplace toujours l'entrée : ancien score invalidé.
+        # Un payload seulement scoré ne remplace pas une session enregistrée.
+        entry = CachedSession(session_id, features, fingerprint, stored, revision)
+        with self._lock:
+            previous = self._entries.get(session_id)
+            if previous is not None and previous.stored and not stored:
+                return entry
+            if previous is not None:
+                self.invalidations += 1
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            self._evict(entry.touched)
+        return entry
+
+    def set_score(self, entry, score, label, model_version):
+        with self._lock:
+            entry.score = score
+            entry.label = label
+            entry.model_version = model_version
+
+    def count_score_hit(self):
+        with self._lock:
+            self.score_hits += 1
+
+    def invalidate(self, session_id):
+        with self._lock:
+            if self._entries.pop(session_id, None) is not None:
+                self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            self._evict(time.monotonic())
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "score_hits": self.score_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+                "evicted_ttl": self.evicted_ttl,
+                "evicted_capacity": self.evicted_capacity,
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+            }
@@ -1,81 +1,157 @@
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
 
-# Encoder statique pour deviceType
-device_encoder = LabelEncoder()
-device_encoder.fit(["desktop", "mobile", "tablet", "unknown"])
+# Encodage statique de deviceType (mêmes codes que l'ancien LabelEncoder, ordre alphabétique)
+DEVICE_ENCODING = {"desktop": 0, "mobile": 1, "tablet": 2, "unknown": 3}
 
-def compute_field_order_deviation(expected_order, field_data):
-    # Filtrer les champs effectivement visités
-    actual_order = [field for field in expected_order if field_data.get(field, {}).get("focusCount", 0) > 0]
-    deviation = sum(1 for i, field in enumerate(expected_order[:len(actual_order)]) if actual_order[i] != field)
-    return deviation
+# Ordre des features attendu par le modèle
+FEATURE_ORDER = [
+    "duration_ms",
+    "mouseClickCount",
+    "scrollCount",
+    "scrollDensity",
+    "viewportChanges",
+    "tabCount",
+    "enterPressed",
+    "deviceType_encoded",
+    "fieldCount",
+    "totalTimeSpent",
+    "avgTimePerField",
+    "totalFocusCount",
+    "avgChangesPerField",
+    "avgPastePerField",
+    "avgDeletePerField",
+    "fieldOrderDeviation",
+    "stdTimePerField",
+    "maxPasteCount",
+    "pasteRatio",
+    "deleteRatio"
+]
 
-def extract_features(data):
+# Features entières (utile pour réécrire le CSV d'entraînement à l'identique)
+INTEGER_FEATURES = [
+    "duration_ms", "mouseClickCount", "scrollCount", "viewportChanges", "tabCount",
+    "enterPressed", "deviceType_encoded", "fieldCount", "totalTimeSpent",
+    "totalFocusCount", "fieldOrderDeviation", "maxPasteCount"
+]
+
+# Ordre de référence des champs du formulaire KYC
+FIELD_NAMES = ["nom", "prenom", "cin", "adresse", "profession", "revenu", "montant", "duree"]
+
+# ==== MOTEUR COLONNAIRE ====
+# Métriques par champ : dernière dimension du tableau (n_sessions, n_fields, n_metrics)
+FIELD_METRICS = ["timeSpentMs", "focusCount", "changes", "paste", "delete"]
+TIME, FOCUS, CHANGES, PASTE, DELETE = range(len(FIELD_METRICS))
+
+# Colonnes par session : (n_sessions, n_session_columns)
+SESSION_COLUMNS = [
+    "duration_ms", "mouseClickCount", "scrollCount", "viewportChanges",
+    "tabCount", "enterPressed", "deviceType_encoded", "fieldOrderDeviation"
+]
+
+def field_order_deviation(order, reference=FIELD_NAMES):
+    # Nombre de positions différentes entre l'ordre de focus et l'ordre du formulaire.
+    # Les champs hors référence (uploads...) sont ignorés ; ordre incomplet = déviation maximale.
+    if isinstance(order, str):
+        order = order.split(",")
+    if not order:
+        return len(reference)
+    actual_order = [field for field in order if field in reference]
+    if len(actual_order) != len(reference):
+        return len(reference)
+    return sum(1 for i, j in zip(reference, actual_order) if i != j)
+
+def encode_device(device_type):
+    return DEVICE_ENCODING.get(device_type, DEVICE_ENCODING["unknown"])
+
+def pack_payload(data):
+    # Un payload tracking.js -> (matrice champs (k, n_metrics), ligne session (n_session_columns,))
     fields = data.get("fields", {})
-    field_order = data.get("field_order", [])
-    duration_ms = data.get("duration_ms", 0)
-    device_type = data.get("deviceType", "unknown")
-
-    # Initialisations
-    fieldCount = len(fields)
-    totalTimeSpent = sum(f.get("timeSpentMs", 0) for f in fields.values())
-    avgTimePerField = totalTimeSpent / fieldCount if fieldCount else 0
-    totalFocusCount = sum(f.get("focusCount", 0) for f in fields.values())
-    avgChangesPerField = np.mean([f.get("changes", 0) for f in fields.values()]) if fields else 0
-    avgPastePerField = np.mean([f.get("paste", 0) for f in fields.values()]) if fields else 0
-    avgDeletePerField = np.mean([f.get("delete", 0) for f in fields.values()]) if fields else 0
-
-    # Variabilité du temps par champ
-    stdTimePerField = np.std([f.get("timeSpentMs", 0) for f in fields.values()]) if fields else 0
-
-    # Collage maximal sur un champ
-    maxPasteCount = max([f.get("paste", 0) for f in fields.values()]) if fields else 0
-
-    # Ratio de champs collés
-    pasteRatio = sum(1 for f in fields.values() if f.get("paste", 0) > 0) / fieldCount if fieldCount else 0
-
-    # Ratio de champs modifiés (delete)
-    deleteRatio = sum(1 for f in fields.values() if f.get("delete", 0) > 0) / fieldCount if fieldCount else 0
-
-    # ✅ Correction de fieldOrderDeviation
-    fieldOrderDeviation = compute_field_order_deviation(field_order, fields)
-
-    # 📜 Ajout de scrollDensity
-    scrollCount = data.get("scrollCount", 0)
-    scrollDensity = scrollCount / (duration_ms / 1000) if duration_ms > 0 else 0
-
-    # Encodage du device
-    try:
-        deviceType_encoded = int(device_encoder.transform([device_type])[0])
-    except Exception:
-        deviceType_encoded = int(device_encoder.transform(["unknown"])[0])
-
-    # Autres features transmis directement
-    mouseClickCount = data.get("mouseClickCount", 0)
-    viewportChanges = data.get("viewportChanges", 0)
-    tabCount = data.get("tabKeyCount", 0)
-    enterPressed = int(bool(data.get("enterPressed", False)))
-
-    return {
-        "duration_ms": duration_ms,
-        "mouseClickCount": mouseClickCount,
-        "scrollCount": scrollCount,
-        "scrollDensity": scrollDensity,
-        "viewportChanges": viewportChanges,
-        "tabCount": tabCount,
-        "enterPressed": enterPressed,
-        "deviceType_encoded": deviceType_encoded,
-        "fieldCount": fieldCount,
-        "totalTimeSpent": totalTimeSpent,
-        "avgTimePerField": avgTimePerField,
-        "totalFocusCount": totalFocusCount,
-        "avgChangesPerField": avgChangesPerField,
-        "avgPastePerField": avgPastePerField,
-        "avgDeletePerField": avgDeletePerField,
-        "fieldOrderDeviation": fieldOrderDeviation,
-        "stdTimePerField": stdTimePerField,
-        "maxPasteCount": maxPasteCount,
-        "pasteRatio": pasteRatio,
-        "deleteRatio": deleteRatio
-    }
+    field_matrix = np.array(
+        [[f.get(metric, 0) for metric in FIELD_METRICS] for f in fields.values()],
+        dtype=np.float64
+    ).reshape(len(fields), len(FIELD_METRICS))
+    session_row = np.array([
+        data.get("duration_ms", 0),
+        data.get("mouseClickCount", 0),
+        data.get("scrollCount", 0),
+        data.get("viewportChanges", 0),
+        data.get("tabKeyCount", 0),
+        int(bool(data.get("enterPressed", False))),
+        encode_device(data.get("deviceType", "unknown")),
+        field_order_deviation(data.get("field_order", []))
+    ], dtype=np.float64)
+    return field_matrix, session_row
+
+def stack_packed(field_matrices, session_rows):
+    # Assemble les sessions en un tableau (n_sessions, max_fields, n_metrics) complété par des zéros
+    counts = np.array([len(m) for m in field_matrices], dtype=np.int64)
+    packed = np.zeros((len(field_matrices), counts.max(initial=0), len(FIELD_METRICS)))
+    for i, m in enumerate(field_matrices):
+        packed[i, :len(m)] = m
+    sessions = np.asarray(session_rows, dtype=np.float64).reshape(len(field_matrices), len(SESSION_COLUMNS))
+    return packed, counts, sessions
+
+def compute_feature_matrix(packed, counts, sessions):
+    # Les 20 features pour toutes les sessions en une passe, colonnes dans FEATURE_ORDER
+    n, max_fields, _ = packed.shape
+    counts = counts.astype(np.float64)
+    has_fields = counts > 0
+    safe_counts = np.where(has_fields, counts, 1.0)
+    mask = np.arange(max_fields)[None, :] < counts[:, None]
+
+    totals = packed.sum(axis=1)
+    means = np.where(has_fields[:, None], totals / safe_counts[:, None], 0.0)
+
+    # Écart-type (ddof=1) par mise à jour de Welford, vectorisée sur les sessions :
+    # mêmes arrondis que le groupby().std() de pandas utilisé à l'entraînement
+    nobs = np.zeros(n)
+    running_mean = np.zeros(n)
+    m2 = np.zeros(n)
+    for j in range(max_fields):
+        active = mask[:, j]
+        val = packed[:, j, TIME]
+        nobs = nobs + active
+        old_mean = running_mean
+        running_mean = np.where(active, old_mean + (val - old_mean) / np.maximum(nobs, 1), old_mean)
+        m2 = np.where(active, m2 + (val - running_mean) * (val - old_mean), m2)
+    std_time = np.where(counts > 1, np.sqrt(m2 / np.where(counts > 1, counts - 1, 1.0)), 0.0)
+    max_paste = packed[:, :, PASTE].max(axis=1, initial=0)
+    paste_ratio = np.where(has_fields, (packed[:, :, PASTE] > 0).sum(axis=1) / safe_counts, 0.0)
+    delete_ratio = np.where(has_fields, (packed[:, :, DELETE] > 0).sum(axis=1) / safe_counts, 0.0)
+
+    duration_ms = sessions[:, 0]
+    scroll_count = sessions[:, 2]
+    scroll_density = np.where(duration_ms > 0, scroll_count / (duration_ms / 1000 + 1e-5), 0.0)
+
+    out = np.empty((n, len(FEATURE_ORDER)))
+    out[:, 0] = duration_ms
+    out[:, 1] = sessions[:, 1]
+    out[:, 2] = scroll_count
+    out[:, 3] = scroll_density
+    out[:, 4] = sessions[:, 3]
+    out[:, 5] = sessions[:, 4]
+    out[:, 6] = sessions[:, 5]
+    out[:, 7] = sessions[:, 6]
+    out[:, 8] = counts
+    out[:, 9] = totals[:, TIME]
+    out[:, 10] = means[:, TIME]
+    out[:, 11] = totals[:, FOCUS]
+    out[:, 12] = means[:, CHANGES]
+    out[:, 13] = means[:, PASTE]
+    out[:, 14] = means[:, DELETE]
+    out[:, 15] = sessions[:, 7]
+    out[:, 16] = std_time
+    out[:, 17] = max_paste
+    out[:, 18] = paste_ratio
+    out[:, 19] = delete_ratio
+    return out
+
+def extract_features_matrix(payloads):
+    # Plusieurs payloads -> matrice (n, 20)
+    packed_items = [pack_payload(data) for data in payloads]
+    packed, counts, sessions = stack_packed([p[0] for p in packed_items], [p[1] for p in packed_items])
+    return compute_feature_matrix(packed, counts, sessions)
+
+def extract_features(data):
+    row = extract_features_matrix([data])[0]
+    return {name: row[i] for i, name in enumerate(FEATURE_ORDER)}
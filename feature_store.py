@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from feature_extractor import FEATURE_ORDER
+from generate_cases import EXPORT_CHUNK_SESSIONS, iter_feature_chunks, session_feature_frame
+
+logger = logging.getLogger("kyc.feature_store")
+
+# ==== CONFIGURATION ====
+FEATURE_STORE_DIR = os.environ.get("KYC_FEATURE_STORE", "feature_store")
+
+# Fichier d'état (ignoré par les lectures : préfixe "_") : dernier rowid de sessions traité
+STATE_FILE = "_state.json"
+# Version du format des fichiers : un store d'un format antérieur est reconstruit
+# (2 : colonne revision, rafraîchissement des sessions ré-enregistrées)
+STORE_FORMAT = 2
+LABEL_COLUMN = "label_target"
+METADATA_COLUMNS = ["session_id", "start_time", "end_time", "deviceType", "revision"]
+# Sessions ré-enregistrées relues par requête (paramètres IN sous la limite SQLite)
+RESAVED_BATCH_SESSIONS = 500
+PARTITION_COLUMN = "session_date"
+
+# session_date=YYYY-MM-DD/ ; chaîne ISO => comparaisons >= / < correctes et élagage des répertoires
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+
+
+# ==== ÉTAT (HIGH-WATER MARK) ====
+def read_state(store_dir=FEATURE_STORE_DIR):
+    try:
+        with open(os.path.join(store_dir, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_state(store_dir, state):
+    # Écriture atomique : un crash laisse l'ancien état, la tranche sera réécrite sous le même nom
+    path = os.path.join(store_dir, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def state_matches(conn, state):
+    # Même format de store, et la session du high-water mark existe toujours au même rowid
+    # (table non recréée)
+    if state.get("format") != STORE_FORMAT:
+        return False
+    row = conn.execute("SELECT session_id FROM sessions WHERE rowid = ?", (state["last_rowid"],)).fetchone()
+    return row is not None and row[0] == state["last_session_id"]
+
+
+def clear_store(store_dir):
+    for entry in os.scandir(store_dir):
+        if entry.is_dir() and entry.name.startswith(PARTITION_COLUMN + "="):
+            shutil.rmtree(entry.path)
+    if os.path.exists(os.path.join(store_dir, STATE_FILE)):
+        os.remove(os.path.join(store_dir, STATE_FILE))
+
+
+# ==== SESSIONS RÉ-ENREGISTRÉES ====
+def resaved_sessions(conn, store_dir, last_rowid):
+    # Un upsert garde le rowid (sous le high-water mark) mais incrémente revision : sessions dont
+    # la révision en base dépasse celle du store, ou absentes du store (label ajouté depuis)
+    revisions = dict(conn.execute(
+        "SELECT session_id, revision FROM sessions WHERE rowid <= ? AND revision > 0 AND label IS NOT NULL",
+        (last_rowid,)
+    ).fetchall())
+    if not revisions:
+        return []
+    stored = open_dataset(store_dir).to_table(
+        columns=["session_id", "revision"], filter=ds.field("session_id").isin(list(revisions))
+    ).to_pydict()
+    stored = dict(zip(stored["session_id"], stored["revision"]))
+    return [session_id for session_id, revision in revisions.items() if revision > stored.get(session_id, -1)]
+
+
+def drop_sessions(store_dir, session_ids):
+    # Fichiers Parquet immuables : ceux qui contiennent ces sessions sont réécrits sans elles
+    # (écriture dans un .tmp puis os.replace) ; renvoie le nombre de lignes retirées
+    ids = pa.array(session_ids, type=pa.string())
+    dropped = 0
+    for path in open_dataset(store_dir).files:
+        # partitioning=None : session_date reste dans le chemin, pas dans le fichier réécrit
+        session_column = pq.read_table(path, columns=["session_id"], partitioning=None)["session_id"]
+        if not pc.any(pc.is_in(session_column, value_set=ids)).as_py():
+            continue
+        table = pq.read_table(path, partitioning=None)
+        stale = pc.is_in(table["session_id"], value_set=ids)
+        kept = table.filter(pc.invert(stale))
+        dropped += table.num_rows - kept.num_rows
+        if kept.num_rows:
+            pq.write_table(kept, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        else:
+            os.remove(path)
+    return dropped
+
+
+def refresh_resaved(conn, store_dir, last_rowid):
+    # Anciennes lignes retirées puis features recalculées ; un crash entre les deux laisse les
+    # sessions absentes du store : le passage suivant les retrouve (révision > -1) et les réécrit
+    session_ids = resaved_sessions(conn, store_dir, last_rowid)
+    if not session_ids:
+        return 0
+    dropped = drop_sessions(store_dir, session_ids)
+    token = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    written = 0
+    for start in range(0, len(session_ids), RESAVED_BATCH_SESSIONS):
+        df = session_feature_frame(conn, session_ids[start:start + RESAVED_BATCH_SESSIONS], METADATA_COLUMNS)
+        if not df.empty:
+            write_partitioned(df, store_dir, f"resave-{token}-{start}-{{i}}.parquet")
+            written += len(df)
+    logger.info("🔄 Feature store %s : %d sessions ré-enregistrées rafraîchies", store_dir, len(session_ids))
+    return written - dropped
+
+
+def write_partitioned(df, store_dir, basename_template):
+    df[PARTITION_COLUMN] = pd.to_datetime(df["start_time"], unit="ms").dt.strftime("%Y-%m-%d")
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False), store_dir, format="parquet",
+        partitioning=PARTITIONING, basename_template=basename_template,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+# ==== CONSTRUCTION INCRÉMENTALE ====
+def build_feature_store(conn, store_dir=FEATURE_STORE_DIR, chunk_sessions=EXPORT_CHUNK_SESSIONS, full=False):
+    # Features des sessions ajoutées depuis le dernier passage, en Parquet partitionné par date de
+    # session ; les sessions déjà présentes et ré-enregistrées depuis (revision) sont remplacées
+    os.makedirs(store_dir, exist_ok=True)
+    state = read_state(store_dir)
+    if state is not None and (full or not state_matches(conn, state)):
+        if not full:
+            logger.warning("⚠️ Table sessions recréée ou store d'un ancien format : reconstruction complète")
+        clear_store(store_dir)
+        state = None
+
+    after_rowid = state["last_rowid"] if state else None
+    if state:
+        refreshed = refresh_resaved(conn, store_dir, after_rowid)
+        if refreshed:
+            state = {**state, "sessions": state["sessions"] + refreshed,
+                     "updated_at": datetime.now().isoformat(timespec="seconds")}
+            write_state(store_dir, state)
+    sessions = 0
+    for chunk_end, df in iter_feature_chunks(conn, chunk_sessions, after_rowid, METADATA_COLUMNS):
+        if not df.empty:
+            # Nom déterministe par tranche : une reprise après crash écrase au lieu de dupliquer
+            write_partitioned(df, store_dir, f"part-{(after_rowid or 0) + 1}-{chunk_end}-{{i}}.parquet")
+            sessions += len(df)
+        last_session_id = conn.execute("SELECT session_id FROM sessions WHERE rowid = ?", (chunk_end,)).fetchone()[0]
+        state = {
+            "format": STORE_FORMAT,
+            "last_rowid": chunk_end,
+            "last_session_id": last_session_id,
+            "sessions": (state["sessions"] if state else 0) + len(df),
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        write_state(store_dir, state)
+        after_rowid = chunk_end
+
+    logger.info("🗄️ Feature store %s : +%d sessions (total %d)", store_dir, sessions, state["sessions"] if state else 0)
+    return sessions
+
+
+# ==== LECTURE ====
+def filter_expression(start_date=None, end_date=None, filters=None):
+    # start_date / end_date (YYYY-MM-DD, fin exclue) élaguent les partitions, filters (format
+    # pandas/pyarrow, ex. [("label_target", "=", 1)]) s'appliquent aux statistiques des row groups
+    expression = pq.filters_to_expression(filters) if filters else None
+    for bound in (
+        ds.field(PARTITION_COLUMN) >= start_date if start_date else None,
+        ds.field(PARTITION_COLUMN) < end_date if end_date else None,
+    ):
+        if bound is not None:
+            expression = bound if expression is None else expression & bound
+    return expression
+
+
+def open_dataset(store_dir=FEATURE_STORE_DIR):
+    return ds.dataset(store_dir, format="parquet", partitioning=PARTITIONING)
+
+
+def load_features(store_dir=FEATURE_STORE_DIR, columns=None, start_date=None, end_date=None, filters=None):
+    # Projection (columns) et prédicats poussés dans le scan Parquet
+    return open_dataset(store_dir).to_table(
+        columns=columns, filter=filter_expression(start_date, end_date, filters)
+    ).to_pandas()
+
+
+def iter_batches(store_dir=FEATURE_STORE_DIR, columns=None, batch_rows=100000, start_date=None, end_date=None,
+                 filters=None):
+    # Même scan que load_features, en RecordBatch successifs : mémoire bornée par batch_rows
+    scanner = open_dataset(store_dir).scanner(
+        columns=columns, filter=filter_expression(start_date, end_date, filters), batch_size=batch_rows
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch
+
+
+def training_columns():
+    return FEATURE_ORDER + [LABEL_COLUMN]
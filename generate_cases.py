@@ -1,26 +1,52 @@
+import argparse
+import os
 import sqlite3
 import random
+import time
 import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
+from case_profiles import DEVICE_TYPES, PROFILES, SAMPLES_PER_CASE, START_DAYS_AGO, VALUE_RANGES
+from migrations import TABLES_VERSION, migrate, reset_schema
+from feature_extractor import (
+    DEVICE_ENCODING, FEATURE_ORDER, FIELD_METRICS, FIELD_NAMES, INTEGER_FEATURES,
+    compute_feature_matrix, field_order_deviation
+)
 
 # ==== CONFIGURATION ====
 DB_PATH = "tracking.db"
 
-SAMPLES_PER_CASE = {
-    "normal": 200,
-    "fast": 100,
-    "paste_abuse": 100,
-    "hesitant": 100,
-    "no_mouse": 100,
-    "strategic_fraud": 100,
-    "copy_safe": 100,
-    "mouse_but_fast": 100,
-    "hesitant_legit": 100,
-    "hybrid_confusing": 50
-}
-
-FIELD_NAMES = ["nom", "prenom", "cin", "adresse", "profession", "revenu", "montant", "duree"]
+# Colonne de la table fields pour chaque métrique du moteur de features
+FIELD_COLUMN_FOR_METRIC = {"delete": "delete_count"}
+
+# Mode rapide : sessions par bloc NumPy (un bloc = une tâche, une graine, une transaction)
+FAST_BLOCK_SESSIONS = 50000
+
+# Export d'entraînement : sessions lues (et features calculées) par tranche
+EXPORT_CHUNK_SESSIONS = 50000
+
+# Métriques tirées par champ (clés des plages de case_profiles.PROFILES[...]["field"])
+FIELD_DRAWS = ("time", "deletes", "changes", "paste", "copy")
+
+SESSION_INSERT_COLUMNS = [
+    "session_id", "start_time", "end_time", "mouseMoved", "mouseClickCount", "scrollCount",
+    "viewportChanges", "tabCount", "enterPressed", "deviceType", "fieldFocusOrder", "label"
+]
+FIELD_INSERT_COLUMNS = [
+    "session_id", "field_name", "value", "timeSpentMs", "hoverDurationMs", "copy", "paste",
+    "delete_count", "changes", "focusCount"
+]
+INSERT_SESSION_SQL = (
+    f"INSERT INTO sessions ({', '.join(SESSION_INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in SESSION_INSERT_COLUMNS)})"
+)
+INSERT_FIELD_SQL = (
+    f"INSERT INTO fields ({', '.join(FIELD_INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in FIELD_INSERT_COLUMNS)})"
+)
 
 # ==== DONNÉES FAKE TUNISIENNES ====
 tunisian_first_names = ["Ahmed", "Sana", "Khalil", "Fatma", "Nour", "Anis", "Rania", "Yassine"]
@@ -38,314 +64,438 @@ def fake_profession():
     return random.choice(tunisian_professions)
 
 def fake_city():
-    rue = f"Rue {random.randint(1, 200)}"
+    rue = f"Rue {random.randint(*VALUE_RANGES['rue'])}"
     ville = random.choice(tunisian_cities)
     return f"{rue}, {ville}"
 
 def fake_cin():
-    return f"{random.randint(10000000, 99999999)}"
+    return f"{random.randint(*VALUE_RANGES['cin'])}"
+
+def fake_values():
+    return {
+        "nom": fake_name(),
+        "prenom": fake_first_name(),
+        "cin": fake_cin(),
+        "adresse": fake_city(),
+        "profession": fake_profession(),
+        "revenu": str(random.randint(*VALUE_RANGES["revenu"])),
+        "montant": str(random.randint(*VALUE_RANGES["montant"])),
+        "duree": str(random.randint(*VALUE_RANGES["duree"]))
+    }
 
 # ==== BASE DE DONNÉES ====
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     conn.execute("PRAGMA journal_mode = WAL")
     conn.execute("PRAGMA synchronous = NORMAL")
-    conn.executescript("""
-    DROP TABLE IF EXISTS fields;
-    DROP TABLE IF EXISTS sessions;
-
-    CREATE TABLE sessions (
-        session_id TEXT PRIMARY KEY,
-        start_time INTEGER NOT NULL,
-        end_time INTEGER NOT NULL CHECK(end_time > start_time),
-        duration_ms INTEGER GENERATED ALWAYS AS (end_time - start_time) STORED,
-        mouseMoved INTEGER NOT NULL CHECK(mouseMoved IN (0,1)),
-        mouseClickCount INTEGER NOT NULL,
-        scrollCount INTEGER NOT NULL,
-        viewportChanges INTEGER DEFAULT 0,
-        tabCount INTEGER DEFAULT 0,
-        enterPressed INTEGER DEFAULT 0,
-        deviceType TEXT CHECK(deviceType IN ('desktop','mobile')),
-        fieldFocusOrder TEXT,
-        label INTEGER NOT NULL CHECK(label IN (0,1)),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE fields (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_id TEXT,
-        field_name TEXT,
-        value TEXT,
-        timeSpentMs INTEGER NOT NULL,
-        hoverDurationMs INTEGER DEFAULT 0,
-        copy INTEGER DEFAULT 0,
-        paste INTEGER DEFAULT 0,
-        delete_count INTEGER DEFAULT 0,
-        changes INTEGER DEFAULT 1,
-        focusCount INTEGER DEFAULT 1,
-        FOREIGN KEY(session_id) REFERENCES sessions(session_id) ON DELETE CASCADE
-    );
-    """)
+    # Base repartie de zéro au schéma unifié (migrations.py), sans index secondaires :
+    # ils sont construits une fois les sessions insérées (finish_db)
+    reset_schema(conn, TABLES_VERSION)
     return conn
 
+def finish_db(conn):
+    # Migrations restantes (index par session, période et label) en une passe après le chargement
+    migrate(conn)
+
 # ==== UTILS ====
+def draw(bounds):
+    return random.randint(*bounds)
+
 def permute_order_for_case(case_type):
+    profile = PROFILES[case_type]
     order = FIELD_NAMES[:]
-    if case_type == "hesitant":
-        swaps = random.randint(1, 3)
-        for _ in range(swaps):
-            i, j = random.sample(range(len(order)), 2)
-            order[i], order[j] = order[j], order[i]
-    elif case_type in ("fast", "paste_abuse"):
-        if random.random() < 0.4:
+    if profile["order_shuffle"]:
+        random.shuffle(order)
+    elif profile["order_swap_prob"] > 0 and random.random() < profile["order_swap_prob"]:
+        for _ in range(draw(profile["order_swaps"])):
             i, j = random.sample(range(len(order)), 2)
             order[i], order[j] = order[j], order[i]
-    elif case_type == "hybrid_confusing":
-        random.shuffle(order)
     return ",".join(order)
 
-def scroll_by_case(case_type):
-    if case_type == "fast":
-        return random.randint(0, 5)
-    if case_type == "no_mouse":
-        return random.randint(0, 2)
-    if case_type == "normal":
-        return random.randint(5, 20)
-    if case_type == "paste_abuse":
-        return random.randint(5, 25)
-    if case_type == "hesitant":
-        return random.randint(15, 60)
-    return 0
-
-def viewport_by_case(case_type):
-    if case_type in ("normal", "hesitant"):
-        return random.randint(0, 2)
-    if case_type in ("fast", "no_mouse", "paste_abuse"):
-        return random.randint(0, 1)
-    return 0
-
-def mouse_clicks_by_case(case_type):
-    if case_type == "no_mouse":
-        return random.randint(0, 1)
-    if case_type == "fast":
-        return random.randint(1, 4)
-    if case_type == "paste_abuse":
-        return random.randint(3, 10)
-    if case_type == "hesitant":
-        return random.randint(5, 15)
-    return random.randint(3, 12)
-
-def field_time_by_case(case_type):
-    if case_type == "fast":
-        return random.randint(200, 900)
-    if case_type == "no_mouse":
-        return random.randint(800, 2000)
-    if case_type == "paste_abuse":
-        return random.randint(800, 2500)
-    if case_type == "hesitant":
-        return random.randint(2000, 6000)
-    return random.randint(1500, 4000)
-
-def deletes_by_case(case_type):
-    if case_type == "hesitant":
-        return random.randint(10, 25)
-    if case_type == "fast":
-        return random.randint(0, 1)
-    return random.randint(1, 5)
+def draw_field_metrics(field_cfg):
+    # Plages de base ; paste / copy valent 0 avec probabilité 1 - *_prob
+    metrics = {m: draw(field_cfg[m]) for m in ("time", "deletes", "changes")}
+    for m in ("paste", "copy"):
+        prob = field_cfg[m + "_prob"]
+        metrics[m] = draw(field_cfg[m]) if prob >= 1 or random.random() < prob else 0
+    return metrics
 
 # ==== GÉNÉRATION DES CAS ====
-def generate_case(conn, case_type):
-    params = {
-        "normal": {"duration": (30000, 90000), "mouse": 1, "tabs": 0, "label": 0},
-        "fast": {"duration": (3000, 7000), "mouse": 1, "tabs": 0, "label": 1},
-        "paste_abuse": {"duration": (10000, 20000), "mouse": 1, "tabs": 0, "label": 1},
-        "hesitant": {"duration": (60000, 120000), "mouse": 1, "tabs": 0, "label": 1},
-        "no_mouse": {"duration": (8000, 15000), "mouse": 0, "tabs": 3, "label": 1},
-        "strategic_fraud": {"duration": (40000, 70000), "mouse": 1, "tabs": 0, "label": 1},
-        "copy_safe": {"duration": (40000, 80000), "mouse": 1, "tabs": 0, "label": 0},
-        "mouse_but_fast": {"duration": (3000, 6000), "mouse": 1, "tabs": 0, "label": 1},
-        "hesitant_legit": {"duration": (60000, 120000), "mouse": 1, "tabs": 0, "label": 0},
-        "hybrid_confusing": {"duration": (45000, 90000), "mouse": 1, "tabs": 1, "label": 1}
-    }[case_type]
+def build_case(case_type):
+    # Une session simulée : (ligne sessions, lignes fields) sans toucher à la base
+    profile = PROFILES[case_type]
+    field_cfg = profile["field"]
 
     session_id = f"sess_{case_type}_{uuid.uuid4()}"
-    start = int((datetime.now() - timedelta(days=random.randint(1, 30))).timestamp() * 1000)
-    duration = random.randint(*params["duration"])
-    end = start + duration
-    scroll_count = scroll_by_case(case_type)
-    viewport_changes = viewport_by_case(case_type)
-    mouse_clicks = mouse_clicks_by_case(case_type)
-    enter_pressed = 1 if case_type == "no_mouse" else 0
-    device = random.choice(["desktop", "mobile"])
-    field_order = permute_order_for_case(case_type)
-
-    conn.execute("""
-    INSERT INTO sessions (
-        session_id, start_time, end_time, mouseMoved, mouseClickCount, scrollCount,
-        viewportChanges, tabCount, enterPressed, deviceType, fieldFocusOrder, label
-    )
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        session_id, start, end, params["mouse"], mouse_clicks, scroll_count,
-        viewport_changes, params["tabs"], enter_pressed, device, field_order, params["label"]
-    ))
-
-    paste_targets = set()
-    hesitant_fields = set()
+    start = int((datetime.now() - timedelta(days=draw(START_DAYS_AGO))).timestamp() * 1000)
+    end = start + draw(profile["duration"])
+
+    session = {
+        "session_id": session_id,
+        "start_time": start,
+        "end_time": end,
+        "mouseMoved": profile["mouse"],
+        "mouseClickCount": draw(profile["clicks"]),
+        "scrollCount": draw(profile["scroll"]),
+        "viewportChanges": draw(profile["viewport"]),
+        "tabCount": profile["tabs"],
+        "enterPressed": profile["enter"],
+        "deviceType": random.choice(DEVICE_TYPES),
+        "fieldFocusOrder": permute_order_for_case(case_type),
+        "label": profile["label"]
+    }
+
+    # Groupes de champs ciblés (collage, hésitation) : liste fixe ou k champs tirés
+    group_members = [
+        set(group["fields"]) if "fields" in group else set(random.sample(FIELD_NAMES, draw(group["k"])))
+        for group in field_cfg["groups"]
+    ]
+    values = fake_values()
 
-    if case_type == "hybrid_confusing":
-        paste_targets = set(random.sample(FIELD_NAMES, 3))
-        hesitant_fields = set(random.sample(FIELD_NAMES, 2))
+    field_rows = []
+    for field in FIELD_NAMES:
+        metrics = draw_field_metrics(field_cfg)
+        for group, members in zip(field_cfg["groups"], group_members):
+            if field in members:
+                metrics.update({m: draw(group[m]) for m in FIELD_DRAWS if m in group})
+
+        field_rows.append({
+            "session_id": session_id,
+            "field_name": field,
+            "value": values[field],
+            "timeSpentMs": metrics["time"],
+            "hoverDurationMs": 0,
+            "copy": metrics["copy"],
+            "paste": metrics["paste"],
+            "delete_count": metrics["deletes"],
+            "changes": metrics["changes"],
+            "focusCount": 1
+        })
+
+    return session, field_rows
 
-    if case_type == "strategic_fraud":
-        k = random.randint(3, 5)
-        paste_targets = set(random.sample(FIELD_NAMES, k))
+def generate_case(conn, case_type):
+    session, field_rows = build_case(case_type)
+    conn.execute(INSERT_SESSION_SQL, [session[c] for c in SESSION_INSERT_COLUMNS])
+    conn.executemany(INSERT_FIELD_SQL, [[f[c] for c in FIELD_INSERT_COLUMNS] for f in field_rows])
+
+# ==== GÉNÉRATION VECTORISÉE (MODE RAPIDE) ====
+def integers(rng, bounds, size):
+    return rng.integers(bounds[0], bounds[1] + 1, size=size)
+
+def focus_orders_block(profile, n, rng):
+    # Permutations (n, n_fields) puis une chaîne par permutation distincte seulement
+    n_fields = len(FIELD_NAMES)
+    order = np.tile(np.arange(n_fields), (n, 1))
+    if profile["order_shuffle"]:
+        order = rng.permuted(order, axis=1)
+    elif profile["order_swap_prob"] > 0:
+        swaps = np.where(rng.random(n) < profile["order_swap_prob"], integers(rng, profile["order_swaps"], n), 0)
+        for r in range(swaps.max(initial=0)):
+            rows = np.flatnonzero(swaps > r)
+            i = rng.integers(0, n_fields, len(rows))
+            j = (i + rng.integers(1, n_fields, len(rows))) % n_fields
+            order[rows, i], order[rows, j] = order[rows, j], order[rows, i]
+    unique_orders, inverse = np.unique(order, axis=0, return_inverse=True)
+    labels = np.array([",".join(FIELD_NAMES[k] for k in row) for row in unique_orders], dtype=object)
+    return labels[inverse.ravel()]
+
+def fake_values_block(n, rng):
+    # Colonnes de valeurs (n,) par champ, mêmes tirages que fake_values()
+    rue = integers(rng, VALUE_RANGES["rue"], n).astype(str)
+    ville = rng.choice(tunisian_cities, n)
+    return {
+        "nom": rng.choice(tunisian_last_names, n),
+        "prenom": rng.choice(tunisian_first_names, n),
+        "cin": integers(rng, VALUE_RANGES["cin"], n).astype(str),
+        "adresse": np.char.add(np.char.add("Rue ", rue), np.char.add(", ", ville)),
+        "profession": rng.choice(tunisian_professions, n),
+        "revenu": integers(rng, VALUE_RANGES["revenu"], n).astype(str),
+        "montant": integers(rng, VALUE_RANGES["montant"], n).astype(str),
+        "duree": integers(rng, VALUE_RANGES["duree"], n).astype(str)
+    }
+
+def build_block(case_type, n, rng, now_ms, id_prefix):
+    # n sessions d'un profil en tableaux NumPy : (DataFrame sessions, DataFrame fields)
+    profile = PROFILES[case_type]
+    field_cfg = profile["field"]
+    n_fields = len(FIELD_NAMES)
+
+    session_ids = np.array([f"{id_prefix}_{i}" for i in range(n)], dtype=object)
+    start = now_ms - integers(rng, START_DAYS_AGO, n) * 86_400_000
+    sessions = pd.DataFrame({
+        "session_id": session_ids,
+        "start_time": start,
+        "end_time": start + integers(rng, profile["duration"], n),
+        "mouseMoved": profile["mouse"],
+        "mouseClickCount": integers(rng, profile["clicks"], n),
+        "scrollCount": integers(rng, profile["scroll"], n),
+        "viewportChanges": integers(rng, profile["viewport"], n),
+        "tabCount": profile["tabs"],
+        "enterPressed": profile["enter"],
+        "deviceType": rng.choice(DEVICE_TYPES, n),
+        "fieldFocusOrder": focus_orders_block(profile, n, rng),
+        "label": profile["label"]
+    }, columns=SESSION_INSERT_COLUMNS)
+
+    # Métriques (n, n_fields) : plages de base, probabilités paste / copy, puis groupes
+    metrics = {m: integers(rng, field_cfg[m], (n, n_fields)) for m in FIELD_DRAWS}
+    for m in ("paste", "copy"):
+        prob = field_cfg[m + "_prob"]
+        if prob < 1:
+            metrics[m] = np.where(rng.random((n, n_fields)) < prob, metrics[m], 0)
+    for group in field_cfg["groups"]:
+        if "fields" in group:
+            members = np.broadcast_to(np.isin(FIELD_NAMES, group["fields"]), (n, n_fields))
+        else:
+            # k champs distincts par session : rang d'un tirage uniforme < k
+            ranks = rng.random((n, n_fields)).argsort(axis=1).argsort(axis=1)
+            members = ranks < integers(rng, group["k"], n)[:, None]
+        for m in FIELD_DRAWS:
+            if m in group:
+                metrics[m] = np.where(members, integers(rng, group[m], (n, n_fields)), metrics[m])
+
+    values = fake_values_block(n, rng)
+    fields = pd.DataFrame({
+        "session_id": np.repeat(session_ids, n_fields),
+        "field_name": np.tile(np.array(FIELD_NAMES, dtype=object), n),
+        "value": np.column_stack([values[f] for f in FIELD_NAMES]).astype(object).ravel(),
+        "timeSpentMs": metrics["time"].ravel(),
+        "hoverDurationMs": 0,
+        "copy": metrics["copy"].ravel(),
+        "paste": metrics["paste"].ravel(),
+        "delete_count": metrics["deletes"].ravel(),
+        "changes": metrics["changes"].ravel(),
+        "focusCount": 1
+    }, columns=FIELD_INSERT_COLUMNS)
+    return sessions, fields
+
+def split_counts(total):
+    # Total réparti selon les proportions de SAMPLES_PER_CASE (reste sur les plus gros profils)
+    weight_sum = sum(SAMPLES_PER_CASE.values())
+    counts = {case: total * w // weight_sum for case, w in SAMPLES_PER_CASE.items()}
+    for case in sorted(SAMPLES_PER_CASE, key=SAMPLES_PER_CASE.get, reverse=True)[:total - sum(counts.values())]:
+        counts[case] += 1
+    return counts
+
+def plan_blocks(counts, block_size=FAST_BLOCK_SESSIONS):
+    # Découpage fixe : les graines dépendent du bloc, pas du nombre de processus
+    return [
+        (case, min(block_size, count - offset))
+        for case, count in counts.items()
+        for offset in range(0, count, block_size)
+    ]
 
-    if case_type == "paste_abuse":
-        k = random.randint(3, 6)
-        paste_targets = set(random.sample(FIELD_NAMES, k))
+def generate_block(task):
+    # Exécuté dans un processus du pool ; écrit ses fichiers Parquet ou renvoie les DataFrames
+    block_id, case_type, n, seed_seq, now_ms, parquet_dir = task
+    rng = np.random.default_rng(seed_seq)
+    run_tag = f"{seed_seq.entropy:x}"[-8:]
+    sessions, fields = build_block(case_type, n, rng, now_ms, f"sess_{case_type}_{run_tag}{block_id:05d}")
+    if parquet_dir:
+        sessions.to_parquet(os.path.join(parquet_dir, "sessions", f"part-{block_id:05d}.parquet"), index=False)
+        fields.to_parquet(os.path.join(parquet_dir, "fields", f"part-{block_id:05d}.parquet"), index=False)
+        return block_id, len(sessions), len(fields), None
+    return block_id, len(sessions), len(fields), (sessions, fields)
+
+def rows_of(df):
+    # Tuples de scalaires Python (sqlite3 ne lie pas les entiers NumPy)
+    return zip(*(df[column].tolist() for column in df.columns))
+
+def generate_fast(counts, workers=None, seed=None, block_size=FAST_BLOCK_SESSIONS, conn=None, parquet_dir=None):
+    # Blocs NumPy répartis sur un pool de processus, graines dérivées d'une SeedSequence :
+    # même graine => mêmes données, quel que soit le nombre de processus.
+    # Sortie : executemany dans conn (un bloc = une transaction) ou Parquet (un fichier par bloc).
+    blocks = plan_blocks(counts, block_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    now_ms = int(datetime.now().timestamp() * 1000)
+    if parquet_dir:
+        for table in ("sessions", "fields"):
+            os.makedirs(os.path.join(parquet_dir, table), exist_ok=True)
+    tasks = [
+        (block_id, case, n, seeds[block_id], now_ms, parquet_dir)
+        for block_id, (case, n) in enumerate(blocks)
+    ]
 
-    for field in FIELD_NAMES:
-        val = {
-            "nom": fake_name(),
-            "prenom": fake_first_name(),
-            "cin": fake_cin(),
-            "adresse": fake_city(),
-            "profession": fake_profession(),
-            "revenu": str(random.randint(1200, 5000)),
-            "montant": str(random.randint(1000, 15000)),
-            "duree": str(random.randint(6, 60))
-        }[field]
-
-        time_spent = field_time_by_case(case_type)
-        deletes = deletes_by_case(case_type)
-        paste = 0
-        copy = 0
-        changes = random.randint(1, 5)
-
-        if case_type == "hybrid_confusing":
-            if field in paste_targets:
-                paste = random.randint(5, 8)
-                copy = random.randint(0, 2)
-            if field in hesitant_fields:
-                time_spent = random.randint(3000, 6000)
-                deletes = random.randint(3, 8)
-                changes = random.randint(3, 6)
-
-        if case_type == "strategic_fraud":
-            if field in paste_targets:
-                paste = random.randint(6, 10)
-                copy = random.randint(0, 2)
-
-        elif case_type == "copy_safe":
-            # Collage modéré sur certains champs seulement
-            if field in ["cin", "adresse", "profession"]:
-                paste = random.randint(2, 4)
-                copy = random.randint(1, 3)
-            else:
-                paste = 0
-                copy = random.randint(0, 1)
-            # Temps de saisie réaliste pour montrer prudence
-            time_spent = random.randint(3000, 6000)
-            deletes = random.randint(0, 2)
-            changes = random.randint(1, 3)
-
-        elif case_type == "mouse_but_fast":
-            paste = random.randint(0, 1)
-            copy = random.randint(0, 1)
-
-        elif case_type == "hesitant_legit":
-            paste = 0
-            copy = 0
-
-        elif case_type == "paste_abuse" and field in paste_targets:
-            paste = random.randint(6, 10)
-            copy = random.randint(0, 2)
-
-        elif case_type == "no_mouse":
-            paste = random.randint(3, 5) if random.random() < 0.4 else 0
-
-        elif case_type == "normal":
-            paste = random.randint(0, 1)
-            if copy == 0 and random.random() < 0.05:
-                copy = 1
-
-        if case_type == "hesitant":
-            changes = random.randint(3, 10)
-
-        conn.execute("""
-        INSERT INTO fields (
-            session_id, field_name, value, timeSpentMs, hoverDurationMs, copy, paste, delete_count, changes, focusCount
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (session_id, field, val, time_spent, 0, copy, paste, deletes, changes, 1))
+    workers = workers or os.cpu_count() or 1
+    total_sessions = total_fields = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        # Fenêtre bornée : au plus 2 blocs en attente par processus (mémoire constante)
+        pending = deque()
+        next_task = 0
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < 2 * workers:
+                pending.append(pool.submit(generate_block, tasks[next_task]))
+                next_task += 1
+            block_id, n_sessions, n_fields, frames = pending.popleft().result()
+            if frames is not None:
+                sessions, fields = frames
+                with conn:
+                    conn.executemany(INSERT_SESSION_SQL, rows_of(sessions))
+                    conn.executemany(INSERT_FIELD_SQL, rows_of(fields))
+            total_sessions += n_sessions
+            total_fields += n_fields
+            print(f"🧱 Bloc {block_id + 1}/{len(tasks)} ({tasks[block_id][1]}) : {total_sessions} sessions")
+
+    elapsed = time.perf_counter() - started
+    print(f"⚡ {total_sessions} sessions / {total_fields} champs en {elapsed:.1f} s "
+          f"({total_sessions / elapsed:.0f} sessions/s, {workers} processus)")
+    return total_sessions, total_fields
+
+def case_to_payload(session, field_rows, submit_delay_ms=800):
+    # Session simulée -> payload au format envoyé par static/tracking.js
+    return {
+        "session_id": session["session_id"],
+        "start_time": session["start_time"],
+        "end_time": session["end_time"],
+        "duration_ms": session["end_time"] - session["start_time"],
+        "submit_delay_ms": submit_delay_ms,
+        "fast_fill": session["end_time"] - session["start_time"] < 8000,
+        "mouseMoved": bool(session["mouseMoved"]),
+        "mouseClickCount": session["mouseClickCount"],
+        "scrollCount": session["scrollCount"],
+        "viewportChanges": session["viewportChanges"],
+        "tabKeyCount": session["tabCount"],
+        "enterPressed": bool(session["enterPressed"]),
+        "deviceType": session["deviceType"],
+        "field_order": session["fieldFocusOrder"].split(","),
+        "fields": {
+            f["field_name"]: {
+                "value": f["value"],
+                "timeSpentMs": f["timeSpentMs"],
+                "hoverDurationMs": f["hoverDurationMs"],
+                "copy": f["copy"],
+                "paste": f["paste"],
+                "delete": f["delete_count"],
+                "changes": f["changes"],
+                "focusCount": f["focusCount"]
+            } for f in field_rows
+        }
+    }
 
 # ==== EXPORT FINAL POUR ENTRAÎNEMENT ====
-def export_csv(conn):
+def build_feature_frame(sessions_df, fields_df, metadata_columns=()):
+    # Même moteur colonnaire que /api/predict (feature_extractor.compute_feature_matrix) ;
+    # metadata_columns : colonnes de sessions recopiées en tête (feature store)
+    session_index = pd.Categorical(fields_df["session_id"], categories=sessions_df["session_id"]).codes
+    fields_df = fields_df[session_index >= 0]
+    session_index = session_index[session_index >= 0]
+
+    counts = np.bincount(session_index, minlength=len(sessions_df))
+    position = fields_df.groupby(session_index).cumcount().to_numpy()
+    packed = np.zeros((len(sessions_df), counts.max(initial=0), len(FIELD_METRICS)))
+    metric_columns = [FIELD_COLUMN_FOR_METRIC.get(m, m) for m in FIELD_METRICS]
+    packed[session_index, position] = fields_df[metric_columns].to_numpy(dtype=np.float64)
+
+    session_matrix = np.column_stack([
+        sessions_df["duration_ms"],
+        sessions_df["mouseClickCount"],
+        sessions_df["scrollCount"],
+        sessions_df["viewportChanges"],
+        sessions_df["tabCount"],
+        sessions_df["enterPressed"],
+        sessions_df["deviceType"].map(DEVICE_ENCODING).fillna(DEVICE_ENCODING["unknown"]),
+        sessions_df["fieldFocusOrder"].map(field_order_deviation)
+    ]).astype(np.float64)
+
+    # Sessions sans champ exclues (comme l'ancien merge inner)
+    keep = counts > 0
+    features = compute_feature_matrix(packed[keep], counts[keep], session_matrix[keep])
+    df = pd.DataFrame(features, columns=FEATURE_ORDER)
+    df[INTEGER_FEATURES] = df[INTEGER_FEATURES].astype(np.int64)
+    df["label_target"] = sessions_df["label"].to_numpy()[keep]
+    for column in reversed(metadata_columns):
+        df.insert(0, column, sessions_df[column].to_numpy()[keep])
+    return df
+
+def field_metric_columns():
+    return ", ".join(f"f.{FIELD_COLUMN_FOR_METRIC.get(m, m)}" for m in FIELD_METRICS)
+
+def session_feature_frame(conn, session_ids, metadata_columns=()):
+    # Features de sessions désignées (ré-enregistrées depuis le dernier passage du feature store)
+    marks = ", ".join("?" * len(session_ids))
+    sessions_df = pd.read_sql_query(
+        f"SELECT * FROM sessions WHERE session_id IN ({marks}) AND label IS NOT NULL ORDER BY rowid",
+        conn, params=list(session_ids)
+    )
+    fields_df = pd.read_sql_query(
+        f"SELECT f.session_id, {field_metric_columns()} FROM fields f "
+        f"WHERE f.session_id IN ({marks}) ORDER BY f.session_id, f.id",
+        conn, params=list(session_ids)
+    )
+    return build_feature_frame(sessions_df, fields_df, metadata_columns)
+
+def iter_feature_chunks(conn, chunk_sessions=EXPORT_CHUNK_SESSIONS, after_rowid=None, metadata_columns=()):
+    # Sessions par tranches de rowid (ordre d'insertion, comme SELECT * FROM sessions) ; les
+    # champs de la tranche arrivent par l'index (session_id, id) déjà triés comme ORDER BY id.
+    # Produit (dernier rowid de la tranche, DataFrame) ; after_rowid : reprise incrémentale.
+    # Sessions sans label (enregistrées par app.py) exclues : rien à apprendre d'elles
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fields_session ON fields(session_id, id)")
+    fields_sql = (
+        f"SELECT f.session_id, {field_metric_columns()} FROM sessions s "
+        "JOIN fields f ON f.session_id = s.session_id "
+        "WHERE s.rowid > ? AND s.rowid <= ? AND s.label IS NOT NULL ORDER BY s.rowid, f.id"
+    )
+    last_rowid = -2 ** 63 if after_rowid is None else after_rowid
+    while True:
+        sessions_df = pd.read_sql_query(
+            "SELECT rowid AS session_rowid, * FROM sessions WHERE rowid > ? AND label IS NOT NULL "
+            "ORDER BY rowid LIMIT ?",
+            conn, params=(last_rowid, chunk_sessions)
+        )
+        if sessions_df.empty:
+            return
+        chunk_end = int(sessions_df["session_rowid"].iloc[-1])
+        fields_df = pd.read_sql_query(fields_sql, conn, params=(last_rowid, chunk_end))
+        yield chunk_end, build_feature_frame(sessions_df, fields_df, metadata_columns)
+        last_rowid = chunk_end
+
+def export_csv(conn, path="kyc_dataset_ready.csv", chunk_sessions=EXPORT_CHUNK_SESSIONS):
+    # Mémoire bornée par la taille de tranche, quel que soit le volume de la base
     print("\n📦 Construction du dataset enrichi...")
-    sessions_df = pd.read_sql_query("SELECT * FROM sessions", conn)
-    fields_df = pd.read_sql_query("SELECT * FROM fields", conn)
-
-    # Agrégations de base
-    agg_fields = fields_df.groupby("session_id").agg(
-        fieldCount=("field_name", "count"),
-        totalTimeSpent=("timeSpentMs", "sum"),
-        avgTimePerField=("timeSpentMs", "mean"),
-        totalFocusCount=("focusCount", "sum"),
-        avgChangesPerField=("changes", "mean"),
-        avgPastePerField=("paste", "mean"),
-        avgDeletePerField=("delete_count", "mean")
-    ).reset_index()
-
-    # 🔍 Ajout des nouvelles features comportementales
-    std_time = fields_df.groupby("session_id")["timeSpentMs"].std().fillna(0)
-    max_paste = fields_df.groupby("session_id")["paste"].max().fillna(0)
-    paste_ratio = fields_df.groupby("session_id").apply(lambda g: (g["paste"] > 0).sum() / len(g)).fillna(0)
-    delete_ratio = fields_df.groupby("session_id").apply(lambda g: (g["delete_count"] > 0).sum() / len(g)).fillna(0)
-
-    # Fusion avec agg_fields
-    agg_fields["stdTimePerField"] = agg_fields["session_id"].map(std_time)
-    agg_fields["maxPasteCount"] = agg_fields["session_id"].map(max_paste)
-    agg_fields["pasteRatio"] = agg_fields["session_id"].map(paste_ratio)
-    agg_fields["deleteRatio"] = agg_fields["session_id"].map(delete_ratio)
-
-    # Merge avec sessions
-    df = sessions_df.merge(agg_fields, on="session_id")
-    df["deviceType_encoded"] = df["deviceType"].map({"desktop": 0, "mobile": 1}).fillna(0).astype(int)
-
-    def calc_deviation(order_str):
-        ref_order = FIELD_NAMES
-        try:
-            actual_order = order_str.split(",")
-            if len(actual_order) != len(ref_order):
-                return len(ref_order)
-            return sum(1 for i, j in zip(ref_order, actual_order) if i != j)
-        except Exception:
-            return len(FIELD_NAMES)
-
-    df["fieldOrderDeviation"] = df["fieldFocusOrder"].apply(calc_deviation)
-    df["label_target"] = df["label"]
-    df["scrollDensity"] = df["scrollCount"] / (df["duration_ms"] / 1000 + 1e-5)
-
-    final_features = [
-        "duration_ms", "mouseClickCount", "scrollCount", "scrollDensity", "viewportChanges",
-        "tabCount", "enterPressed", "deviceType_encoded", "fieldCount", "totalTimeSpent",
-        "avgTimePerField", "totalFocusCount", "avgChangesPerField", "avgPastePerField",
-        "avgDeletePerField", "fieldOrderDeviation", "stdTimePerField", "maxPasteCount",
-        "pasteRatio", "deleteRatio", "label_target"
-    ]
-
-    df[final_features].to_csv("kyc_dataset_ready.csv", index=False)
-    print("✅ Export CSV prêt pour entraînement : kyc_dataset_ready.csv")
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, (_, df) in enumerate(iter_feature_chunks(conn, chunk_sessions)):
+            df.to_csv(f, header=i == 0, index=False)
+            rows += len(df)
+        if rows == 0:
+            pd.DataFrame(columns=FEATURE_ORDER + ["label_target"]).to_csv(f, index=False)
+    print(f"✅ Export CSV prêt pour entraînement : {path} ({rows} sessions)")
 
 # ==== MAIN ====
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génération de sessions KYC simulées")
+    parser.add_argument("--sessions", type=int, default=None,
+                        help="total réparti selon SAMPLES_PER_CASE (défaut : %d)" % sum(SAMPLES_PER_CASE.values()))
+    parser.add_argument("--fast", action="store_true", help="blocs NumPy vectorisés sur plusieurs processus")
+    parser.add_argument("--workers", type=int, default=None, help="processus du mode rapide (défaut : nombre de CPU)")
+    parser.add_argument("--block-size", type=int, default=FAST_BLOCK_SESSIONS)
+    parser.add_argument("--seed", type=int, default=None, help="graine pour des données reproductibles")
+    parser.add_argument("--parquet", metavar="DIR", default=None,
+                        help="mode rapide : écrit DIR/sessions et DIR/fields en Parquet au lieu de tracking.db")
+    parser.add_argument("--no-export", action="store_true", help="ne pas construire kyc_dataset_ready.csv")
+    args = parser.parse_args()
+
+    counts = split_counts(args.sessions) if args.sessions is not None else dict(SAMPLES_PER_CASE)
+
     print("\n=== Génération de données 100% tunisiennes ===")
-    conn = init_db()
-    for case, count in SAMPLES_PER_CASE.items():
-        print(f"🔄 Génération du cas : {case} ({count} sessions)")
-        for _ in range(count):
-            generate_case(conn, case)
-    conn.commit()
-    export_csv(conn)
-    conn.close()
+    if args.fast and args.parquet:
+        generate_fast(counts, args.workers, args.seed, args.block_size, parquet_dir=args.parquet)
+        print(f"✅ Parquet écrit dans {args.parquet}/sessions et {args.parquet}/fields")
+    else:
+        conn = init_db()
+        if args.fast:
+            generate_fast(counts, args.workers, args.seed, args.block_size, conn=conn)
+        else:
+            if args.seed is not None:
+                random.seed(args.seed)
+            for case, count in counts.items():
+                print(f"🔄 Génération du cas : {case} ({count} sessions)")
+                for _ in range(count):
+                    generate_case(conn, case)
+            conn.commit()
+        finish_db(conn)
+        if not args.no_export:
+            export_csv(conn)
+        conn.close()
@@ -1,8 +1,10 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import joblib
 from datetime import datetime
-import os
+from model_runtime import MODEL_PATH
+from prediction_history import PredictionHistory
 
 # ==== CONFIGURATION ====
 FEATURES = [
@@ -13,10 +15,24 @@ FEATURES = [
     "fieldOrderDeviation", "stdTimePerField", "maxPasteCount", "pasteRatio",
     "deleteRatio"
 ]
-HISTORY_PATH = "prediction_history.csv"
+HISTORY_ROWS = 10
+# Scoring en masse : lignes lues et scorées par appel à predict_proba
+BULK_CHUNK_ROWS = 50000
+# Colonnes recopiées dans le résultat si présentes dans le CSV
+BULK_ID_COLUMNS = ["session_id", "label_target"]
 
 # ==== CHARGEMENT DU MODÈLE ====
-xgb_model = joblib.load("kyc_xgb_model.pkl")
+# Chargé une seule fois par processus Streamlit, partagé entre reruns et sessions
+@st.cache_resource
+def load_xgb_model(path=MODEL_PATH):
+    return joblib.load(path)
+
+@st.cache_resource
+def load_history():
+    return PredictionHistory()
+
+xgb_model = load_xgb_model()
+history = load_history()
 
 # ==== PAGE ====
 st.set_page_config(page_title="Détection KYC", page_icon="🔎")
@@ -32,6 +48,78 @@ preset = st.sidebar.selectbox("Choisir un profil simulé", [
 # Slider de seuil
 threshold = st.sidebar.slider("⚖️ Seuil de décision", 0.0, 1.0, 0.5, 0.01)
 
+mode = st.sidebar.radio("🧭 Mode", ["Session unique", "Scoring CSV en masse"])
+
+# ==== SCORING CSV EN MASSE ====
+def score_csv(uploaded, progress):
+    # Lecture par morceaux (features en float32) : un predict_proba par morceau, seuls les scores sont gardés
+    header = pd.read_csv(uploaded, nrows=0).columns
+    missing = [col for col in FEATURES if col not in header]
+    if missing:
+        raise ValueError(f"Colonnes manquantes : {missing}")
+    uploaded.seek(0)
+    kept = [col for col in BULK_ID_COLUMNS if col in header]
+    scores, extras = [], {col: [] for col in kept}
+    reader = pd.read_csv(uploaded, usecols=FEATURES + kept, dtype={col: np.float32 for col in FEATURES},
+                         chunksize=BULK_CHUNK_ROWS)
+    for chunk in reader:
+        scores.append(xgb_model.predict_proba(chunk[FEATURES])[:, 1].astype(np.float32))
+        for col in kept:
+            extras[col].append(chunk[col].to_numpy())
+        rows = sum(len(part) for part in scores)
+        progress.progress(min(uploaded.tell() / max(uploaded.size, 1), 1.0), text=f"{rows} sessions scorées")
+    result = {col: np.concatenate(parts) for col, parts in extras.items()}
+    result["score"] = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+    return result
+
+# Résultat reconstruit seulement quand le fichier ou le seuil change ; jamais de nouvel appel au modèle
+@st.cache_data(max_entries=4)
+def bulk_result_csv(file_id, threshold, _result):
+    df = pd.DataFrame(_result)
+    df["prediction"] = (df["score"] > threshold).astype(np.int8)
+    return df.to_csv(index=False, float_format="%.6f")
+
+if mode == "Scoring CSV en masse":
+    st.subheader("📂 Scoring d'un fichier de sessions")
+    st.markdown("CSV au format de `kyc_dataset_ready.csv` (20 features ; `session_id` et `label_target` recopiés s'ils sont présents).")
+    uploaded = st.file_uploader("Fichier CSV", type="csv")
+    if uploaded is not None:
+        bulk = st.session_state.get("bulk")
+        if bulk is None or bulk["file_id"] != uploaded.file_id:
+            if st.button("🚀 Scorer le fichier"):
+                progress = st.progress(0.0, text="Scoring...")
+                try:
+                    st.session_state["bulk"] = {"file_id": uploaded.file_id, "name": uploaded.name,
+                                                "result": score_csv(uploaded, progress)}
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                progress.empty()
+                bulk = st.session_state.get("bulk")
+
+        if bulk is not None and bulk["file_id"] == uploaded.file_id:
+            # Le seuil de la barre latérale s'applique aux scores déjà calculés
+            scores = bulk["result"]["score"]
+            suspects = int((scores > threshold).sum())
+            st.success(f"✅ {len(scores)} sessions scorées")
+            col1, col2 = st.columns(2)
+            col1.metric("⚠️ Suspects", suspects)
+            col2.metric("📊 Taux de suspicion", f"{suspects / max(len(scores), 1):.1%}")
+            if "label_target" in bulk["result"]:
+                y_true = bulk["result"]["label_target"].astype(np.int64)
+                y_pred = (scores > threshold).astype(np.int64)
+                cm = np.zeros((2, 2), dtype=np.int64)
+                np.add.at(cm, (y_true.clip(0, 1), y_pred), 1)
+                st.write(f"Matrice de confusion au seuil {threshold} (lignes : réel Normal/Fraude, colonnes : prédit)")
+                st.dataframe(pd.DataFrame(cm, index=["Normal", "Fraude"], columns=["Normal", "Fraude"]))
+            st.bar_chart(np.histogram(scores, bins=20, range=(0, 1))[0])
+            st.download_button(
+                "📥 Télécharger les scores CSV",
+                data=bulk_result_csv(bulk["file_id"], threshold, bulk["result"]),
+                file_name=f"scores_{bulk['name']}",
+                mime="text/csv"
+            )
+    st.stop()
+
 def get_preset_values(profile):
     if profile == "hybrid_confusing":
         return {
@@ -147,12 +235,8 @@ def save_prediction(data, pred, proba):
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "profil": preset
     })
-    if os.path.exists(HISTORY_PATH):
-        df = pd.read_csv(HISTORY_PATH)
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    else:
-        df = pd.DataFrame([row])
-    df.to_csv(HISTORY_PATH, index=False)
+    # Une insertion, sans relire l'historique
+    history.append(row)
 
 # ==== PRÉDICTION ====
 if submitted:
@@ -179,7 +263,7 @@ if submitted:
         "deleteRatio": deleteRatio
     }
     X_input = pd.DataFrame([input_data])
-    proba_xgb = xgb_model.predict_proba(X_input)[0][1]  # probabilité que ce soit suspect
+    proba_xgb = float(xgb_model.predict_proba(X_input)[0][1])  # probabilité que ce soit suspect
     pred_xgb = int(proba_xgb > threshold)
 
     st.success("✅ Prédiction effectuée avec succès !")
@@ -195,18 +279,27 @@ if submitted:
 # ==== HISTORIQUE ====
 st.markdown("---")
 st.subheader("📁 Historique des prédictions")
-if os.path.exists(HISTORY_PATH):
-    df_log = pd.read_csv(HISTORY_PATH)
-    st.dataframe(df_log.tail(10), use_container_width=True)
-    st.download_button(
-        "📥 Télécharger l'historique CSV",
-        data=df_log.to_csv(index=False),
-        file_name="historique_predictions.csv",
-        mime="text/csv"
-    )
+last_id = history.last_id()
+if last_id is not None:
+    st.dataframe(history.tail(HISTORY_ROWS), use_container_width=True)
+    # Export complet construit sur demande seulement (table entière) : une prédiction ne le relance pas
+    if st.button("📦 Préparer l'export CSV"):
+        st.session_state["history_export"] = (last_id, history.export_csv())
+    export = st.session_state.get("history_export")
+    if export is not None:
+        export_id, export_csv = export
+        if export_id != last_id:
+            st.caption("Export préparé avant les dernières prédictions : préparez-le à nouveau pour les inclure.")
+        st.download_button(
+            "📥 Télécharger l'historique CSV",
+            data=export_csv,
+            file_name="historique_predictions.csv",
+            mime="text/csv"
+        )
     if st.button("🧹 Réinitialiser l'historique"):
-        os.remove(HISTORY_PATH)
+        history.clear()
+        st.session_state.pop("history_export", None)
         st.success("Historique supprimé.")
-        st.experimental_rerun()
+        st.rerun()
 else:
     st.info("Aucune prédiction enregistrée pour l’instant.")
@@ -0,0 +1,124 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+
+# ==== CONFIGURATION ====
+# DEBUG active les dumps de payload / features ; INFO (défaut) les coupe en production
+LOG_LEVEL = os.environ.get("KYC_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("KYC_LOG_FORMAT", "text")  # text | json
+LOG_FILE = os.environ.get("KYC_LOG_FILE")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(session_id)s] %(message)s%(timings_suffix)s"
+
+# Contexte de la requête en cours (un par thread / contexte Flask)
+_session_id = contextvars.ContextVar("session_id", default="-")
+_timings = contextvars.ContextVar("timings", default=None)
+
+_listener = None
+# Fonctions appelées avec (étape, secondes) à la fin de chaque stage() (ex. histogrammes /metrics)
+_stage_hooks = []
+
+
+# ==== CONTEXTE DE REQUÊTE ====
+def start_request(session_id="-"):
+    _session_id.set(session_id)
+    _timings.set({})
+
+
+def bind_session(session_id):
+    _session_id.set(session_id)
+
+
+def stage_timings():
+    return dict(_timings.get() or {})
+
+
+def add_stage_hook(hook):
+    _stage_hooks.append(hook)
+
+
+@contextmanager
+def stage(name):
+    # Chronomètre une étape ; la durée (ms) est jointe aux logs suivants de la requête
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = round(elapsed * 1000, 3)
+        for hook in _stage_hooks:
+            hook(name, elapsed)
+
+
+class ContextFilter(logging.Filter):
+    # Exécuté dans le thread de la requête : capture session_id et timings
+    def filter(self, record):
+        record.session_id = _session_id.get()
+        record.timings = stage_timings()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler.prepare formate le message dans le thread appelant ;
+    # ici le record part tel quel et le formatage se fait dans le thread du listener
+    def prepare(self, record):
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        timings = getattr(record, "timings", None)
+        record.timings_suffix = " " + " ".join(f"{k}={v}ms" for k, v in timings.items()) if timings else ""
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "session_id": getattr(record, "session_id", "-"),
+            "message": record.getMessage(),
+        }
+        timings = getattr(record, "timings", None)
+        if timings:
+            entry["timings_ms"] = timings
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, log_file=LOG_FILE):
+    # Loggers "kyc.*" -> file mémoire -> thread listener -> stderr (+ fichier optionnel)
+    global _listener
+    logger = logging.getLogger("kyc")
+    logger.setLevel(level)
+    if _listener is not None:
+        return logger
+
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    return logger
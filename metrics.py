@@ -0,0 +1,123 @@
+import threading
+from bisect import bisect_left
+
+# Compteurs / histogrammes en mémoire, exposés au format texte Prometheus sur /metrics.
+# Un observe() = un bisect + un verrou : ~1 µs, pas de dépendance externe.
+
+# Bornes en secondes, adaptées aux étapes sub-milliseconde comme aux requêtes entières
+DEFAULT_BUCKETS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+_registry = []
+_gauge_collectors = []
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = list(buckets)
+        self._series = {}  # labelvalues -> [counts par bucket (+Inf inclus), somme]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def register_gauges(collector):
+    # collector() -> liste de (nom, aide, valeur) lue au moment du scrape : niveaux (files, tailles)
+    _gauge_collectors.append((collector, "gauge"))
+
+
+def register_counters(collector):
+    # Même forme, pour les totaux monotones tenus ailleurs (noms en _total, rate() / increase())
+    _gauge_collectors.append((collector, "counter"))
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector, metric_type in _gauge_collectors:
+        for name, documentation, value in collector():
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ==== MÉTRIQUES DU CHEMIN CRITIQUE ====
+REQUESTS = Counter("kyc_http_requests_total", "Requêtes HTTP par endpoint et code", ["endpoint", "status"])
+REQUEST_DURATION = Histogram("kyc_http_request_duration_seconds", "Durée des requêtes HTTP", ["endpoint"])
+STAGE_DURATION = Histogram("kyc_stage_duration_seconds", "Durée de chaque étape du traitement", ["stage"])
+ERRORS = Counter("kyc_errors_total", "Erreurs par endpoint et type", ["endpoint", "type"])
+PREDICTIONS = Counter("kyc_predictions_total", "Prédictions par label (taux Suspicious = Suspicious / total)", ["label"])
+
+
+def observe_stage(name, seconds):
+    STAGE_DURATION.observe(seconds, name)
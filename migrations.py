@@ -0,0 +1,169 @@
+import logging
+
+logger = logging.getLogger("kyc.migrations")
+
+# ==== SCHÉMA UNIFIÉ ====
+# Mêmes tables pour le serveur (app.py / database.py) et le générateur (generate_cases.py) :
+# tabCount (ex-tabKeyCount côté serveur), label NULL pour les sessions réelles non étiquetées,
+# duration_ms calculée par SQLite.
+SESSIONS_TABLE_SQL = """
+CREATE TABLE {name} (
+    session_id TEXT PRIMARY KEY,
+    start_time INTEGER,
+    end_time INTEGER,
+    duration_ms INTEGER GENERATED ALWAYS AS (end_time - start_time) STORED,
+    submit_delay_ms INTEGER DEFAULT 0,
+    fast_fill INTEGER DEFAULT 0,
+    mouseMoved INTEGER DEFAULT 0,
+    mouseClickCount INTEGER DEFAULT 0,
+    scrollCount INTEGER DEFAULT 0,
+    viewportChanges INTEGER DEFAULT 0,
+    tabCount INTEGER DEFAULT 0,
+    enterPressed INTEGER DEFAULT 0,
+    deviceType TEXT,
+    fieldFocusOrder TEXT,
+    label INTEGER CHECK(label IN (0, 1)),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+FIELDS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS fields (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    field_name TEXT,
+    value TEXT,
+    timeSpentMs INTEGER DEFAULT 0,
+    hoverDurationMs INTEGER DEFAULT 0,
+    copy INTEGER DEFAULT 0,
+    paste INTEGER DEFAULT 0,
+    delete_count INTEGER DEFAULT 0,
+    changes INTEGER DEFAULT 1,
+    focusCount INTEGER DEFAULT 1,
+    FOREIGN KEY(session_id) REFERENCES sessions(session_id) ON DELETE CASCADE
+)
+"""
+
+SESSION_COLUMNS = [
+    "session_id", "start_time", "end_time", "duration_ms", "submit_delay_ms", "fast_fill",
+    "mouseMoved", "mouseClickCount", "scrollCount", "viewportChanges", "tabCount", "enterPressed",
+    "deviceType", "fieldFocusOrder", "label", "created_at"
+]
+GENERATED_COLUMNS = {"duration_ms"}
+
+# Anciens noms de colonnes (schéma serveur avant unification)
+LEGACY_COLUMNS = {"tabCount": "tabKeyCount"}
+
+# Index des requêtes chaudes : champs d'une session, sessions d'une période (session_id inclus :
+# les session_id à joindre à fields sont lus dans l'index, sans relire sessions)
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_fields_session ON fields(session_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start_time, session_id)",
+]
+
+# Exports filtrés par label, paginés sur session_id : label puis session_id dans l'ordre du
+# ORDER BY (pas de tri temporaire), start_time dans l'index pour filtrer la période sans relire
+# la ligne. Les SELECT * relisent toujours la table pour les colonnes restantes.
+LABEL_INDEXES = [
+    "DROP INDEX IF EXISTS idx_sessions_label",
+    "CREATE INDEX idx_sessions_label ON sessions(label, session_id, start_time)",
+]
+
+
+def table_columns(conn, table):
+    # table_xinfo : colonnes générées comprises
+    return [row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")]
+
+
+# ==== MIGRATIONS ====
+def unify_schema(conn):
+    # Base neuve : tables créées. Base existante (serveur ou générateur) : sessions reconstruite
+    # au schéma unifié en conservant lignes et rowid (curseurs du feature store) ; les colonnes
+    # absentes prennent leur valeur par défaut, les colonnes inconnues (scrollDensity) disparaissent.
+    columns = table_columns(conn, "sessions")
+    if not columns:
+        conn.execute(SESSIONS_TABLE_SQL.format(name="sessions"))
+    elif columns != SESSION_COLUMNS:
+        conn.execute(SESSIONS_TABLE_SQL.format(name="sessions_migration"))
+        copied = []
+        for column in SESSION_COLUMNS:
+            if column in GENERATED_COLUMNS:
+                continue
+            source = column if column in columns else LEGACY_COLUMNS.get(column)
+            if source in columns:
+                copied.append((column, source))
+        conn.execute(
+            f"INSERT INTO sessions_migration (rowid, {', '.join(c for c, _ in copied)}) "
+            f"SELECT rowid, {', '.join(s for _, s in copied)} FROM sessions"
+        )
+        conn.execute("DROP TABLE sessions")
+        conn.execute("ALTER TABLE sessions_migration RENAME TO sessions")
+    conn.execute(FIELDS_TABLE_SQL)
+
+
+def create_indexes(conn):
+    for sql in INDEXES:
+        conn.execute(sql)
+
+
+def create_label_index(conn):
+    for sql in LABEL_INDEXES:
+        conn.execute(sql)
+
+
+def add_revision(conn):
+    # Incrémentée à chaque ré-enregistrement : les caches de chaque worker la comparent à la leur
+    conn.execute("ALTER TABLE sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+
+# (version, description, étape) : une version publiée ne change plus, on en ajoute une nouvelle
+MIGRATIONS = [
+    (1, "schéma unifié serveur / générateur", unify_schema),
+    (2, "index par session et période", create_indexes),
+    (3, "index label compatible avec la pagination par session_id", create_label_index),
+    (4, "révision des sessions (invalidation des caches entre workers)", add_revision),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+# Tables sans index secondaires : cible des chargements en masse, indexés ensuite
+TABLES_VERSION = 1
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=SCHEMA_VERSION):
+    # Applique dans l'ordre les migrations au-delà de PRAGMA user_version, une transaction
+    # chacune. BEGIN IMMEDIATE : deux processus qui démarrent ensemble ne migrent pas deux fois.
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target or schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= version:
+                # Migrée entre-temps par un autre processus
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("🗄️ Migration %d appliquée : %s", version, description)
+        applied.append(version)
+    if schema_version(conn) > SCHEMA_VERSION:
+        logger.warning("⚠️ Base en version %d, code en version %d", schema_version(conn), SCHEMA_VERSION)
+    return applied
+
+
+def reset_schema(conn, target=SCHEMA_VERSION):
+    # Base repartie de zéro (generate_cases) : tables supprimées puis schéma recréé.
+    # target=TABLES_VERSION : index créés plus tard par migrate(), après les insertions en masse.
+    conn.executescript("""
+    DROP TABLE IF EXISTS fields;
+    DROP TABLE IF EXISTS sessions;
+    PRAGMA user_version = 0;
+    """)
+    return migrate(conn, target)
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from feature_extractor import FEATURE_ORDER
+from model_runtime import LAZY_MODEL, MODEL_PATH, THRESHOLD, BoosterModel, LazyModel, load_booster
+
+logger = logging.getLogger("kyc.models")
+
+# ==== CONFIGURATION ====
+# Répertoire surveillé : le fichier le plus récent (.ubj / .json / .pkl) devient le modèle actif
+MODEL_DIR = os.environ.get("KYC_MODEL_DIR", "models")
+# Période de scrutation du répertoire en secondes (0 = pas de surveillance, rechargement via l'API seulement)
+MODEL_WATCH_INTERVAL_S = float(os.environ.get("KYC_MODEL_WATCH_INTERVAL_S", "5"))
+MODEL_EXTENSIONS = (".ubj", ".json", ".pkl")
+
+# Vecteurs de chauffe : ligne nulle + lignes aléatoires fixes, en lot unitaire et en lot plein
+WARMUP_ROWS = 64
+
+
+class ModelVersion:
+    # Modèle chargé + métadonnées ; immuable une fois publié, l'échange est une simple affectation
+
+    def __init__(self, model, version, path):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+        self.threshold = model.threshold
+
+    def predict_scores(self, features_matrix):
+        return self.model.predict_scores(features_matrix)
+
+    def labels(self, scores):
+        return self.model.labels(scores)
+
+    def label(self, score):
+        return self.model.label(score)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "threshold": self.threshold,
+            "loaded": getattr(self.model, "loaded", True),
+        }
+
+
+def model_version(path):
+    # Nom du fichier + empreinte du contenu : deux exports successifs au même nom restent distincts
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{digest.hexdigest()[:8]}"
+
+
+def validate_booster(booster):
+    # Même contrat que l'extraction : 20 features dans l'ordre de FEATURE_ORDER
+    if booster.num_features() != len(FEATURE_ORDER):
+        raise ValueError(f"n_features_in_ = {booster.num_features()}, attendu {len(FEATURE_ORDER)}")
+    names = booster.feature_names
+    if names is not None and list(names) != FEATURE_ORDER:
+        raise ValueError(f"Ordre des features différent de FEATURE_ORDER : {names}")
+
+
+def warmup(model):
+    # Premier passage dans l'ensemble d'arbres hors requête ; rejette un modèle aux scores invalides
+    rng = np.random.default_rng(0)
+    samples = np.vstack([np.zeros((1, len(FEATURE_ORDER))), rng.random((WARMUP_ROWS - 1, len(FEATURE_ORDER))) * 100])
+    for batch in (samples[:1], samples):
+        scores = np.asarray(model.predict_scores(batch))
+        if scores.shape != (len(batch),) or not np.all(np.isfinite(scores)) or scores.min() < 0 or scores.max() > 1:
+            raise ValueError("Scores de chauffe invalides")
+
+
+def publish_model(booster, model_dir=MODEL_DIR, prefix="kyc_xgb_model"):
+    # Version datée écrite dans un fichier caché puis renommée : la surveillance ne voit jamais un fichier partiel
+    os.makedirs(model_dir, exist_ok=True)
+    version_name = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ubj"
+    tmp_path = os.path.join(model_dir, "." + version_name)
+    booster.save_model(tmp_path)
+    path = os.path.join(model_dir, version_name)
+    os.replace(tmp_path, path)
+    return path
+
+
+def latest_model_file(model_dir):
+    # Fichier modèle le plus récent ; les fichiers cachés / temporaires (écriture en cours) sont ignorés
+    if not os.path.isdir(model_dir):
+        return None
+    candidates = [
+        entry for entry in os.scandir(model_dir)
+        if entry.is_file() and not entry.name.startswith(".") and entry.name.endswith(MODEL_EXTENSIONS)
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda entry: (entry.stat().st_mtime, entry.name)).path
+
+
+class ModelRegistry:
+    # Modèle actif rechargeable à chaud : chargement + validation + chauffe en arrière-plan,
+    # puis échange atomique de la référence. Une requête lit current() une seule fois et garde
+    # cette version jusqu'au bout ; l'ancienne version reste valable tant qu'elle est référencée.
+
+    def __init__(self, model_dir=MODEL_DIR, default_path=MODEL_PATH, threshold=THRESHOLD,
+                 watch_interval=MODEL_WATCH_INTERVAL_S):
+        self.model_dir = model_dir
+        self.default_path = default_path
+        self.threshold = threshold
+        self.watch_interval = watch_interval
+        self._current = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = {}  # chemin -> (taille, mtime) lors de la dernière scrutation
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+        self.last_attempt = None
+
+    # ==== MODÈLE ACTIF ====
+    def current(self):
+        return self._current
+
+    def load_initial(self, lazy=LAZY_MODEL):
+        # Démarrage : dernier modèle du répertoire, sinon KYC_MODEL_PATH
+        path = latest_model_file(self.model_dir) or self.default_path
+        if lazy:
+            self._current = ModelVersion(LazyModel(path, self.threshold), model_version(path), path)
+        else:
+            self._current = self._prepare(path)
+        self._remember(path)
+        logger.info("🧠 Modèle actif : %s", self._current.version)
+        return self._current
+
+    def _prepare(self, path):
+        booster = load_booster(path)
+        validate_booster(booster)
+        candidate = ModelVersion(BoosterModel(booster, self.threshold), model_version(path), path)
+        warmup(candidate)
+        return candidate
+
+    # ==== RECHARGEMENT ====
+    def reload(self, path=None):
+        # Synchrone ; renvoie la version active. Un échec laisse l'ancien modèle en place.
+        path = path or latest_model_file(self.model_dir) or self.default_path
+        with self._reload_lock:
+            self.last_attempt = datetime.now().isoformat(timespec="seconds")
+            try:
+                started = time.perf_counter()
+                candidate = self._prepare(path)
+            except Exception as e:
+                self.failed_reloads += 1
+                self.last_error = f"{os.path.basename(path)} : {e}"
+                logger.error("❌ Modèle rejeté (%s) : %s", path, e)
+                raise
+            previous = self._current
+            self._current = candidate
+            self.reloads += 1
+            self.last_error = None
+            self._remember(path)
+            logger.info("🔁 Modèle %s -> %s (chargé et chauffé en %.0f ms)",
+                        previous.version if previous else None, candidate.version,
+                        (time.perf_counter() - started) * 1000)
+            return candidate
+
+    def model_file(self, name):
+        # Rechargement via l'API : uniquement un fichier du répertoire surveillé, désigné par son nom
+        path = os.path.join(self.model_dir, os.path.basename(name))
+        if not os.path.isfile(path) or not path.endswith(MODEL_EXTENSIONS):
+            raise FileNotFoundError(f"Modèle introuvable dans {self.model_dir} : {name}")
+        return path
+
+    def reload_async(self, path=None):
+        # False si un rechargement est déjà en cours
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self._reload_quietly, args=(path,), name="model-reload", daemon=True).start()
+        return True
+
+    def reloading(self):
+        return self._reload_lock.locked()
+
+    def _reload_quietly(self, path):
+        try:
+            self.reload(path)
+        except Exception:
+            pass  # déjà journalisé, last_error renseigné
+
+    # ==== SURVEILLANCE DU RÉPERTOIRE ====
+    def start(self):
+        if self.watch_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _remember(self, path):
+        self._seen[os.path.abspath(path)] = self._signature(path)
+
+    def _watch(self):
+        pending = None  # (chemin, signature) vu une fois : on attend qu'il soit stable
+        while not self._stop.wait(self.watch_interval):
+            path = latest_model_file(self.model_dir)
+            if path is None:
+                continue
+            signature = self._signature(path)
+            current = self._current
+            if current is not None and os.path.abspath(current.path) == os.path.abspath(path) \
+                    and self._seen.get(os.path.abspath(path)) == signature:
+                pending = None
+                continue
+            if self._seen.get(os.path.abspath(path)) == signature:
+                continue  # déjà essayé tel quel (et rejeté)
+            # Fichier nouveau ou modifié : rechargé quand taille et mtime n'ont pas bougé d'une scrutation à l'autre
+            if pending != (path, signature):
+                pending = (path, signature)
+                continue
+            pending = None
+            self._seen[os.path.abspath(path)] = signature
+            self._reload_quietly(path)
+
+    def status(self):
+        current = self._current
+        return {
+            "ready": current is not None,
+            "model": current.info() if current is not None else None,
+            "model_dir": self.model_dir,
+            "watch_interval_s": self.watch_interval,
+            "reloading": self.reloading(),
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_attempt": self.last_attempt,
+            "last_error": self.last_error,
+        }
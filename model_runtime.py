@@ -0,0 +1,105 @@
+import os
+import threading
+
+import numpy as np
+
+# xgboost (qui importe scikit-learn, pandas et scipy) et joblib ne sont importés
+# qu'au chargement du modèle : en mode paresseux, le démarrage du worker reste léger.
+
+# ==== CONFIGURATION ====
+MODEL_PATH = os.environ.get("KYC_MODEL_PATH", "kyc_xgb_model.pkl")
+# Seuil de décision : score > seuil => Suspicious (0.5 = règle de XGBClassifier.predict)
+THRESHOLD = float(os.environ.get("KYC_THRESHOLD", "0.5"))
+# 1 : modèle chargé au premier scoring (ou via preload) plutôt qu'à l'import de app.py
+LAZY_MODEL = os.environ.get("KYC_LAZY_MODEL", "0") == "1"
+
+
+class BoosterModel:
+    # Booster XGBoost natif : un seul inplace_predict par appel, label déduit du score
+
+    def __init__(self, booster, threshold=THRESHOLD):
+        self.booster = booster
+        self.threshold = threshold
+        self.n_features_in_ = booster.num_features()
+
+    def predict_scores(self, features_matrix):
+        # Probabilité de la classe "Suspicious" pour chaque ligne, shape (n,)
+        features_matrix = np.asarray(features_matrix, dtype=np.float32)
+        if features_matrix.ndim != 2 or features_matrix.shape[1] != self.n_features_in_:
+            raise ValueError(f"Feature shape mismatch, expected: {self.n_features_in_}, got: {features_matrix.shape[-1]}")
+        return self.booster.inplace_predict(features_matrix, validate_features=False)
+
+    def labels(self, scores):
+        return np.asarray(scores) > self.threshold
+
+    def label(self, score):
+        return "Suspicious" if score > self.threshold else "Clean"
+
+
+class LazyModel:
+    # Même interface que BoosterModel ; le Booster est chargé au premier besoin (thread-safe)
+
+    def __init__(self, path=MODEL_PATH, threshold=THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = BoosterModel(load_booster(self.path), self.threshold)
+                model = self._model
+        return model
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def n_features_in_(self):
+        return self.get().n_features_in_
+
+    def predict_scores(self, features_matrix):
+        return self.get().predict_scores(features_matrix)
+
+    def labels(self, scores):
+        return np.asarray(scores) > self.threshold
+
+    def label(self, score):
+        return "Suspicious" if score > self.threshold else "Clean"
+
+
+def load_booster(path=MODEL_PATH):
+    # .pkl : XGBClassifier sérialisé par train_xgboost.py ; .ubj / .json : Booster exporté
+    if path.endswith(".pkl"):
+        import joblib
+        return joblib.load(path).get_booster()
+    import xgboost as xgb
+    booster = xgb.Booster()
+    booster.load_model(path)
+    return booster
+
+
+def load_model(path=MODEL_PATH, threshold=THRESHOLD, lazy=LAZY_MODEL):
+    if lazy:
+        return LazyModel(path, threshold)
+    return BoosterModel(load_booster(path), threshold)
+
+
+def export_booster(pkl_path=MODEL_PATH, out_path="kyc_xgb_model.ubj"):
+    # Format natif XGBoost : indépendant de la version de scikit-learn / du pickle
+    load_booster(pkl_path).save_model(out_path)
+    return out_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporte le modèle pickle en Booster natif (UBJ/JSON)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--out", default="kyc_xgb_model.ubj")
+    args = parser.parse_args()
+    print("💾 Booster exporté :", export_booster(args.model, args.out))
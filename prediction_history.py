@@ -0,0 +1,118 @@
+import csv
+import io
+import os
+import sqlite3
+
+import pandas as pd
+
+from feature_extractor import FEATURE_ORDER
+
+# ==== CONFIGURATION ====
+HISTORY_DB = os.environ.get("KYC_HISTORY_DB", "prediction_history.db")
+# Ancien historique CSV réécrit à chaque clic : importé une fois puis renommé
+LEGACY_HISTORY_CSV = "prediction_history.csv"
+HISTORY_COLUMNS = FEATURE_ORDER + ["prediction", "confidence", "threshold", "timestamp", "profil"]
+EXPORT_CHUNK_ROWS = 10000
+
+
+class PredictionHistory:
+    # Historique de la démo Streamlit : insertions seules, lecture des N dernières lignes
+    # par la clé primaire (id croissant) sans parcourir la table
+
+    def __init__(self, db_path=HISTORY_DB, legacy_csv=LEGACY_HISTORY_CSV):
+        self.db_path = db_path
+        self._init_db()
+        if legacy_csv and os.path.exists(legacy_csv):
+            self._import_csv(legacy_csv)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _init_db(self):
+        columns = ",\n".join(f"{name} REAL" for name in FEATURE_ORDER)
+        conn = self._connect()
+        with conn:
+            conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                {columns},
+                prediction INTEGER NOT NULL,
+                confidence REAL NOT NULL,
+                threshold REAL NOT NULL,
+                timestamp TEXT NOT NULL,
+                profil TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp);
+            """)
+        conn.close()
+
+    def _import_csv(self, path):
+        df = pd.read_csv(path).reindex(columns=HISTORY_COLUMNS)
+        self.append_many(df.astype(object).where(df.notna(), None).values.tolist())
+        os.replace(path, path + ".imported")
+
+    # ==== ÉCRITURE ====
+    def append(self, row):
+        self.append_many([[row.get(name) for name in HISTORY_COLUMNS]])
+
+    def append_many(self, rows):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' for _ in HISTORY_COLUMNS)})",
+                    rows
+                )
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM history")
+        finally:
+            conn.close()
+
+    # ==== LECTURE ====
+    def last_id(self):
+        # Change à chaque insertion : sert de clé de cache pour l'export
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT MAX(id) FROM history").fetchone()[0]
+        finally:
+            conn.close()
+
+    def tail(self, n=10):
+        conn = self._connect()
+        try:
+            df = pd.read_sql_query(
+                f"SELECT id, {', '.join(HISTORY_COLUMNS)} FROM history ORDER BY id DESC LIMIT ?", conn, params=(n,)
+            )
+        finally:
+            conn.close()
+        return df.iloc[::-1].set_index("id")
+
+    def export_csv(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # Export complet par pages de clé primaire (pas d'OFFSET)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(HISTORY_COLUMNS)
+        conn = self._connect()
+        try:
+            after = 0
+            while True:
+                rows = conn.execute(
+                    f"SELECT id, {', '.join(HISTORY_COLUMNS)} FROM history WHERE id > ? ORDER BY id LIMIT ?",
+                    (after, chunk_rows)
+                ).fetchall()
+                if not rows:
+                    break
+                writer.writerows(row[1:] for row in rows)
+                after = rows[-1][0]
+        finally:
+            conn.close()
+        return buffer.getvalue()
@@ -0,0 +1,256 @@
+import csv
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("kyc.prediction_log")
+
+# ==== CONFIGURATION ====
+PREDICTION_LOG_PATH = os.environ.get("PREDICTION_LOG_PATH", "prediction_log.csv")
+PREDICTION_LOG_DB = os.environ.get("PREDICTION_LOG_DB", "prediction_log.db")
+# csv | sqlite | both
+PREDICTION_LOG_BACKEND = os.environ.get("PREDICTION_LOG_BACKEND", "csv")
+FLUSH_ROWS = int(os.environ.get("PREDICTION_LOG_FLUSH_ROWS", "200"))
+FLUSH_INTERVAL_S = float(os.environ.get("PREDICTION_LOG_FLUSH_INTERVAL_S", "2"))
+MAX_BYTES = int(os.environ.get("PREDICTION_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+ROTATE_DAILY = os.environ.get("PREDICTION_LOG_ROTATE_DAILY", "1") == "1"
+# Lignes gardées en mémoire quand l'écriture échoue (disque plein, base verrouillée) : au-delà,
+# les plus anciennes sont abandonnées
+MAX_PENDING_ROWS = int(os.environ.get("PREDICTION_LOG_MAX_PENDING_ROWS", "100000"))
+
+COLUMNS = ["timestamp", "session_id", "label", "score", "model_version"]
+
+
+@contextmanager
+def file_lock(lock_path):
+    # Verrou inter-processus (plusieurs workers gunicorn écrivent le même fichier)
+    with open(lock_path, "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PredictionLogSink:
+    # Tampon mémoire vidé par lot (taille ou minuteur) vers CSV tournant et/ou table SQLite indexée
+
+    def __init__(self, path=PREDICTION_LOG_PATH, db_path=PREDICTION_LOG_DB, backend=PREDICTION_LOG_BACKEND,
+                 flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL_S,
+                 max_bytes=MAX_BYTES, rotate_daily=ROTATE_DAILY, max_pending=MAX_PENDING_ROWS):
+        self.path = path
+        self.db_path = db_path
+        self.use_csv = backend in ("csv", "both")
+        self.use_sqlite = backend in ("sqlite", "both")
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.max_pending = max_pending
+        self._buffer = []
+        # Lignes déjà dans le CSV mais pas encore dans SQLite (backend both, écriture SQLite échouée)
+        self._sqlite_retry = []
+        # (st_dev, st_ino) du CSV dont l'en-tête est vérifié : relu seulement après une rotation
+        self._header_checked = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.rotations = 0
+        self.rows_dropped = 0
+        if self.use_sqlite:
+            self._init_db()
+
+    # ==== CÔTÉ REQUÊTE ====
+    def write_rows(self, rows):
+        with self._lock:
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.flush_rows
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    # ==== THREAD DE VIDAGE ====
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("❌ Erreur vidage du log de prédictions")
+
+    def flush(self):
+        # En cas d'échec les lignes sont remises en tête du tampon (réessayées au vidage suivant)
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            retry, self._sqlite_retry = self._sqlite_retry, []
+            if not rows and not retry:
+                return 0
+            if self.use_csv and rows:
+                try:
+                    self._write_csv(rows)
+                except Exception:
+                    self._sqlite_retry = retry
+                    self._requeue(rows)
+                    raise
+            if self.use_sqlite:
+                try:
+                    self._write_sqlite(retry + rows)
+                except Exception:
+                    if self.use_csv:
+                        # Déjà dans le CSV : seul SQLite est réessayé
+                        self._sqlite_retry = retry + rows
+                    else:
+                        self._requeue(rows)
+                    raise
+            # Lignes réessayées : comptées une fois arrivées dans tous les backends
+            written = len(rows) + len(retry)
+            self.rows_written += written
+            self.flushes += 1
+            return written
+
+    def _requeue(self, rows):
+        with self._lock:
+            self._buffer[:0] = rows
+            overflow = len(self._buffer) - self.max_pending
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.rows_dropped += overflow
+        if overflow > 0:
+            logger.warning("⚠️ Log de prédictions : %d lignes abandonnées (écriture impossible)", overflow)
+
+    # ==== CSV + ROTATION ====
+    def _write_csv(self, rows):
+        with file_lock(self.path + ".lock"):
+            self._rotate_if_needed()
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if f.tell() == 0:
+                    writer.writerow(COLUMNS)
+                    self._header_checked = self._file_id(os.fstat(f.fileno()))
+                writer.writerows(rows)
+
+    def _rotate_if_needed(self):
+        # Appelé sous verrou : un seul worker renomme le fichier
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        too_big = self.max_bytes and os.path.getsize(self.path) >= self.max_bytes
+        stale = self.rotate_daily and date.fromtimestamp(os.path.getmtime(self.path)) < date.today()
+        if too_big or stale or self._header_changed():
+            self._rotate()
+
+    @staticmethod
+    def _file_id(st):
+        return st.st_dev, st.st_ino
+
+    def _header_changed(self):
+        # Fichier écrit avec d'autres colonnes (ancienne version) : archivé plutôt que mélangé.
+        # En-tête lu une fois par fichier ; un autre inode (rotation par un autre worker) est relu.
+        file_id = self._file_id(os.stat(self.path))
+        if file_id == self._header_checked:
+            return False
+        with open(self.path, newline="", encoding="utf-8") as f:
+            changed = next(csv.reader(f), COLUMNS) != COLUMNS
+        if not changed:
+            self._header_checked = file_id
+        return changed
+
+    def _rotate(self):
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}{ext}"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        self.rotations += 1
+        logger.info("🗜️ Log de prédictions archivé : %s.gz", rotated)
+
+    # ==== SQLITE ====
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        with conn:
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                label TEXT NOT NULL,
+                score REAL NOT NULL,
+                model_version TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_predictions_session ON predictions(session_id);
+            CREATE INDEX IF NOT EXISTS idx_predictions_label_ts ON predictions(label, timestamp);
+            """)
+            # Table créée avant l'ajout de la version du modèle
+            if not any(row[1] == "model_version" for row in conn.execute("PRAGMA table_info(predictions)")):
+                conn.execute("ALTER TABLE predictions ADD COLUMN model_version TEXT")
+        conn.close()
+
+    def _write_sqlite(self, rows):
+        # Connexion propre au thread de vidage ; busy timeout pour les autres workers
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                    rows
+                )
+        finally:
+            conn.close()
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "rotations": self.rotations,
+            "rows_dropped": self.rows_dropped,
+        }
@@ -0,0 +1,129 @@
+import os
+import zlib
+
+from flask import Request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
+
+# Dépendances optionnelles : orjson (JSON rapide), msgpack (corps binaires)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# ==== CONFIGURATION ====
+# orjson pour request.get_json / jsonify s'il est installé (KYC_FAST_JSON=0 pour le json standard)
+FAST_JSON = os.environ.get("KYC_FAST_JSON", "1") == "1" and orjson is not None
+# Taille maximale d'un corps une fois décompressé (protection contre les bombes gzip)
+MAX_DECOMPRESSED_BYTES = int(os.environ.get("KYC_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# Content-Encoding -> wbits zlib (deflate : en-tête zlib, repli sur deflate brut)
+ENCODINGS = {"gzip": zlib.MAX_WBITS | 16, "x-gzip": zlib.MAX_WBITS | 16, "deflate": zlib.MAX_WBITS}
+
+
+class PayloadError(BadRequest):
+    # Corps illisible : renvoyé au client en 400 (415 / 413 pour les sous-classes)
+    pass
+
+
+class UnsupportedPayload(PayloadError):
+    code = 415
+
+
+class PayloadTooLarge(PayloadError):
+    code = 413
+
+
+def decompress(data, encoding, max_bytes=MAX_DECOMPRESSED_BYTES):
+    wbits = ENCODINGS.get(encoding)
+    if wbits is None:
+        raise UnsupportedPayload(f"Content-Encoding non supporté : {encoding}")
+    candidates = [wbits, -zlib.MAX_WBITS] if encoding == "deflate" else [wbits]
+    for i, bits in enumerate(candidates):
+        decompressor = zlib.decompressobj(bits)
+        try:
+            out = decompressor.decompress(data, max_bytes + 1)
+        except zlib.error:
+            if i == len(candidates) - 1:
+                raise PayloadError(f"Corps {encoding} invalide")
+            continue
+        if len(out) > max_bytes or decompressor.unconsumed_tail:
+            raise PayloadTooLarge(f"Corps décompressé > {max_bytes} octets")
+        return out
+
+
+def unpack_msgpack(data):
+    if msgpack is None:
+        raise UnsupportedPayload("MessagePack indisponible (pip install msgpack)")
+    try:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except Exception as e:
+        raise PayloadError(f"Corps MessagePack invalide : {e}")
+
+
+class KycRequest(Request):
+    # Corps gzip / deflate décompressés de façon transparente, MessagePack accepté par get_json.
+    # Les endpoints continuent d'appeler request.get_json(force=True).
+
+    _decoded_data = None
+
+    def get_data(self, cache=True, as_text=False, parse_form_data=False):
+        encoding = self.headers.get("Content-Encoding", "").strip().lower()
+        if encoding in ("", "identity"):
+            return super().get_data(cache=cache, as_text=as_text, parse_form_data=parse_form_data)
+        data = self._decoded_data
+        if data is None:
+            data = decompress(super().get_data(cache=cache, parse_form_data=parse_form_data), encoding)
+            if cache:
+                self._decoded_data = data
+        return data.decode("utf-8", "replace") if as_text else data
+
+    def get_json(self, force=False, silent=False, cache=True):
+        try:
+            if self.mimetype in MSGPACK_MIMETYPES:
+                return unpack_msgpack(self.get_data(cache=cache))
+            return super().get_json(force=force, silent=silent, cache=cache)
+        except PayloadError:
+            if silent:
+                return None
+            raise
+
+    def on_json_loading_failed(self, e):
+        if e is None:
+            return super().on_json_loading_failed(e)
+        raise PayloadError(f"JSON invalide : {e}")
+
+
+def _orjson_default(o):
+    # Types que orjson ne connaît pas (Decimal, date via Flask...) : même repli que jsonify
+    return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # jsonify / request.get_json via orjson ; numpy sérialisé nativement
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Octets produits directement, sans repasser par str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_orjson_default, option=self.option), mimetype=self.mimetype
+        )
+
+
+def install(app, fast_json=FAST_JSON):
+    app.request_class = KycRequest
+    if fast_json:
+        app.json = OrjsonProvider(app)
+    return app
@@ -0,0 +1,301 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("kyc.events")
+
+# ==== CONFIGURATION ====
+# Mode streaming de tracking.js : deltas envoyés pendant la saisie, submit réduit au session_id.
+# Désactivé par défaut : les agrégats vivent dans un seul processus (déploiement mono-worker requis)
+EVENT_STREAMING = os.environ.get("KYC_EVENT_STREAMING", "0") == "1"
+# Session sans nouvel événement depuis EVENT_TTL_S : agrégat supprimé
+EVENT_TTL_S = float(os.environ.get("KYC_EVENT_TTL_S", "1800"))
+# Au-delà, la session la moins récemment mise à jour est supprimée
+EVENT_MAX_SESSIONS = int(os.environ.get("KYC_EVENT_MAX_SESSIONS", "10000"))
+MAX_FIELDS_PER_SESSION = 64
+MAX_FIELD_NAME_LENGTH = 64
+MAX_VALUE_LENGTH = 512
+MAX_DELTAS_PER_REQUEST = 50
+
+# ==== FORMAT DES DELTAS (tracking.js) ====
+# {"s": session_id, "q": numéro de lot, "t": horodatage client (ms),
+#  "st": start_time, "d": deviceType, "fl": [champs suivis]      (premier lot)
+#  "k": {"clk": clics, "scr": scrolls, "vp": viewport, "tab": tabulations},
+#  "mm": souris bougée, "en": Entrée pressée, "li": dernière interaction (ms),
+#  "o": [champs focalisés pour la première fois, dans l'ordre],
+#  "f": {champ: {"t": ms de focus, "h": ms de survol, "c": copies, "p": collages,
+#                "x": suppressions, "ch": modifications, "fo": focus, "v": valeur}}}
+# Compteurs additifs ; valeur, appareil et dernière interaction : le lot le plus récent l'emporte.
+SESSION_COUNTERS = {"clk": "mouseClickCount", "scr": "scrollCount", "vp": "viewportChanges", "tab": "tabKeyCount"}
+FIELD_COUNTERS = {"t": "timeSpentMs", "h": "hoverDurationMs", "c": "copy", "p": "paste", "x": "delete",
+                  "ch": "changes", "fo": "focusCount"}
+
+
+class EventError(ValueError):
+    pass
+
+
+def _count(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        raise EventError(f"Compteur invalide : {value!r}")
+
+
+def _field_name(name):
+    if not isinstance(name, str) or not name or len(name) > MAX_FIELD_NAME_LENGTH:
+        raise EventError(f"Nom de champ invalide : {name!r}")
+    return name
+
+
+def _empty_field():
+    return {"value": "", **{name: 0 for name in FIELD_COUNTERS.values()}}
+
+
+def _optional_count(delta, key):
+    return _count(delta[key]) if delta.get(key) is not None else None
+
+
+def parse_delta(delta):
+    # Validation complète avant toute mise à jour : un lot invalide ne laisse rien de partiel
+    if not isinstance(delta, dict) or not isinstance(delta.get("s"), str) or not delta["s"]:
+        raise EventError("Lot sans session_id ('s')")
+    counters = delta.get("k") or {}
+    fields = delta.get("f") or {}
+    if not isinstance(counters, dict) or not isinstance(fields, dict):
+        raise EventError("Format invalide pour 'k' ou 'f'")
+    parsed_fields = {}
+    for name, changes in fields.items():
+        if not isinstance(changes, dict):
+            raise EventError(f"Format invalide pour le champ {name!r}")
+        value = changes.get("v")
+        parsed_fields[_field_name(name)] = (
+            {FIELD_COUNTERS[key]: _count(amount) for key, amount in changes.items() if key in FIELD_COUNTERS},
+            str(value)[:MAX_VALUE_LENGTH] if value is not None else None,
+        )
+    order = [_field_name(name) for name in delta.get("o") or []]
+    tracked = [_field_name(name) for name in delta.get("fl") or []]
+    return {
+        "s": delta["s"][:MAX_FIELD_NAME_LENGTH],
+        "q": _count(delta.get("q", 0)),
+        "st": _optional_count(delta, "st"),
+        "t": _optional_count(delta, "t"),
+        "li": _optional_count(delta, "li"),
+        "d": str(delta["d"])[:MAX_FIELD_NAME_LENGTH] if delta.get("d") else None,
+        "mm": bool(delta.get("mm")),
+        "en": bool(delta.get("en")),
+        "k": {SESSION_COUNTERS[key]: _count(value) for key, value in counters.items() if key in SESSION_COUNTERS},
+        "o": order,
+        "f": parsed_fields,
+        # Champs créés par ce lot (liste suivie, ordre de focus, compteurs), dans l'ordre d'apparition
+        "names": list(dict.fromkeys(tracked + order + list(parsed_fields))),
+    }
+
+
+class SessionAggregate:
+    # Compteurs courants d'une session, au format du payload complet de tracking.js
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.start_time = None
+        self.last_event_time = None
+        self.last_interaction = None
+        self.device_type = "unknown"
+        self.mouse_moved = False
+        self.enter_pressed = False
+        self.counters = {name: 0 for name in SESSION_COUNTERS.values()}
+        self.fields = {}
+        self.field_order = []
+        self.seqs = set()
+        self.last_seq = -1
+        self.value_seqs = {}
+        self.touched = time.monotonic()
+
+    def apply(self, delta):
+        # delta validé par parse_delta ; False si le lot a déjà été appliqué (beacon rejoué)
+        seq = delta["q"]
+        if seq in self.seqs:
+            return False
+        new_fields = [name for name in delta["names"] if name not in self.fields]
+        if len(self.fields) + len(new_fields) > MAX_FIELDS_PER_SESSION:
+            raise EventError(f"Plus de {MAX_FIELDS_PER_SESSION} champs pour la session")
+        for name in new_fields:
+            self.fields[name] = _empty_field()
+
+        if delta["st"] is not None and self.start_time is None:
+            self.start_time = delta["st"]
+        if delta["t"] is not None:
+            self.last_event_time = max(self.last_event_time or 0, delta["t"])
+        if delta["li"] is not None:
+            self.last_interaction = max(self.last_interaction or 0, delta["li"])
+        if delta["d"] and seq > self.last_seq:
+            self.device_type = delta["d"]
+        self.mouse_moved = self.mouse_moved or delta["mm"]
+        self.enter_pressed = self.enter_pressed or delta["en"]
+        for name, value in delta["k"].items():
+            self.counters[name] += value
+        for name in delta["o"]:
+            if name not in self.field_order:
+                self.field_order.append(name)
+        for name, (counters, value) in delta["f"].items():
+            field = self.fields[name]
+            for counter, amount in counters.items():
+                field[counter] += amount
+            if value is not None and seq >= self.value_seqs.get(name, -1):
+                field["value"] = value
+                self.value_seqs[name] = seq
+
+        self.seqs.add(seq)
+        self.last_seq = max(self.last_seq, seq)
+        return True
+
+    def complete(self):
+        # Tous les lots 0..last_seq reçus : un beacon perdu ou encore en vol rend l'agrégat inutilisable
+        return self.seqs == set(range(self.last_seq + 1))
+
+    def to_payload(self, end_time=None, submit_delay_ms=None):
+        # Même forme que le payload complet envoyé au submit par tracking.js
+        start_time = self.start_time or 0
+        end_time = end_time or self.last_event_time or start_time
+        duration_ms = end_time - start_time
+        if submit_delay_ms is None:
+            submit_delay_ms = max(0, end_time - (self.last_interaction or start_time))
+        fields = {name: dict(field) for name, field in self.fields.items()}
+        return {
+            "session_id": self.session_id,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration_ms": duration_ms,
+            "submit_delay_ms": submit_delay_ms,
+            "fast_fill": duration_ms < 8000 and all(field["value"] for field in fields.values()),
+            "mouseMoved": self.mouse_moved,
+            **self.counters,
+            "enterPressed": self.enter_pressed,
+            "deviceType": self.device_type,
+            "field_order": list(self.field_order),
+            "fields": fields,
+        }
+
+
+class SessionEventStore:
+    # Agrégats par session en mémoire : LRU borné (EVENT_MAX_SESSIONS) + expiration (EVENT_TTL_S).
+    # L'OrderedDict est trié par dernière mise à jour : les sessions expirées sont en tête.
+
+    def __init__(self, ttl=EVENT_TTL_S, max_sessions=EVENT_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        # Sessions déjà soumises (session_id -> instant) : leurs beacons tardifs sont ignorés
+        self._closed = OrderedDict()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.late = 0
+        self.finalized = 0
+        self.incomplete = 0
+        self.evicted_ttl = 0
+        self.evicted_capacity = 0
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, aggregate = next(iter(self._sessions.items()))
+            if now - aggregate.touched < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evicted_ttl += 1
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            self.evicted_capacity += 1
+            logger.debug("🧹 Agrégat %s supprimé (capacité %d atteinte)", session_id, self.max_sessions)
+        while self._closed:
+            session_id, closed_at = next(iter(self._closed.items()))
+            if now - closed_at < self.ttl and len(self._closed) <= self.max_sessions:
+                break
+            del self._closed[session_id]
+
+    def apply(self, delta):
+        # Un lot de tracking.js ; lève EventError si le lot est invalide
+        try:
+            delta = parse_delta(delta)
+        except EventError:
+            with self._lock:
+                self.rejected += 1
+            raise
+        session_id = delta["s"]
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._closed:
+                # Beacon arrivé après le submit : pas de nouvel agrégat orphelin
+                self.late += 1
+                return False
+            aggregate = self._sessions.get(session_id)
+            is_new = aggregate is None
+            if is_new:
+                aggregate = SessionAggregate(session_id)
+            try:
+                applied = aggregate.apply(delta)
+            except EventError:
+                self.rejected += 1
+                raise
+            if is_new:
+                # Ajouté seulement une fois le premier lot accepté : pas d'agrégat vide en mémoire
+                self._sessions[session_id] = aggregate
+            aggregate.touched = now
+            self._sessions.move_to_end(session_id)
+            self.batches += applied
+            self.duplicates += not applied
+            self._evict(now)
+        return applied
+
+    def payload(self, session_id, end_time=None, submit_delay_ms=None):
+        # Instantané en cours de saisie (score anticipé) ; None si la session est inconnue ou expirée
+        with self._lock:
+            self._evict(time.monotonic())
+            aggregate = self._sessions.get(session_id)
+            if aggregate is None:
+                return None
+            return aggregate.to_payload(end_time, submit_delay_ms)
+
+    def finalize(self, session_id, end_time=None, submit_delay_ms=None):
+        # Submit : payload complet, l'agrégat est retiré du store et la session close. None si la
+        # session est inconnue, expirée ou incomplète (premier lot ou lot intermédiaire manquant) :
+        # le client renvoie alors le payload complet
+        end_time = _count(end_time) if end_time is not None else None
+        submit_delay_ms = _count(submit_delay_ms) if submit_delay_ms is not None else None
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+            aggregate = self._sessions.pop(session_id, None)
+            self._closed[session_id] = now
+            self._closed.move_to_end(session_id)
+            if aggregate is None:
+                return None
+            if aggregate.start_time is None or not aggregate.complete():
+                self.incomplete += 1
+                logger.info("⚠️ Agrégat %s incomplet (lots reçus : %s)", session_id, sorted(aggregate.seqs))
+                return None
+            self.finalized += 1
+            return aggregate.to_payload(end_time, submit_delay_ms)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            self._evict(time.monotonic())
+            return {
+                "sessions": len(self._sessions),
+                "batches": self.batches,
+                "duplicates": self.duplicates,
+                "rejected": self.rejected,
+                "late": self.late,
+                "finalized": self.finalized,
+                "incomplete": self.incomplete,
+                "evicted_ttl": self.evicted_ttl,
+                "evicted_capacity": self.evicted_capacity,
+                "ttl_s": self.ttl,
+                "max_sessions": self.max_sessions,
+            }
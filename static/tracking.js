@@ -1,3 +1,10 @@
+// Mode streaming (data-streaming="1" sur la balise script) : les compteurs partent par petits
+// lots pendant la saisie (/api/events) et le submit ne porte plus que le session_id
+const STREAMING = document.currentScript?.dataset.streaming === "1";
+const FLUSH_INTERVAL_MS = 2000;
+const SCROLL_THROTTLE_MS = 100;
+const RESIZE_THROTTLE_MS = 250;
+
 document.addEventListener("DOMContentLoaded", () => {
   const startTime = Date.now();
   const sessionId = generateSessionId();
@@ -11,14 +18,41 @@ document.addEventListener("DOMContentLoaded", () => {
   let enterPressed = false;
   let lastInteractionTime = startTime;
 
-  document.addEventListener("mousemove", () => mouseMoved = true);
-  document.addEventListener("click", () => mouseClickCount++);
-  window.addEventListener("scroll", () => scrollCount++);
-  window.addEventListener("resize", () => viewportChanges++);
+  // Delta accumulé depuis le dernier envoi (clés courtes, cf. session_events.py)
+  let delta = emptyDelta();
+  let seq = 0;
+  let submitted = false;
+
+  // Streaming : mousemove retiré après le premier mouvement, scroll et resize limités.
+  // Payload complet : chaque événement compte, comme dans les données d'entraînement.
+  document.addEventListener("mousemove", () => {
+    mouseMoved = true;
+    delta.mm = 1;
+  }, { once: STREAMING, passive: true });
+  document.addEventListener("click", () => {
+    mouseClickCount++;
+    countSession("clk");
+  });
+  const onScroll = () => {
+    scrollCount++;
+    countSession("scr");
+  };
+  const onResize = () => {
+    viewportChanges++;
+    countSession("vp");
+  };
+  window.addEventListener("scroll", STREAMING ? throttle(SCROLL_THROTTLE_MS, onScroll) : onScroll, { passive: true });
+  window.addEventListener("resize", STREAMING ? throttle(RESIZE_THROTTLE_MS, onResize) : onResize, { passive: true });
   document.addEventListener("keydown", (e) => {
     lastInteractionTime = Date.now();
-    if (e.key === "Tab") tabKeyCount++;
-    if (e.key === "Enter") enterPressed = true;
+    if (e.key === "Tab") {
+      tabKeyCount++;
+      countSession("tab");
+    }
+    if (e.key === "Enter") {
+      enterPressed = true;
+      delta.en = 1;
+    }
   });
 
   const form = document.querySelector("form");
@@ -50,8 +84,10 @@ document.addEventListener("DOMContentLoaded", () => {
     input.addEventListener("focus", () => {
       focusStart = Date.now();
       focusCount++;
+      countField(name, "fo");
       if (!fieldOrder.includes(name)) {
         fieldOrder.push(name);
+        delta.o.push(name);
       }
     });
 
@@ -60,12 +96,15 @@ document.addEventListener("DOMContentLoaded", () => {
       fieldData[name].timeSpentMs += duration;
       fieldData[name].value = input.value;
       fieldData[name].focusCount = focusCount;
+      countField(name, "t", duration);
+      fieldDelta(name).v = input.value;
     });
 
     input.addEventListener("mouseover", () => hoverStart = Date.now());
     input.addEventListener("mouseout", () => {
       const hoverTime = Date.now() - hoverStart;
       fieldData[name].hoverDurationMs += hoverTime;
+      countField(name, "h", hoverTime);
     });
 
     input.addEventListener("input", () => {
@@ -74,27 +113,48 @@ document.addEventListener("DOMContentLoaded", () => {
       if (newValue !== valueBefore) {
         changes++;
         valueBefore = newValue;
+        countField(name, "ch");
       }
       fieldData[name].changes = changes;
     });
 
     input.addEventListener("keydown", (e) => {
       lastInteractionTime = Date.now();
-      if (e.key === "Backspace" || e.key === "Delete") deleteCount++;
+      if (e.key === "Backspace" || e.key === "Delete") {
+        deleteCount++;
+        countField(name, "x");
+      }
       fieldData[name].delete = deleteCount;
     });
 
     input.addEventListener("copy", () => {
       copyCount++;
       fieldData[name].copy = copyCount;
+      countField(name, "c");
     });
 
     input.addEventListener("paste", () => {
       pasteCount++;
       fieldData[name].paste = pasteCount;
+      countField(name, "p");
     });
   });
 
+  if (STREAMING) {
+    // Premier lot immédiat : le serveur connaît le début de session et les champs suivis
+    sendBeacon(takeBatch(true));
+    const flushTimer = setInterval(() => sendBeacon(takeBatch()), FLUSH_INTERVAL_MS);
+    const flushNow = () => {
+      if (submitted) return;
+      sendBeacon(takeBatch());
+    };
+    document.addEventListener("visibilitychange", () => {
+      if (document.visibilityState === "hidden") flushNow();
+    });
+    window.addEventListener("pagehide", flushNow);
+    form.addEventListener("submit", () => clearInterval(flushTimer));
+  }
+
   form.addEventListener("submit", async (e) => {
     e.preventDefault();
     const endTime = Date.now();
@@ -122,21 +182,26 @@ document.addEventListener("DOMContentLoaded", () => {
     };
 
     try {
-      const saveRes = await fetch("/api/save", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload)
-      });
-      if (!saveRes.ok) throw new Error("Erreur lors de l’enregistrement");
-
-      const predictRes = await fetch("/api/predict", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload)
-      });
-      if (!predictRes.ok) throw new Error("Erreur lors de la prédiction");
-
-      const result = await predictRes.json();
+      // Enregistrement + prédiction en un seul aller-retour
+      let submitRes;
+      if (STREAMING) {
+        submitted = true;
+        // Le serveur a déjà agrégé la session : seul le dernier lot accompagne le session_id
+        const lastBatch = takeBatch();
+        submitRes = await postJson("/api/submit", {
+          session_id: sessionId,
+          end_time: endTime,
+          submit_delay_ms: submitDelay,
+          events: lastBatch ? [lastBatch] : []
+        });
+        // Agrégat expiré ou serveur redémarré : repli sur le payload complet
+        if (submitRes.status === 404) submitRes = await postJson("/api/submit", payload);
+      } else {
+        submitRes = await postJson("/api/submit", payload);
+      }
+      if (!submitRes.ok) throw new Error("Erreur lors de l’envoi");
+
+      const result = await submitRes.json();
 
       // Message neutre pour l’utilisateur
       document.getElementById("client-message").innerText =
@@ -155,6 +220,69 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
+  // ==== DELTAS ====
+  function emptyDelta() {
+    return { k: {}, f: {}, o: [] };
+  }
+
+  function countSession(key) {
+    delta.k[key] = (delta.k[key] || 0) + 1;
+  }
+
+  function fieldDelta(name) {
+    return delta.f[name] || (delta.f[name] = {});
+  }
+
+  function countField(name, key, amount = 1) {
+    const f = fieldDelta(name);
+    f[key] = (f[key] || 0) + amount;
+  }
+
+  function takeBatch(first = false) {
+    // Lot courant (null si rien de neuf) ; le delta repart de zéro
+    const empty = !Object.keys(delta.k).length && !Object.keys(delta.f).length && !delta.o.length
+      && !delta.mm && !delta.en;
+    if (empty && !first) return null;
+    const batch = { s: sessionId, q: seq++, t: Date.now(), li: lastInteractionTime, ...delta };
+    if (first) {
+      batch.st = startTime;
+      batch.d = detectDeviceType();
+      batch.fl = Object.keys(fieldData);
+    }
+    delta = emptyDelta();
+    return batch;
+  }
+
+  function sendBeacon(batch) {
+    if (!batch) return;
+    const body = JSON.stringify(batch);
+    const sent = navigator.sendBeacon
+      && navigator.sendBeacon("/api/events", new Blob([body], { type: "application/json" }));
+    if (!sent) {
+      fetch("/api/events", { method: "POST", headers: { "Content-Type": "application/json" }, body, keepalive: true })
+        .catch(() => {});
+    }
+  }
+
+  function postJson(url, body) {
+    return fetch(url, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body)
+    });
+  }
+
+  function throttle(ms, fn) {
+    let last = 0;
+    return (e) => {
+      const now = Date.now();
+      if (now - last >= ms) {
+        last = now;
+        fn(e);
+      }
+    };
+  }
+
   function generateSessionId() {
     return "sess_" + Math.random().toString(36).substr(2, 9);
   }
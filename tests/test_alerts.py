@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from alerts import AlertDispatcher
+
+
+class StubWebhook:
+    # Faux webhook n8n local : répond avec les statuts prévus (puis 200) et garde les requêtes reçues
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.received = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    stub.received.append((time.monotonic(), json.loads(body)))
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook/fraud_alert"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def webhook():
+    stubs = []
+
+    def make(statuses=()):
+        stubs.append(StubWebhook(statuses))
+        return stubs[-1]
+
+    yield make
+    for stub in stubs:
+        stub.close()
+
+
+def make_dispatcher(url, tmp_path, **kwargs):
+    options = {"spill_path": str(tmp_path / "alerts_spill.jsonl"), "timeout": 2, "backoff": 0.05, "backoff_max": 1}
+    options.update(kwargs)
+    return AlertDispatcher(url=url, **options)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition non atteinte")
+        time.sleep(0.01)
+
+
+def read_spill(dispatcher):
+    with open(dispatcher.spill_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_retry_with_exponential_backoff(webhook, tmp_path):
+    stub = webhook([500, 503])
+    dispatcher = make_dispatcher(stub.url, tmp_path, max_retries=4)
+    dispatcher.start()
+    try:
+        assert dispatcher.submit({"session_id": "s1"})
+        wait_for(lambda: dispatcher.stats()["delivered"] == 1)
+    finally:
+        dispatcher.stop()
+
+    times = [t for t, _ in stub.received]
+    assert [p for _, p in stub.received] == [{"session_id": "s1"}] * 3
+    # Attentes de 0.05 s puis 0.1 s entre les tentatives
+    assert times[1] - times[0] >= 0.05
+    assert times[2] - times[1] >= 0.1
+    stats = dispatcher.stats()
+    assert stats["retries"] == 2
+    assert stats["failed"] == 0
+    assert stats["spilled"] == 0
+
+
+def test_client_error_is_not_retried_and_spilled(webhook, tmp_path):
+    stub = webhook([400])
+    dispatcher = make_dispatcher(stub.url, tmp_path)
+    dispatcher.start()
+    try:
+        dispatcher.submit({"session_id": "s2"})
+        wait_for(lambda: dispatcher.stats()["failed"] == 1)
+    finally:
+        dispatcher.stop()
+
+    assert len(stub.received) == 1
+    records = read_spill(dispatcher)
+    assert [(r["reason"], r["payload"]) for r in records] == [("delivery_failed", {"session_id": "s2"})]
+
+
+def test_retries_exhausted_spills_alert(webhook, tmp_path):
+    stub = webhook([503] * 10)
+    dispatcher = make_dispatcher(stub.url, tmp_path, max_retries=2)
+    dispatcher.start()
+    try:
+        dispatcher.submit({"session_id": "s3"})
+        wait_for(lambda: dispatcher.stats()["failed"] == 1)
+    finally:
+        dispatcher.stop()
+
+    assert len(stub.received) == 3
+    assert dispatcher.stats()["retries"] == 2
+    assert read_spill(dispatcher)[0]["payload"] == {"session_id": "s3"}
+
+
+
+def test_worker_survives_unexpected_error(webhook, tmp_path):
+    stub = webhook()
+    dispatcher = make_dispatcher(stub.url, tmp_path)
+    dispatcher.start()
+    try:
+        # Payload non sérialisable : TypeError au débordement disque, hors du chemin d'erreur HTTP
+        dispatcher.submit({"session_id": object()})
+        dispatcher.submit({"session_id": "s4"})
+        wait_for(lambda: dispatcher.stats()["delivered"] == 1)
+    finally:
+        dispatcher.stop()
+
+    assert [p for _, p in stub.received] == [{"session_id": "s4"}]
+
+def test_full_queue_spills_without_blocking(webhook, tmp_path):
+    stub = webhook()
+    # Worker non démarré : la file (capacité 1) ne se vide pas
+    dispatcher = make_dispatcher(stub.url, tmp_path, maxsize=1)
+    assert dispatcher.submit({"session_id": "a"})
+    started = time.monotonic()
+    assert not dispatcher.submit({"session_id": "b"})
+    assert time.monotonic() - started < 0.5
+
+    records = read_spill(dispatcher)
+    assert [(r["reason"], r["payload"]) for r in records] == [("queue_full", {"session_id": "b"})]
+    stats = dispatcher.stats()
+    assert stats["enqueued"] == 1
+    assert stats["spilled"] == 1
+    assert stats["queue_depth"] == 1
+
+
+def test_spilled_alerts_are_replayed_on_startup(webhook, tmp_path):
+    stub = webhook()
+    # Processus précédent : webhook injoignable, alertes écrites sur disque à l'arrêt
+    previous = make_dispatcher(stub.url, tmp_path, maxsize=1)
+    previous.submit({"session_id": "r1"})
+    previous.submit({"session_id": "r2"})
+    previous.stop(timeout=0)
+    assert len(read_spill(previous)) == 2
+
+    # Nouveau démarrage (même séquence que app.py) : start puis replay_spill
+    dispatcher = make_dispatcher(stub.url, tmp_path)
+    dispatcher.start()
+    try:
+        assert dispatcher.replay_spill() == 2
+        wait_for(lambda: dispatcher.stats()["delivered"] == 2)
+    finally:
+        dispatcher.stop()
+
+    assert sorted(p["session_id"] for _, p in stub.received) == ["r1", "r2"]
+    assert not (tmp_path / "alerts_spill.jsonl").exists()
+    assert not list(tmp_path.glob("alerts_spill.jsonl.replaying.*"))
+    assert dispatcher.replay_spill() == 0
@@ -0,0 +1,182 @@
+"""Entraînement XGBoost à grande échelle : données lues par morceaux, jamais chargées en entier.
+
+Les morceaux (CSV ou feature store Parquet) passent en float32 dans un DataIter ;
+XGBoost en tire un QuantileDMatrix (histogrammes quantifiés en mémoire) ou, avec
+--external-memory, un ExtMemQuantileDMatrix dont les pages sont mises en cache sur disque.
+
+    python train_scalable.py --source store --external-memory --nthread 8
+    python train_scalable.py --source csv --csv kyc_dataset_ready.csv --rounds 500 --early-stopping 30
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from feature_extractor import FEATURE_ORDER
+from feature_store import FEATURE_STORE_DIR, LABEL_COLUMN, iter_batches
+from model_registry import publish_model
+
+# Mêmes hyperparamètres que train_xgboost.py ; logloss binaire (dernière métrique = arrêt anticipé)
+PARAMS = {
+    "objective": "binary:logistic",
+    "tree_method": "hist",
+    "max_depth": 6,
+    "eta": 0.1,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "eval_metric": ["auc", "logloss"],
+}
+
+
+# ==== SOURCES PAR MORCEAUX ====
+def csv_chunks(path, batch_rows):
+    dtypes = {column: np.float32 for column in FEATURE_ORDER + [LABEL_COLUMN]}
+    for chunk in pd.read_csv(path, usecols=FEATURE_ORDER + [LABEL_COLUMN], dtype=dtypes, chunksize=batch_rows):
+        yield chunk[FEATURE_ORDER].to_numpy(), chunk[LABEL_COLUMN].to_numpy()
+
+
+def store_chunks(store_dir, batch_rows, start_date=None, end_date=None):
+    for batch in iter_batches(store_dir, FEATURE_ORDER + [LABEL_COLUMN], batch_rows, start_date, end_date):
+        X = np.empty((batch.num_rows, len(FEATURE_ORDER)), dtype=np.float32)
+        for j, column in enumerate(FEATURE_ORDER):
+            X[:, j] = batch.column(column).to_numpy()
+        yield X, batch.column(LABEL_COLUMN).to_numpy().astype(np.float32)
+
+
+def validation_mask(n_rows, chunk_index, fraction, seed):
+    # Tirage propre à chaque morceau : identique à chaque passe de XGBoost sur la source
+    return np.random.default_rng([seed, chunk_index]).random(n_rows) < fraction
+
+
+class ChunkIterator(xgb.DataIter):
+    # Rejoue la source à chaque passe demandée par XGBoost (quantiles, puis construction des pages)
+
+    def __init__(self, make_chunks, validation, fraction, seed, cache_prefix=None):
+        self.make_chunks = make_chunks
+        self.validation = validation
+        self.fraction = fraction
+        self.seed = seed
+        self.rows = 0
+        self._chunks = None
+        self._pass_rows = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = enumerate(self.make_chunks())
+            self._pass_rows = 0
+        for i, (X, y) in self._chunks:
+            mask = validation_mask(len(y), i, self.fraction, self.seed)
+            if not self.validation:
+                mask = ~mask
+            if not mask.any():
+                continue
+            input_data(data=X[mask], label=y[mask], feature_names=FEATURE_ORDER)
+            self._pass_rows += int(mask.sum())
+            return True
+        self.rows = self._pass_rows
+        return False
+
+    def reset(self):
+        self._chunks = None
+
+
+# ==== ENTRAÎNEMENT ====
+def build_matrices(make_chunks, valid_fraction, seed, nthread, max_bin, cache_dir=None):
+    # cache_dir : mode mémoire externe (pages quantifiées sur disque), sinon tout en mémoire quantifiée
+    cache = (lambda name: os.path.join(cache_dir, name)) if cache_dir else (lambda name: None)
+    train_it = ChunkIterator(make_chunks, False, valid_fraction, seed, cache("train"))
+    valid_it = ChunkIterator(make_chunks, True, valid_fraction, seed, cache("valid"))
+    matrix = xgb.ExtMemQuantileDMatrix if cache_dir else xgb.QuantileDMatrix
+    dtrain = matrix(train_it, max_bin=max_bin, nthread=nthread)
+    # Même découpage en bins que l'entraînement (ref)
+    dvalid = matrix(valid_it, max_bin=max_bin, nthread=nthread, ref=dtrain)
+    return dtrain, dvalid, train_it.rows, valid_it.rows
+
+
+def evaluate(booster, make_chunks, valid_fraction, seed, threshold=0.5):
+    # Matrice de confusion de la validation, calculée morceau par morceau
+    cm = np.zeros((2, 2), dtype=np.int64)
+    for i, (X, y) in enumerate(make_chunks()):
+        mask = validation_mask(len(y), i, valid_fraction, seed)
+        if mask.any():
+            pred = booster.inplace_predict(X[mask]) > threshold
+            np.add.at(cm, (y[mask].astype(np.int64), pred.astype(np.int64)), 1)
+    return cm
+
+
+def train_scalable(make_chunks, nthread, valid_fraction=0.2, rounds=1000, early_stopping=20, max_bin=256,
+                   seed=42, cache_dir=None):
+    params = {**PARAMS, "nthread": nthread, "max_bin": max_bin, "seed": seed}
+
+    started = time.perf_counter()
+    dtrain, dvalid, train_rows, valid_rows = build_matrices(make_chunks, valid_fraction, seed, nthread, max_bin, cache_dir)
+    build_s = time.perf_counter() - started
+    print(f"🧱 Matrices quantifiées : {train_rows} lignes train / {valid_rows} validation en {build_s:.1f} s "
+          f"({(train_rows + valid_rows) / build_s:.0f} lignes/s)")
+
+    started = time.perf_counter()
+    booster = xgb.train(
+        params, dtrain, num_boost_round=rounds,
+        evals=[(dtrain, "train"), (dvalid, "valid")],
+        early_stopping_rounds=early_stopping, verbose_eval=50,
+    )
+    train_s = time.perf_counter() - started
+    rounds_done = booster.num_boosted_rounds()
+    print(f"🧠 {rounds_done} arbres en {train_s:.1f} s, meilleure itération {booster.best_iteration} "
+          f"(valid logloss {booster.best_score:.5f}) : {train_rows * rounds_done / train_s:.0f} lignes·arbres/s, "
+          f"{train_rows / train_s:.0f} lignes/s")
+
+    # Modèle servi = arbres jusqu'à la meilleure itération
+    booster = booster[: booster.best_iteration + 1]
+    return booster, {"train_rows": train_rows, "valid_rows": valid_rows, "build_s": build_s, "train_s": train_s}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement XGBoost par morceaux (QuantileDMatrix / mémoire externe)")
+    parser.add_argument("--source", choices=["store", "csv"], default="store")
+    parser.add_argument("--store", default=FEATURE_STORE_DIR)
+    parser.add_argument("--csv", default="kyc_dataset_ready.csv")
+    parser.add_argument("--from", dest="start_date", default=None, help="YYYY-MM-DD (feature store)")
+    parser.add_argument("--to", dest="end_date", default=None, help="YYYY-MM-DD exclu (feature store)")
+    parser.add_argument("--batch-rows", type=int, default=100000)
+    parser.add_argument("--external-memory", action="store_true", help="pages quantifiées en cache disque")
+    parser.add_argument("--cache-dir", default=None, help="répertoire du cache (défaut : temporaire)")
+    parser.add_argument("--nthread", type=int, default=os.cpu_count())
+    parser.add_argument("--valid-fraction", type=float, default=0.2)
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--early-stopping", type=int, default=20)
+    parser.add_argument("--max-bin", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-publish", action="store_true", help="ne pas publier le modèle dans models/")
+    args = parser.parse_args()
+
+    if args.source == "store":
+        def make_chunks():
+            return store_chunks(args.store, args.batch_rows, args.start_date, args.end_date)
+    else:
+        def make_chunks():
+            return csv_chunks(args.csv, args.batch_rows)
+
+    print("🚀 Entraînement XGBoost par morceaux...")
+    cache_dir = tempfile.mkdtemp(prefix="xgb_cache_", dir=args.cache_dir) if args.external_memory else None
+    try:
+        booster, _ = train_scalable(make_chunks, args.nthread, args.valid_fraction, args.rounds,
+                                    args.early_stopping, args.max_bin, args.seed, cache_dir)
+    finally:
+        if cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    cm = evaluate(booster, make_chunks, args.valid_fraction, args.seed)
+    print("📈 Validation (lignes : réel Normal/Fraude, colonnes : prédit) :")
+    print(cm)
+    print(f"   accuracy {np.trace(cm) / max(cm.sum(), 1):.4f}")
+
+    if not args.no_publish:
+        print(f"📦 Version publiée : {publish_model(booster)}")
+    print("🏁 Script terminé.")
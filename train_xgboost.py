@@ -1,18 +1,25 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")  # sans affichage : les figures sont écrites en PNG, rien ne bloque
+import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+import xgboost as xgb
 from xgboost import XGBClassifier, plot_importance
 from sklearn.model_selection import train_test_split, StratifiedKFold
-from sklearn.metrics import classification_report, confusion_matrix, ConfusionMatrixDisplay
-import matplotlib.pyplot as plt
+from sklearn.metrics import (
+    accuracy_score, classification_report, confusion_matrix, ConfusionMatrixDisplay, log_loss, roc_auc_score
+)
 import joblib
+from model_registry import publish_model
 
-print("🚀 Démarrage du script d'entraînement XGBoost...")
-
-# === Je charge le dataset ===
-print("📥 Chargement du fichier CSV...")
-df = pd.read_csv("kyc_dataset_ready.csv")
-
-# === Je vérifie que toutes les colonnes requises sont présentes ===
-print("🔍 Vérification des colonnes requises...")
+# === Je définis les colonnes requises ===
 required_cols = [
     "duration_ms", "mouseClickCount", "scrollCount", "scrollDensity",
     "viewportChanges", "tabCount", "enterPressed", "deviceType_encoded",
@@ -21,100 +28,251 @@ required_cols = [
     "fieldOrderDeviation", "stdTimePerField", "maxPasteCount", "pasteRatio",
     "deleteRatio", "label_target"
 ]
-missing_cols = [col for col in required_cols if col not in df.columns]
-if missing_cols:
-    print("❌ Colonnes manquantes :", missing_cols)
-    raise ValueError(f"Colonnes manquantes dans le CSV : {missing_cols}")
-else:
-    print("✅ Toutes les colonnes sont présentes.")
-
-# === Je sépare les features et le label ===
-print("📊 Séparation des features et du label...")
-X = df[required_cols[:-1]]
-y = df["label_target"]
-
-# === Je fais le split train/test ===
-print("✂️ Découpage train/test...")
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# === J'entraîne le modèle XGBoost ===
-print("🧠 Entraînement du modèle XGBoost...")
-clf = XGBClassifier(
-    n_estimators=200,
-    max_depth=6,
-    learning_rate=0.1,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    random_state=42,
-    eval_metric='mlogloss'
-)
-clf.fit(X_train, y_train)
-print("✅ Modèle entraîné avec succès.")
-
-# === Je prédis sur le test set ===
-print("🔮 Prédiction sur le test set...")
-y_pred = clf.predict(X_test)
-
-# === J'évalue le modèle ===
-print("📈 Évaluation du modèle sur test set")
-cm = confusion_matrix(y_test, y_pred)
-print(cm)
-print(classification_report(y_test, y_pred))
-
-# === Je trace la matrice de confusion ===
-print("🧩 Affichage de la matrice de confusion...")
-disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=["Normal", "Fraude"])
-disp.plot(cmap="Blues")
-plt.show()
-
-# === Validation croisée manuelle avec analyse détaillée ===
-print("\n🔍 Validation croisée manuelle (5 folds) avec analyse détaillée...")
-skf = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-for i, (train_idx, test_idx) in enumerate(skf.split(X, y)):
-    print(f"\n📂 Fold {i+1}")
-    X_train_fold, X_test_fold = X.iloc[train_idx], X.iloc[test_idx]
-    y_train_fold, y_test_fold = y.iloc[train_idx], y.iloc[test_idx]
-
-    clf_fold = XGBClassifier(
-        n_estimators=200,
-        max_depth=6,
-        learning_rate=0.1,
-        subsample=0.8,
-        colsample_bytree=0.8,
+
+# === Mes hyperparamètres de référence (ceux du modèle historique) ===
+DEFAULT_PARAMS = {
+    "num_boost_round": 200,
+    "max_depth": 6,
+    "eta": 0.1,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "min_child_weight": 1,
+    "max_bin": 256,
+}
+
+# === Mon espace de recherche (tirage aléatoire, le premier essai reste la référence) ===
+SEARCH_SPACE = {
+    "num_boost_round": [100, 200, 400],
+    "max_depth": [3, 4, 6, 8],
+    "eta": [0.03, 0.05, 0.1, 0.2],
+    "subsample": [0.7, 0.8, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "min_child_weight": [1, 3, 5],
+    "max_bin": [256],
+}
+
+BASE_PARAMS = {"objective": "binary:logistic", "tree_method": "hist", "eval_metric": "logloss", "seed": 42}
+
+
+# === Données de chaque processus du pool : X, y, folds et DMatrix déjà construites ===
+_worker = {}
+
+
+def init_worker(X, y, folds):
+    _worker.update(X=X, y=y, folds=folds, cache={})
+
+
+def fold_matrices(fold, max_bin):
+    # Une QuantileDMatrix par (fold, max_bin) et par processus, réutilisée par tous les essais
+    key = (fold, max_bin)
+    if key not in _worker["cache"]:
+        X, y = _worker["X"], _worker["y"]
+        train_idx, test_idx = _worker["folds"][fold]
+        dtrain = xgb.QuantileDMatrix(X[train_idx], y[train_idx], max_bin=max_bin, feature_names=required_cols[:-1])
+        dtest = xgb.QuantileDMatrix(X[test_idx], y[test_idx], max_bin=max_bin, ref=dtrain,
+                                    feature_names=required_cols[:-1])
+        _worker["cache"][key] = (dtrain, dtest)
+    return _worker["cache"][key]
+
+
+def run_fold(task):
+    # Un essai sur un fold : renvoie les scores hors-fold
+    trial_id, fold, params, threads = task
+    dtrain, dtest = fold_matrices(fold, params["max_bin"])
+    train_params = {**BASE_PARAMS, "nthread": threads,
+                    **{k: v for k, v in params.items() if k not in ("num_boost_round", "max_bin")}}
+    booster = xgb.train(train_params, dtrain, num_boost_round=params["num_boost_round"])
+    return trial_id, fold, booster.predict(dtest)
+
+
+def sample_trials(n_trials, seed):
+    rng = random.Random(seed)
+    trials = [dict(DEFAULT_PARAMS)]
+    while len(trials) < n_trials:
+        candidate = {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+        if candidate not in trials:
+            trials.append(candidate)
+    return trials
+
+
+def split_cores(n_tasks, workers=None, threads=None):
+    # Cœurs répartis entre processus du pool et threads XGBoost de chaque processus
+    cores = os.cpu_count() or 1
+    workers = workers or max(1, min(n_tasks, cores // (threads or 1)))
+    threads = threads or max(1, cores // workers)
+    return workers, threads
+
+
+def cross_validate(X, y, trials, n_folds, workers, threads, seed=42):
+    # Tous les (essai, fold) en parallèle ; prédictions hors-fold assemblées par essai
+    folds = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed).split(X, y))
+    tasks = [(t, f, params, threads) for t, params in enumerate(trials) for f in range(n_folds)]
+    oof = np.zeros((len(trials), len(y)))
+    fold_of_row = np.empty(len(y), dtype=np.int64)
+    for f, (_, test_idx) in enumerate(folds):
+        fold_of_row[test_idx] = f
+
+    if workers == 1:
+        # Un seul processus : pas de pool, XGBoost prend tous les threads
+        init_worker(X, y, folds)
+        for trial_id, fold, scores in map(run_fold, tasks):
+            oof[trial_id, folds[fold][1]] = scores
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(X, y, folds)) as pool:
+            for trial_id, fold, scores in pool.map(run_fold, tasks):
+                oof[trial_id, folds[fold][1]] = scores
+    return oof, fold_of_row
+
+
+def trial_metrics(y, scores, fold_of_row):
+    return {
+        "logloss": float(log_loss(y, scores, labels=[0, 1])),
+        "auc": float(roc_auc_score(y, scores)) if len(np.unique(y)) > 1 else None,
+        "accuracy": float(accuracy_score(y, scores > 0.5)),
+        "fold_logloss": [
+            float(log_loss(y[fold_of_row == f], scores[fold_of_row == f], labels=[0, 1]))
+            for f in range(fold_of_row.max() + 1)
+        ],
+    }
+
+
+def load_dataset(source, start_date=None, end_date=None):
+    # source=store : feature store Parquet (build_training_dataset.py), seules les colonnes
+    # requises sont lues et start/end (YYYY-MM-DD, fin exclue) élaguent les partitions
+    if source == "store":
+        from feature_store import load_features
+        print("📥 Chargement du feature store Parquet...")
+        return load_features(columns=required_cols, start_date=start_date, end_date=end_date)
+    print("📥 Chargement du fichier CSV...")
+    return pd.read_csv("kyc_dataset_ready.csv")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement XGBoost : validation croisée parallèle + recherche d'hyperparamètres")
+    parser.add_argument("--source", choices=["csv", "store"], default=os.environ.get("KYC_TRAIN_SOURCE", "csv"))
+    parser.add_argument("--from", dest="start_date", default=os.environ.get("KYC_TRAIN_FROM"))
+    parser.add_argument("--to", dest="end_date", default=os.environ.get("KYC_TRAIN_TO"))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--trials", type=int, default=1, help="essais d'hyperparamètres (1 = référence seule)")
+    parser.add_argument("--workers", type=int, default=None, help="processus du pool (défaut : cœurs / threads)")
+    parser.add_argument("--threads", type=int, default=None, help="threads XGBoost par processus (défaut : cœurs / workers)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out-dir", default="cv_results", help="OOF, essais et figures")
+    args = parser.parse_args()
+
+    print("🚀 Démarrage du script d'entraînement XGBoost...")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    # === Je charge le dataset ===
+    df = load_dataset(args.source, args.start_date, args.end_date)
+    print(f"   {len(df)} sessions")
+
+    # === Je vérifie que toutes les colonnes requises sont présentes ===
+    print("🔍 Vérification des colonnes requises...")
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    if missing_cols:
+        print("❌ Colonnes manquantes :", missing_cols)
+        raise ValueError(f"Colonnes manquantes dans le CSV : {missing_cols}")
+    else:
+        print("✅ Toutes les colonnes sont présentes.")
+
+    # === Je sépare les features et le label (float32 : ce que XGBoost utilise en interne) ===
+    print("📊 Séparation des features et du label...")
+    X = df[required_cols[:-1]].to_numpy(dtype=np.float32)
+    y = df["label_target"].to_numpy(dtype=np.int64)
+
+    # === Validation croisée parallèle sur tous les essais ===
+    trials = sample_trials(args.trials, args.seed)
+    workers, threads = split_cores(len(trials) * args.folds, args.workers, args.threads)
+    print(f"\n🔍 Validation croisée : {len(trials)} essai(s) x {args.folds} folds, "
+          f"{workers} processus x {threads} thread(s) XGBoost")
+    started = time.perf_counter()
+    oof, fold_of_row = cross_validate(X, y, trials, args.folds, workers, threads, args.seed)
+    print(f"⏱️ Validation croisée terminée en {time.perf_counter() - started:.1f} s")
+
+    results = [{"trial": t, "params": params, **trial_metrics(y, oof[t], fold_of_row)} for t, params in enumerate(trials)]
+    best = min(results, key=lambda r: r["logloss"])
+    for r in sorted(results, key=lambda r: r["logloss"]):
+        auc = f"{r['auc']:.4f}" if r["auc"] is not None else "n/a"
+        print(f"   essai {r['trial']:>3} : logloss {r['logloss']:.5f} | AUC {auc} | accuracy {r['accuracy']:.4f} | {r['params']}")
+    print(f"🏆 Meilleur essai : {best['trial']} {best['params']}")
+
+    # === Je sauvegarde les prédictions hors-fold et le détail des essais ===
+    oof_df = pd.DataFrame({"row": np.arange(len(y)), "label_target": y, "fold": fold_of_row})
+    if "session_id" in df.columns:
+        oof_df.insert(1, "session_id", df["session_id"].to_numpy())
+    for t in range(len(trials)):
+        oof_df[f"trial_{t}"] = oof[t]
+    oof_df["oof_score"] = oof[best["trial"]]
+    oof_df.to_csv(os.path.join(args.out_dir, "oof_predictions.csv"), index=False)
+    with open(os.path.join(args.out_dir, "trials.json"), "w", encoding="utf-8") as f:
+        json.dump({"best_trial": best["trial"], "folds": args.folds, "trials": results}, f, indent=2)
+    print(f"💾 OOF et essais écrits dans {args.out_dir}/")
+
+    # === J'affiche l'analyse détaillée par fold du meilleur essai ===
+    best_pred = (oof[best["trial"]] > 0.5).astype(np.int64)
+    for i in range(args.folds):
+        in_fold = fold_of_row == i
+        y_test_fold, y_pred_fold = y[in_fold], best_pred[in_fold]
+        print(f"\n📂 Fold {i+1}")
+        print("Matrice de confusion :")
+        print(confusion_matrix(y_test_fold, y_pred_fold, labels=[0, 1]))
+        print("\nRapport de classification :")
+        print(classification_report(y_test_fold, y_pred_fold, zero_division=0))
+        print("Répartition réelle des classes dans ce fold :", pd.Series(y_test_fold).value_counts().to_dict())
+        # Sessions mal classées : matière pour la fiche d'audit métier
+        wrong = y_test_fold != y_pred_fold
+        print(f"Nombre de sessions mal classées : {int(wrong.sum())}")
+        if wrong.any():
+            print("Labels réels :", y_test_fold[wrong])
+            print("Prédictions :", y_pred_fold[wrong])
+
+    # === Je fais le split train/test et j'entraîne le modèle final avec les meilleurs paramètres ===
+    print("\n✂️ Découpage train/test...")
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[required_cols[:-1]], df["label_target"], test_size=0.2, random_state=42
+    )
+    print("🧠 Entraînement du modèle XGBoost...")
+    params = best["params"]
+    clf = XGBClassifier(
+        n_estimators=params["num_boost_round"],
+        max_depth=params["max_depth"],
+        learning_rate=params["eta"],
+        subsample=params["subsample"],
+        colsample_bytree=params["colsample_bytree"],
+        min_child_weight=params["min_child_weight"],
+        max_bin=params["max_bin"],
+        tree_method="hist",
+        # Un seul ajustement : tout le budget du pool de validation croisée (--workers x --threads)
+        n_jobs=workers * threads,
         random_state=42,
-        eval_metric='mlogloss'
+        eval_metric="logloss"
     )
-    clf_fold.fit(X_train_fold, y_train_fold)
-    y_pred_fold = clf_fold.predict(X_test_fold)
-
-    # === J'affiche les métriques ===
-    print("Matrice de confusion :")
-    print(confusion_matrix(y_test_fold, y_pred_fold))
-    print("\nRapport de classification :")
-    print(classification_report(y_test_fold, y_pred_fold))
-
-    # === Je regarde la répartition des profils dans le fold ===
-    print("Répartition réelle des classes dans ce fold :", y_test_fold.value_counts())
-
-    # === Je crée un tableau des sessions mal classées par profil ===
-    errors = X_test_fold[y_test_fold != y_pred_fold]
-    print(f"Nombre de sessions mal classées : {len(errors)}")
-    if len(errors) > 0:
-        print("Labels réels :", y_test_fold[y_test_fold != y_pred_fold].values)
-        print("Prédictions :", y_pred_fold[y_test_fold != y_pred_fold])
-
-    # === Je peux utiliser ces informations pour préparer ma fiche d'audit métier ===
-    # Justifier la robustesse de mon modèle
-    # Expliquer comment je détecte les fraudes stratégiques
-
-# === Je trace l'importance des features ===
-print("📊 Affichage de l'importance des features...")
-plot_importance(clf)
-plt.show()
-
-# === Je sauvegarde le modèle ===
-print("💾 Sauvegarde du modèle dans kyc_xgb_model.pkl...")
-joblib.dump(clf, "kyc_xgb_model.pkl")
-print("✅ Modèle sauvegardé avec succès.")
-
-print("🏁 Script terminé.")
+    clf.fit(X_train, y_train)
+    print("✅ Modèle entraîné avec succès.")
+
+    # === J'évalue le modèle sur le test set ===
+    print("📈 Évaluation du modèle sur test set")
+    y_pred = clf.predict(X_test)
+    cm = confusion_matrix(y_test, y_pred)
+    print(cm)
+    print(classification_report(y_test, y_pred))
+
+    # === J'enregistre la matrice de confusion et l'importance des features ===
+    ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=["Normal", "Fraude"]).plot(cmap="Blues")
+    plt.savefig(os.path.join(args.out_dir, "confusion_matrix.png"), bbox_inches="tight")
+    plt.close("all")
+    plot_importance(clf)
+    plt.savefig(os.path.join(args.out_dir, "feature_importance.png"), bbox_inches="tight")
+    plt.close("all")
+    print(f"🧩 Figures écrites dans {args.out_dir}/")
+
+    # === Je sauvegarde le modèle ===
+    print("💾 Sauvegarde du modèle dans kyc_xgb_model.pkl...")
+    joblib.dump(clf, "kyc_xgb_model.pkl")
+    print("✅ Modèle sauvegardé avec succès.")
+
+    # === Je publie une version datée dans models/ : app.py la charge à chaud ===
+    print(f"📦 Version publiée : {publish_model(clf.get_booster())}")
+
+    print("🏁 Script terminé.")